@@ -1,3 +1,7 @@
+import logging
+import threading
+from typing import Dict, Iterable, Optional
+
 from .agents.agent_interface import AgentInterface
 from .agents.functional_requirement_agent import FunctionalRequirementAgent
 from .agents.non_functional_requirement_agent import NonFunctionalRequirementAgent
@@ -9,12 +13,19 @@ from .agents.java_code_generation_agent import JavaCodeGenerationAgent
 from .agents.react_lld_agent import ReactLLDAgent
 from .agents.react_code_generation_agent import ReactCodeGenerationAgent
 from .agents.java_lld_html_generator_agent import JavaLLDHTMLGeneratorAgent
+from .agents.conversation_summary_agent import ConversationSummaryAgent
 from .types import AgentType
 
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
 
 class AgentFactory:
     """
     A factory for creating instances of agents based on the specified AgentType.
+
+    Agents hold no per-request state, so each type is built once per process and shared
+    between threads.
     """
 
     _agent_registry = {
@@ -28,20 +39,50 @@ class AgentFactory:
         AgentType.REACT_CODE_GENERATOR: ReactCodeGenerationAgent,
         AgentType.REACT_LLD: ReactLLDAgent,
         AgentType.JAVA_LLD_HTML_GENERATOR: JavaLLDHTMLGeneratorAgent,
+        AgentType.CONVERSATION_SUMMARY: ConversationSummaryAgent,
     }
 
+    _agents: Dict[AgentType, AgentInterface] = {}
+    _lock = threading.Lock()
+
     @staticmethod
     def create_agent(agent_type: AgentType) -> AgentInterface:
         """
-        Creates and returns an agent instance for the specified AgentType.
+        Returns the process-wide agent instance for the specified AgentType, creating it on
+        first use.
 
         :param agent_type: The type of the agent to create.
         :return: An instance of a class implementing AgentInterface.
         :raises NotImplementedError: If the requested agent type is not yet supported.
         """
+        agent = AgentFactory._agents.get(agent_type)
+        if agent is not None:
+            return agent
+
         agent_class = AgentFactory._agent_registry.get(agent_type)
         if agent_class is None:
             raise NotImplementedError(
                 f"Agent type '{agent_type}' is not implemented or is unregistered."
             )
-        return agent_class()
+        with AgentFactory._lock:
+            agent = AgentFactory._agents.get(agent_type)
+            if agent is None:
+                agent = agent_class()
+                AgentFactory._agents[agent_type] = agent
+        return agent
+
+    @staticmethod
+    def preload(agent_types: Optional[Iterable[AgentType]] = None) -> None:
+        """
+        Builds and warms up agents ahead of the first request: their LLM clients, token
+        encodings and system prompt token counts. Failures are logged; whatever was not
+        prepared is done on first use instead.
+
+        :param agent_types: The agents to preload; all registered agents by default.
+        """
+        for agent_type in agent_types or list(AgentFactory._agent_registry):
+            try:
+                AgentFactory.create_agent(agent_type).warm_up()
+            except Exception as exc:
+                logger.warning("Could not preload the %s agent: %s", agent_type.name, exc)
+        logger.info("Preloaded %d agents", len(AgentFactory._agents))
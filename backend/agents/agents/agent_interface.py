@@ -1,13 +1,79 @@
-from typing import List
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import inspect
 import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 
 from orchestratorV2.models import ChatMessage
 
-from ..types import AgentType, LLMResponse, LLMMessage
-from ..llm_wrapper import LLMWrapper
+from ..document_diff import diff_documents
+from ..types import AgentType, HistoryEntry, LLMHistory, LLMResponse, LLMMessage
+from ..model_router import create_llm
+from ..token_budget import get_context_budget, get_token_counter
+
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
+_DESIGN_KEYS = [
+    "functional requirements",
+    "non functional requirements",
+    "architecture",
+    "api contracts",
+    "database schema",
+]
+
+# The document elements each agent sees in its prompt.
+DOCUMENT_KEYS_BY_AGENT: Dict[AgentType, List[str]] = {
+    # Requirements specific
+    AgentType.FUNCTIONAL_REQUIREMENT: _DESIGN_KEYS,
+    AgentType.NON_FUNCTIONAL_REQUIREMENT: _DESIGN_KEYS,
+    # Architecture and Schema
+    AgentType.ARCHITECTURE: _DESIGN_KEYS,
+    AgentType.API_CONTRACT: _DESIGN_KEYS,
+    AgentType.DATABASE_SCHEMA: _DESIGN_KEYS,
+    # LLD specific
+    AgentType.JAVA_LLD: _DESIGN_KEYS + ["java LLD"],
+    AgentType.REACT_LLD: [
+        "functional requirements",
+        "architecture",
+        "api contracts",
+        "react LLD",
+    ],
+    # Code generators
+    AgentType.JAVA_CODE_GENERATOR: _DESIGN_KEYS + ["java LLD", "java code"],
+    AgentType.REACT_CODE_GENERATOR: [
+        "functional requirements",
+        "architecture",
+        "api contracts",
+        "react code",
+        "react LLD",
+    ],
+}
+
+# Introduces the summary of the older messages, when they have been summarized.
+SUMMARY_MESSAGE = "Summary of the earlier conversation:\n{summary}"
+
+# Appended to the system message in compact history mode.
+COMPACT_HISTORY_NOTE = """
+
+Only the latest user message has the full "document". Earlier user messages have
+"document changes" instead: a JSON Patch (RFC 6902) from the document of the previous user
+message to the document at that point in the conversation."""
+
+
+def get_history_mode() -> str:
+    """
+    Returns settings.LLM_HISTORY_MODE: "full" or "compact".
+    """
+    return getattr(settings, "LLM_HISTORY_MODE", "full")
 
 
 class AgentInterface:
+    # Whether the agent's prompt is built from the chat history (generate_llm_history).
+    uses_chat_history = True
+
     def __init__(
         self,
         agent_type: AgentType,
@@ -15,13 +81,37 @@ class AgentInterface:
         response_format: list[str],
         model: str = None,
     ) -> None:
-        self.system_message = system_message
+        # Prompts are written indented in the source; the indentation only costs tokens.
+        self.system_message = inspect.cleandoc(system_message)
         self.agent_type = agent_type
         self.response_format = response_format
-        if model:
-            self.llm = LLMWrapper(model)
-        else:
-            self.llm = LLMWrapper()
+        self.llm = create_llm(agent_type, model)
+        # The system message and its token count, per history mode.
+        self._system_prompts: Dict[str, Tuple[LLMMessage, int]] = {}
+
+    def warm_up(self) -> None:
+        """
+        Prepares everything a first request would: the LLM clients, the token encoding and
+        the system prompt's token count.
+        """
+        self.llm.warm_up()
+        self.system_prompt()
+
+    def system_prompt(self) -> Tuple[LLMMessage, int]:
+        """
+        Returns the system message for the current history mode and its token count, built
+        once per mode.
+        """
+        mode = get_history_mode()
+        prompt = self._system_prompts.get(mode)
+        if prompt is None:
+            content = self.system_message
+            if mode == "compact":
+                content += COMPACT_HISTORY_NOTE
+            message: LLMMessage = {"role": "user", "content": content}
+            prompt = (message, get_token_counter(self.llm.model).count_message(message))
+            self._system_prompts[mode] = prompt
+        return prompt
 
     def process(
         self,
@@ -29,28 +119,191 @@ class AgentInterface:
     ) -> LLMResponse:
         pass
 
+    async def aprocess(
+        self,
+        chat_history: List[ChatMessage],
+    ) -> LLMResponse:
+        """
+        Async variant of process. Building the history may hit the database, so it runs in a
+        worker thread; the LLM call itself is awaited on the event loop.
+
+        :param chat_history: A list of ChatMessage objects to process.
+        :return: The structured LLMResponse for this agent.
+        """
+        llm_messages = await sync_to_async(self.generate_llm_history)(
+            chat_history, self.agent_type
+        )
+        return await self.llm.aget_response(llm_messages, self.response_format)
+
+    def process_streaming(
+        self,
+        chat_history: List[ChatMessage],
+        on_token: Callable[[str], None],
+    ) -> LLMResponse:
+        """
+        Same as process, but the agent's communication text is passed to on_token while the
+        completion is still being generated.
+
+        :param chat_history: A list of ChatMessage objects to process.
+        :param on_token: Called with each chunk of the response message.
+        :return: The structured LLMResponse for this agent.
+        """
+        llm_messages = self.generate_llm_history(chat_history, self.agent_type)
+        return self.llm.get_response(
+            llm_messages, self.response_format, on_token=on_token
+        )
+
     def generate_llm_history(
         self, chat_history: List[ChatMessage], agent_type: AgentType = None
-    ) -> List[LLMMessage]:
+    ) -> LLMHistory:
         """
-        Converts the chat history into a list of messages suitable for the LLM.
+        Converts the chat history into a list of messages suitable for the LLM, within the
+        model's token budget (settings.LLM_CONTEXT_BUDGETS).
 
-        :param chat_history: The history of chat messages to transform.
-        :return: A list of LLMMessage dictionaries containing 'role' and 'content'.
+        The system message and the latest chat message (which carries the current document)
+        are always kept. Older messages are added newest-first until the next one would
+        exceed the budget; everything before it is dropped.
+
+        With settings.LLM_HISTORY_MODE set to "compact", only the latest message carries the
+        full document; earlier user messages carry the changes from the previous one. A
+        summary of older messages (ChatHistory.summary) follows the system message.
+
+        :param chat_history: The history of chat messages to transform. A ChatHistory with
+            a prefix holds only the messages after those converted in earlier turns.
+        :return: A list of LLMMessage dictionaries containing 'role' and 'content', with the
+            prompt's token count.
         """
-        llm_messages: List[LLMMessage] = []
+        budget = get_context_budget(self.llm.model)
+        counter = get_token_counter(self.llm.model)
+
+        compact = get_history_mode() == "compact"
 
         # Add the system message as the first message
-        llm_messages.append({"role": "user", "content": self.system_message})
+        system_message, token_count = self.system_prompt()
+        head = [dict(system_message)]
 
-        # Convert chat history
-        for chat in chat_history:
-            role = "user" if chat.is_user_message else "assistant"
-            message_content = self.get_message_content(chat, agent_type)
-            llm_messages.append({"role": role, "content": message_content})
+        # Older messages may have been replaced by a summary, which is always kept.
+        summary = getattr(chat_history, "summary", None)
+        if summary:
+            summary_message: LLMMessage = {
+                "role": "user",
+                "content": SUMMARY_MESSAGE.format(summary=summary),
+            }
+            token_count += counter.count_message(summary_message)
+            head.append(summary_message)
+
+        # Earlier messages may already have been converted in a previous turn.
+        chats = list(chat_history)
+        prefix = getattr(chat_history, "prefix", None)
+        entries, _ = self.build_history_entries(
+            chats[:-1],
+            agent_type,
+            getattr(chat_history, "previous_document", None),
+        )
+        if prefix is not None:
+            entries = list(prefix) + entries
+        if chats:
+            # The latest message always carries the full document.
+            role = "user" if chats[-1].is_user_message else "assistant"
+            content = self.get_message_content(chats[-1], agent_type)
+            entries.append(
+                HistoryEntry(
+                    role=role,
+                    content=content,
+                    tokens=counter.count_message({"role": role, "content": content}),
+                )
+            )
+
+        # Add chat history, newest first, only as far back as the budget allows
+        kept = []
+        for entry in reversed(entries):
+            message: LLMMessage = {"role": entry["role"], "content": entry["content"]}
+            tokens = entry["tokens"]
+            if kept and token_count + tokens > budget:
+                break
+            kept.append((message, tokens))
+            token_count += tokens
 
+        # Don't open the conversation with an assistant reply whose request was dropped.
+        while len(kept) > 1 and kept[-1][0]["role"] == "assistant":
+            token_count -= kept.pop()[1]
+
+        llm_messages = LLMHistory(head)
+        llm_messages.extend(message for message, _ in reversed(kept))
+        llm_messages.token_count = token_count
+        llm_messages.dropped_messages = len(entries) - len(kept)
+        if compact:
+            # The next turn replaces the latest message's full document with its changes,
+            # so only the system message and the summary are a stable prefix.
+            llm_messages.cache_breakpoints = tuple(range(len(head)))
+        else:
+            # The system message never changes, and the next turn only appends to this one.
+            llm_messages.cache_breakpoints = (
+                *range(len(head)),
+                len(llm_messages) - 1,
+            )
+
+        if llm_messages.dropped_messages:
+            logger.info(
+                "%s: dropped %d of %d messages to fit %d tokens (%s)",
+                self.agent_type.name,
+                llm_messages.dropped_messages,
+                len(entries),
+                budget,
+                self.llm.model,
+            )
+        logger.info(
+            "%s: prompt is %d tokens in %d messages",
+            self.agent_type.name,
+            token_count,
+            len(llm_messages),
+        )
         return llm_messages
 
+    def build_history_entries(
+        self,
+        chats: List[ChatMessage],
+        agent_type: AgentType,
+        previous_document: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[HistoryEntry], Optional[Dict[str, Any]]]:
+        """
+        Converts earlier chat messages (all but the latest) for the prompt.
+
+        In compact history mode each user message carries the changes to the document since
+        the previous user message (none for the first one); otherwise it carries the full
+        document. Agent messages are their raw responses.
+
+        :param chats: The messages to convert, oldest first.
+        :param agent_type: The type of agent processing the messages.
+        :param previous_document: The document of the user message before chats, if those
+            messages were converted earlier.
+        :return: The converted messages, and the document of the last user message so far.
+        """
+        counter = get_token_counter(self.llm.model)
+        compact = get_history_mode() == "compact"
+        entries = []
+        for chat in chats:
+            role = "user" if chat.is_user_message else "assistant"
+            if compact and chat.is_user_message:
+                document = self.get_document_elements(chat, agent_type)
+                message = {"user message": chat.message}
+                if previous_document is not None:
+                    message["document changes"] = diff_documents(
+                        previous_document, document
+                    )
+                content = json.dumps(message)
+                previous_document = document
+            else:
+                content = self.get_message_content(chat, agent_type)
+            entries.append(
+                HistoryEntry(
+                    role=role,
+                    content=content,
+                    tokens=counter.count_message({"role": role, "content": content}),
+                )
+            )
+        return entries, previous_document
+
     def get_message_content(self, chat: ChatMessage, agent_type: AgentType) -> str:
         """
         Builds the appropriate message content depending on whether the sender is a user or
@@ -60,103 +313,30 @@ class AgentInterface:
         :param agent_type: The type of agent processing the message.
         :return: A string containing the relevant content for the LLM.
         """
-        document_elements = {}
-        match agent_type:
-            # Requirements specific
-            case AgentType.FUNCTIONAL_REQUIREMENT:
-                keys = [
-                    "functional requirements",
-                    "non functional requirements",
-                    "architecture",
-                    "api contracts",
-                    "database schema",
-                ]
-            case AgentType.NON_FUNCTIONAL_REQUIREMENT:
-                keys = [
-                    "functional requirements",
-                    "non functional requirements",
-                    "architecture",
-                    "api contracts",
-                    "database schema",
-                ]
-            # Architecture and Schema
-            case AgentType.ARCHITECTURE:
-                keys = [
-                    "functional requirements",
-                    "non functional requirements",
-                    "architecture",
-                    "api contracts",
-                    "database schema",
-                ]
-            case AgentType.API_CONTRACT:
-                keys = [
-                    "functional requirements",
-                    "non functional requirements",
-                    "architecture",
-                    "api contracts",
-                    "database schema",
-                ]
-            case AgentType.DATABASE_SCHEMA:
-                keys = [
-                    "functional requirements",
-                    "non functional requirements",
-                    "architecture",
-                    "api contracts",
-                    "database schema",
-                ]
-            # LLD specific
-            case AgentType.JAVA_LLD:
-                keys = [
-                    "functional requirements",
-                    "non functional requirements",
-                    "architecture",
-                    "api contracts",
-                    "database schema",
-                    "java LLD",
-                ]
-            case AgentType.REACT_LLD:
-                keys = [
-                    "functional requirements",
-                    "architecture",
-                    "api contracts",
-                    "react LLD",
-                ]
-            # Code generators
-            case AgentType.JAVA_CODE_GENERATOR:
-                keys = [
-                    "functional requirements",
-                    "non functional requirements",
-                    "architecture",
-                    "api contracts",
-                    "database schema",
-                    "java LLD",
-                ]
-            case AgentType.REACT_CODE_GENERATOR:
-                keys = [
-                    "functional requirements",
-                    "architecture",
-                    "api contracts",
-                    "react code",
-                    "react LLD",
-                ]
-            # User or default case
-            case _:
-                raise NotImplementedError(
-                    f"Agent type '{agent_type}' is not supported for message content generation"
-                )
-
-        if chat.current_document.document_elements is not None:
-            document_elements = {
-                k: v
-                for k, v in chat.current_document.document_elements.items()
-                if k in keys
-            }
-
         if chat.is_user_message:
             message = {
                 "user message": chat.message,
-                "document": document_elements,
+                "document": self.get_document_elements(chat, agent_type),
             }
             return json.dumps(message)
 
         return chat.llm_raw_response
+
+    def get_document_elements(self, chat: ChatMessage, agent_type: AgentType) -> dict:
+        """
+        Returns the elements of the message's document that the agent reads.
+
+        :param chat: The ChatMessage whose document to read.
+        :param agent_type: The type of agent processing the message.
+        :return: The document elements, by name.
+        """
+        keys = DOCUMENT_KEYS_BY_AGENT.get(agent_type)
+        if keys is None:
+            raise NotImplementedError(
+                f"Agent type '{agent_type}' is not supported for message content generation"
+            )
+
+        document_elements = chat.current_document.document_elements
+        if document_elements is None:
+            return {}
+        return {k: v for k, v in document_elements.items() if k in keys}
@@ -0,0 +1,88 @@
+import json
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+from agents.types import AgentType, LLMResponse
+
+from .simple_agent_interface import SimpleAgentInterface
+
+DEFAULT_SUMMARY = {
+    "ENABLED": False,
+    # A cheap model is enough to condense the conversation.
+    "MODEL": "openai:gpt-4o-mini-2024-07-18",
+    # Summarize once this many messages are not covered by the summary yet...
+    "THRESHOLD_MESSAGES": 40,
+    # ...keeping this many of the most recent ones verbatim.
+    "KEEP_RECENT": 20,
+    "MAX_WORKERS": 2,
+}
+
+
+def summary_config() -> Dict[str, Any]:
+    config = dict(DEFAULT_SUMMARY)
+    config.update(getattr(settings, "LLM_SUMMARY", {}))
+    return config
+
+
+class ConversationSummaryAgent(SimpleAgentInterface):
+    """
+    An agent responsible for condensing the older turns of a long design conversation into
+    a summary that replaces them in other agents' prompts.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes the summary agent with a system message and a specified response format.
+        """
+        system_message = """
+            You are a Conversation Summary Agent in a system design pipeline. Users talk to
+            several design agents (requirements, architecture, API contracts, database schema,
+            low-level design and code generation) to build one design document.
+
+            You will receive the current summary of the conversation (possibly empty) and the
+            messages that followed it, in the following JSON format:
+            {
+                "summary": "The current summary",
+                "messages": [
+                    {"from": "user" | "agent", "message": "..."},
+                    ...
+                ]
+            }
+
+            Return an updated summary that replaces both. Keep:
+                1. Every decision, requirement, constraint and preference the user stated
+                2. Open questions the agents asked and how the user answered them
+                3. Requests that were rejected or reverted, so they are not proposed again
+            Leave out the document content itself; agents always receive the latest document.
+
+            For each interaction, you must provide a response in the following JSON format:
+            {
+                "summary": "The updated summary"
+            }
+        """
+
+        # The keys we expect in the model's JSON response
+        response_format = {
+            "response_message": "summary",
+        }
+        super().__init__(
+            AgentType.CONVERSATION_SUMMARY,
+            system_message,
+            response_format,
+            summary_config()["MODEL"],
+        )
+
+    def process(
+        self, messages: List[Dict[str, str]], summary: Optional[str] = None
+    ) -> LLMResponse:
+        """
+        Summarizes messages, folding them into an earlier summary.
+
+        :param messages: The messages to summarize, oldest first, as {"from", "message"}.
+        :param summary: The summary of the messages before them, if any.
+        :return: An LLMResponse whose response_message is the updated summary.
+        """
+        message = json.dumps({"summary": summary or "", "messages": messages})
+        llm_messages = self.generate_llm_history(message)
+        return self.llm.get_response(llm_messages, self.response_format)
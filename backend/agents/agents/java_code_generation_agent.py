@@ -1,21 +1,40 @@
-from typing import List
+from typing import Callable, List, Optional, Tuple
+import asyncio
+import hashlib
 import json
+import logging
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import as_completed
 
+from asgiref.sync import sync_to_async
+
+from agents.batch import LLMBatch
+from agents.code_context import LLDIndex, get_code_context_mode, slice_context
+from agents.java_lld import file_path, iter_classes
+from agents.scheduler import get_scheduler
 from agents.types import LLMResponse
 from orchestratorV2.models import ChatMessage
 from .java_file_code_generation_agent import JavaFileCodeGenerationAgent
 from .agent_interface import AgentInterface
 import shutil
 
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
+# A file to generate: its path, fingerprint and the context message it is generated from.
+FileJob = Tuple[str, str, str]
+
 
 class JavaCodeGenerationAgent(AgentInterface):
     """
     An agent responsible for generating java code based on the system design document.
     Takes the complete design document as input and generates actual java code files.
+    Classes whose LLD and context are unchanged since the previous version keep their code.
     """
 
+    # Only the latest message's document is used.
+    uses_chat_history = False
+
     def __init__(self) -> None:
         self.folder_path = os.path.join(
             os.path.dirname(__file__), "../../../generated_code/java_backend"
@@ -23,7 +42,14 @@ class JavaCodeGenerationAgent(AgentInterface):
         self.template_path = os.path.join(
             os.path.dirname(__file__), "../../../artifacts/java_code_template"
         )
-        self.max_threads = 3  # Set the maximum number of threads
+        # Shared by every file; it keeps no per-call state.
+        self.file_generator = JavaFileCodeGenerationAgent()
+
+    def warm_up(self) -> None:
+        """
+        Prepares the file generator's LLM clients.
+        """
+        self.file_generator.warm_up()
 
     def process(self, chat_history: List[ChatMessage]) -> LLMResponse:
         """
@@ -34,61 +60,276 @@ class JavaCodeGenerationAgent(AgentInterface):
         :return: An LLMResponse containing the generated code files, communication, dependencies,
                 and a boolean indicating whether to move to the next workflow.
         """
-        # TODO: check for existence of java LLD
+        return self.process_streaming(chat_history, on_token=None)
+
+    def process_streaming(
+        self,
+        chat_history: List[ChatMessage],
+        on_token: Callable[[str], None],
+    ) -> LLMResponse:
+        """
+        Same as process, but each file's communication is passed to on_token as soon as that
+        file has been generated.
+        """
         latest_document_elements = chat_history[-1].current_document.document_elements
-        java_lld = latest_document_elements["java LLD"]
+        jobs, reused = self.plan_files(latest_document_elements)
 
-        # Extract file locations from LLD
-        file_locations = self.extract_file_locations(java_lld)
-        print(file_locations)
-        # file_locations = file_locations[:3]
+        # Generate code for each new or changed file in parallel
+        results = []
 
-        # Generate code for each file in parallel
-        generated_files = []
-        communications = []
+        def generate_code(job):
+            file_location, fingerprint, context_message = job
+            # Generate code for this file
+            response = self.file_generator.process(
+                self.build_file_message(file_location), context_message
+            )
+            return self.build_file_result(file_location, fingerprint, response)
 
-        def generate_code(file_location):
-            # Create a new instance of JavaFileCodeGenerationAgent for each thread
-            file_generator = JavaFileCodeGenerationAgent()
+        # The files run within the file generator's model budget, shared with every other
+        # generation in the process.
+        request = get_scheduler().request(self.file_generator.llm.model, len(jobs))
+        futures = [request.submit(generate_code, job) for job in jobs]
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                if result["response_message"] and on_token is not None:
+                    on_token(result["response_message"] + "\n")
+        finally:
+            # On failure, the files that haven't started aren't generated.
+            request.cancel()
 
-            # Prepare message for file generator with file location and LLD
-            message = {"document": latest_document_elements, "file name": file_location}
+        return self.finish(latest_document_elements, results, reused)
 
-            # Generate code for this file
-            response = file_generator.process(json.dumps(message))
-
-            # Collect results
-            result = {
-                "path": file_location,
-                "content": response["updated_doc_element"],
-                "response_message": (
-                    f"For {file_location}: {response['response_message']}"
-                    if response["response_message"]
-                    else ""
-                ),
-            }
+    async def aprocess(self, chat_history: List[ChatMessage]) -> LLMResponse:
+        """
+        Async variant of process. File generations run concurrently on the event loop, as the
+        generation scheduler grants them slots.
 
-            return result
+        :param chat_history: A list of ChatMessage objects to process.
+        :return: An LLMResponse containing the generated code files.
+        """
+        latest_document_elements = await sync_to_async(
+            lambda: chat_history[-1].current_document.document_elements
+        )()
+        jobs, reused = await asyncio.to_thread(self.plan_files, latest_document_elements)
+        request = get_scheduler().request(self.file_generator.llm.model, len(jobs))
 
-        with ThreadPoolExecutor(max_workers=self.max_threads) as executor:
-            futures = {
-                executor.submit(generate_code, file_location): file_location
-                for file_location in file_locations
-            }
-            for future in as_completed(futures):
-                result = future.result()
-                generated_files.append(
-                    {"path": result["path"], "content": result["content"]}
+        async def generate_code(job):
+            file_location, fingerprint, context_message = job
+            response = await request.run_async(
+                lambda: self.file_generator.aprocess(
+                    self.build_file_message(file_location), context_message
                 )
-                if result["response_message"]:
-                    communications.append(result["response_message"])
+            )
+            return self.build_file_result(file_location, fingerprint, response)
+
+        try:
+            results = await asyncio.gather(*(generate_code(job) for job in jobs))
+        finally:
+            request.cancel()
+        return await asyncio.to_thread(
+            self.finish, latest_document_elements, results, reused
+        )
 
-        # Return combined results
+    def process_batch(
+        self, chat_history: List[ChatMessage], batch: LLMBatch = None
+    ) -> LLMResponse:
+        """
+        Same as process, but every file is generated through one provider batch job instead
+        of one call per file. Much slower to finish, but cheaper and outside the per-minute
+        rate limits, so it suits large offline regenerations.
+
+        :param chat_history: A list of ChatMessage objects to process.
+        :param batch: The batch to run the requests in; defaults to one using the backend
+            configured in settings.LLM_BATCH.
+        :return: An LLMResponse containing the generated code files.
+        """
+        latest_document_elements = chat_history[-1].current_document.document_elements
+        jobs, reused = self.plan_files(latest_document_elements)
+
+        if batch is None:
+            batch = LLMBatch()
+        futures = {
+            job: self.file_generator.submit_batch(
+                self.build_file_message(job[0]), batch, job[2]
+            )
+            for job in jobs
+        }
+        if futures:
+            batch.run()
+
+        results = [
+            self.build_file_result(file_location, fingerprint, future.result())
+            for (file_location, fingerprint, _), future in futures.items()
+        ]
+        return self.finish(latest_document_elements, results, reused)
+
+    def plan_files(self, document_elements: dict) -> Tuple[List[FileJob], List[dict]]:
+        """
+        Decides which files of the LLD need generating and what each is generated from.
+
+        In "sliced" context mode (settings.LLM_CODE_CONTEXT_MODE) each file is sent only its
+        own context (code_context.slice_context) instead of the whole document. Each class
+        is fingerprinted with everything its code is generated from (see file_context). A
+        file of the previously generated code whose fingerprint still matches is reused as
+        is; every other class is generated.
+
+        :param document_elements: The latest document, with its "java code" if any.
+        :return: The files to generate, and the previously generated files to reuse.
+        """
+        index = LLDIndex(document_elements["java LLD"])
+        sliced = get_code_context_mode() == "sliced"
+        document_message = (
+            None if sliced else self.build_document_message(document_elements)
+        )
+        # Every file is sent the same document, so it is hashed once.
+        document_digest = (
+            None
+            if document_message is None
+            else hashlib.sha256(document_message.encode("utf-8")).hexdigest()
+        )
+        previous = {
+            generated.get("path"): generated
+            for generated in document_elements.get("java code") or []
+            if isinstance(generated, dict)
+        }
+
+        jobs: List[FileJob] = []
+        reused: List[dict] = []
+        for section, item in index.entries:
+            path = file_path(item)
+            if not path:
+                continue
+            context = self.file_context(
+                section, item, index, document_elements, document_digest
+            )
+            fingerprint = self.class_fingerprint(context)
+            generated = previous.get(path)
+            if (
+                generated is not None
+                and generated.get("fingerprint") == fingerprint
+                and generated.get("content")
+            ):
+                reused.append(generated)
+            else:
+                jobs.append(
+                    (path, fingerprint, document_message or json.dumps(context))
+                )
+        logger.info(
+            "Java code: %d files to generate, %d unchanged", len(jobs), len(reused)
+        )
+        return jobs, reused
+
+    def file_context(
+        self,
+        section: str,
+        item: dict,
+        index: LLDIndex,
+        document_elements: dict,
+        document_digest: Optional[str],
+    ) -> dict:
+        """
+        Returns what a class's file is generated from. Sliced, it is exactly the context the
+        file is sent. With the full document (document_digest set), it is the file's name
+        and the digest of the document message every file is sent, so any change to the
+        document regenerates every file.
+        """
+        if document_digest is None:
+            return {"file context": slice_context(section, item, index, document_elements)}
+        return {"file name": file_path(item), "document": document_digest}
+
+    def class_fingerprint(self, context: dict) -> str:
+        """
+        Hashes a file's context together with the file generator's model and prompt.
+        """
+        canonical = json.dumps(
+            {
+                "context": context,
+                "model": self.file_generator.llm.model,
+                "prompt": self.file_generator.system_message,
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str,
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def finish(
+        self, document_elements: dict, results: List[dict], reused: List[dict]
+    ) -> LLMResponse:
+        """
+        Merges the generated and reused files in LLD order, writes the code base and builds
+        the response.
+        """
+        by_path = {generated["path"]: generated for generated in reused}
+        for result in results:
+            by_path[result["path"]] = {
+                "path": result["path"],
+                "content": result["content"],
+                "fingerprint": result["fingerprint"],
+            }
+        generated_files = [
+            by_path[path]
+            for path in (
+                file_path(item) for _, item in iter_classes(document_elements["java LLD"])
+            )
+            if path in by_path
+        ]
+        communications = [
+            result["response_message"] for result in results if result["response_message"]
+        ]
+        if reused:
+            communications.append(
+                f"Reused {len(reused)} unchanged files from the previous version."
+            )
+
+        self.generate_code_base(generated_files)
+        return self.build_response(generated_files, communications)
+
+    def build_document_message(self, document_elements: dict) -> str:
+        """
+        Builds the design document message shared by every file generation in "full" context
+        mode. It is serialized once, so all files send a byte-identical prefix that the
+        provider can cache.
+        """
+        # The previously generated code is only used to skip unchanged files.
+        document = {
+            key: value for key, value in document_elements.items() if key != "java code"
+        }
+        return json.dumps({"document": document})
+
+    def build_file_message(self, file_location: str) -> str:
+        """
+        Builds the JavaFileCodeGenerationAgent input for a single file.
+        """
+        return json.dumps({"file name": file_location})
+
+    def build_file_result(
+        self, file_location: str, fingerprint: str, response: LLMResponse
+    ) -> dict:
+        """
+        Collects a single file generation result.
+        """
+        return {
+            "path": file_location,
+            "content": response["updated_doc_element"],
+            "fingerprint": fingerprint,
+            "response_message": (
+                f"For {file_location}: {response['response_message']}"
+                if response["response_message"]
+                else ""
+            ),
+        }
+
+    def build_response(self, generated_files: list, communications: list) -> LLMResponse:
+        """
+        Combines the per-file results into a single LLMResponse.
+        """
         resp = LLMResponse()
         resp["raw_response"] = ""
         resp["updated_doc_element"] = generated_files
         resp["response_message"] = "\n".join(communications)
-        self.generate_code_base(generated_files)
         return resp
 
     def extract_file_locations(self, java_lld: dict) -> List[str]:
@@ -99,28 +340,10 @@ class JavaCodeGenerationAgent(AgentInterface):
         :return: A list of file paths for each class/interface in the LLD.
         """
         file_locations = []
-
-        # Helper function to construct file path
-        def construct_file_path(package: str, class_name: str) -> str:
-            return f"{package.replace('.', '/')}/{class_name}.java"
-
-        # Iterate over each section in the LLD
-        sections = [
-            "controllers",
-            "dtos",
-            "services",
-            "repositories",
-            "entities",
-            "enums",
-            "configurations",
-        ]
-        for section in sections:
-            section_data = java_lld.get(section, [])
-            for item in section_data:
-                package = item.get("package")
-                class_name = item.get("name")
-                if package and class_name:
-                    file_locations.append(construct_file_path(package, class_name))
+        for _, item in iter_classes(java_lld):
+            path = file_path(item)
+            if path:
+                file_locations.append(path)
 
         return file_locations
 
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Optional
 
 from agents.types import AgentType, LLMResponse
 from orchestratorV2.models import ChatMessage
@@ -25,8 +25,18 @@ class JavaFileCodeGenerationAgent(SimpleAgentInterface):
             5. Include appropriate comments and documentation
             6. Create extra methods if necessary to keep the code clean and modular
 
-            You will receive a user message and the current state of the complete design document in the following JSON format.
-            Focus mainly on java LLD to generate the java file code.
+            You will first receive the context of the file in the following JSON format:
+            {
+                "file context": {
+                    "section": "The java LLD section of the class (controllers, dtos, services, ...)",
+                    "class": {The java LLD specification of the class to implement},
+                    "referenced classes": [{The signatures of the other classes it uses}, ...],
+                    "api contracts": {The API paths and definitions it serves or appears in, if any},
+                    "database schema": {"tables": [The tables it maps or manages, if any]},
+                }
+            }
+            or the current state of the complete design document in the following JSON format,
+            in which case focus mainly on java LLD to generate the java file code:
             {
                 "document": {
                     "functional requirements": [...],
@@ -35,7 +45,13 @@ class JavaFileCodeGenerationAgent(SimpleAgentInterface):
                     "api contracts": [...],
                     "database schema": [...],
                     "java LLD": [...],
-                },
+                }
+            }
+            Only rely on the classes, fields and methods given; the referenced classes are
+            generated separately with exactly those signatures.
+
+            It is followed by a message naming the file to generate, in the following JSON format:
+            {
                 "file name": "Name of the file to be generated",
             }
 
@@ -58,6 +74,6 @@ class JavaFileCodeGenerationAgent(SimpleAgentInterface):
             model="openai:gpt-4o-2024-08-06",
         )
 
-    def process(self, message: str) -> LLMResponse:
-        llm_messages = self.generate_llm_history(message)
+    def process(self, message: str, context: Optional[str] = None) -> LLMResponse:
+        llm_messages = self.generate_llm_history(message, context)
         return self.llm.get_response(llm_messages, self.response_format)
@@ -1,12 +1,17 @@
 import json
-from typing import List
+import logging
+from typing import Callable, List, Optional
 
+from agents.plantuml import PlantUMLCompileError, lld_to_plantuml, plantuml_config
 from agents.types import AgentType, LLMResponse
 from orchestratorV2.models import ChatMessage
 
 from .agent_interface import AgentInterface
 from .java_lld_html_generator_agent import JavaLLDHTMLGeneratorAgent
 
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
 
 class JavaLLDAgent(AgentInterface):
     """
@@ -219,6 +224,11 @@ class JavaLLDAgent(AgentInterface):
             "response_message": "communication",
         }
         super().__init__(AgentType.JAVA_LLD, system_message, response_format)
+        self.html_generator = JavaLLDHTMLGeneratorAgent()
+
+    def warm_up(self) -> None:
+        super().warm_up()
+        self.html_generator.warm_up()
 
     def process(self, chat_history: List[ChatMessage]) -> LLMResponse:
         """
@@ -229,13 +239,61 @@ class JavaLLDAgent(AgentInterface):
         :return: An LLMResponse containing the class designs, communication, dependencies,
                 and a boolean indicating whether to move to the next workflow.
         """
-        llm_messages = self.generate_llm_history(chat_history, AgentType.JAVA_LLD)
-        llm_response = self.llm.get_response(llm_messages, self.response_format)
+        return self.process_streaming(chat_history, on_token=None)
 
-        java_lld_html_generator = JavaLLDHTMLGeneratorAgent()
+    def process_streaming(
+        self,
+        chat_history: List[ChatMessage],
+        on_token: Callable[[str], None],
+    ) -> LLMResponse:
+        """
+        Same as process; only the LLD completion is streamed, the PlantUML conversion is not.
+        """
+        llm_messages = self.generate_llm_history(chat_history, AgentType.JAVA_LLD)
+        llm_response = self.llm.get_response(
+            llm_messages, self.response_format, on_token=on_token
+        )
+        java_lld = llm_response.get("updated_doc_element")
+        if java_lld is not None:
+            uml = self.compile_plantuml(java_lld)
+            if uml is None:
+                uml = self.html_generator.process(json.dumps(java_lld))["response_message"]
+            llm_response["html"] = uml
+        return llm_response
 
-        uml = java_lld_html_generator.process(
-            json.dumps(llm_response["updated_doc_element"])
-        )["response_message"]
-        llm_response["updated_doc_element"] = uml
+    async def aprocess(self, chat_history: List[ChatMessage]) -> LLMResponse:
+        """
+        Async variant of process.
+        """
+        llm_response = await super().aprocess(chat_history)
+        java_lld = llm_response.get("updated_doc_element")
+        if java_lld is not None:
+            uml = self.compile_plantuml(java_lld)
+            if uml is None:
+                uml = (await self.html_generator.aprocess(json.dumps(java_lld)))[
+                    "response_message"
+                ]
+            llm_response["html"] = uml
         return llm_response
+
+    def compile_plantuml(self, java_lld: dict) -> Optional[str]:
+        """
+        Compiles the class diagram for an LLD locally (settings.PLANTUML).
+
+        The structured LLD stays the document element, so the code generator and later turns
+        keep reading classes rather than diagram source; the diagram goes to the document's
+        html version of the element.
+
+        :return: The diagram, or None if it should be written by the LLM instead.
+        :raises PlantUMLCompileError: If the LLD can't be compiled and the LLM fallback is off.
+        """
+        config = plantuml_config()
+        if config["COMPILER"] != "local":
+            return None
+        try:
+            return lld_to_plantuml(java_lld)
+        except PlantUMLCompileError as exc:
+            if not config["LLM_FALLBACK"]:
+                raise
+            logger.warning("Compiling the java LLD failed, using the LLM: %s", exc)
+            return None
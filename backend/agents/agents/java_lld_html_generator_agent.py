@@ -1,4 +1,3 @@
-from plantweb.render import render
 from agents.types import AgentType, LLMResponse
 
 from .simple_agent_interface import SimpleAgentInterface
@@ -44,3 +43,8 @@ class JavaLLDHTMLGeneratorAgent(SimpleAgentInterface):
         llm_messages = self.generate_llm_history(message)
         plantuml = self.llm.get_response(llm_messages, self.response_format)["plantuml"]
         return {"response_message": plantuml}
+
+    async def aprocess(self, message: str) -> LLMResponse:
+        llm_messages = self.generate_llm_history(message)
+        response = await self.llm.aget_response(llm_messages, self.response_format)
+        return {"response_message": response["plantuml"]}
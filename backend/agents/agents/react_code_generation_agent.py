@@ -1,5 +1,6 @@
-from typing import List
+from typing import Callable, List
 
+from agents.scheduler import get_scheduler
 from agents.types import AgentType, LLMResponse
 from orchestratorV2.models import ChatMessage
 
@@ -10,6 +11,8 @@ class ReactCodeGenerationAgent(AgentInterface):
     """
     An agent responsible for generating react code based on the system design document.
     Takes the complete design document as input and generates actual react code files.
+    The code is generated in one call, run through the generation scheduler so it shares the
+    model's budget with the other code generations.
     """
 
     def __init__(self) -> None:
@@ -111,6 +114,33 @@ class ReactCodeGenerationAgent(AgentInterface):
         :return: An LLMResponse containing the generated code files, communication, dependencies,
                 and a boolean indicating whether to move to the next workflow.
         """
+        request = get_scheduler().request(self.llm.model, 1)
+        return request.submit(self._generate, chat_history).result()
+
+    def process_streaming(
+        self,
+        chat_history: List[ChatMessage],
+        on_token: Callable[[str], None],
+    ) -> LLMResponse:
+        """
+        Same as process, but the communication text is passed to on_token while the code is
+        still being generated.
+        """
+        request = get_scheduler().request(self.llm.model, 1)
+        return request.submit(
+            AgentInterface.process_streaming, self, chat_history, on_token
+        ).result()
+
+    async def aprocess(self, chat_history: List[ChatMessage]) -> LLMResponse:
+        """
+        Async variant of process; the call is awaited once the scheduler grants it a slot.
+        """
+        request = get_scheduler().request(self.llm.model, 1)
+        return await request.run_async(
+            lambda: AgentInterface.aprocess(self, chat_history)
+        )
+
+    def _generate(self, chat_history: List[ChatMessage]) -> LLMResponse:
         llm_messages = self.generate_llm_history(
             chat_history, agent_type=AgentType.REACT_CODE_GENERATOR
         )
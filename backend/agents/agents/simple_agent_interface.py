@@ -1,7 +1,10 @@
-from typing import List
+import inspect
+from concurrent.futures import Future
+from typing import Optional
 
-from ..types import AgentType, LLMResponse, LLMMessage
-from ..llm_wrapper import LLMWrapper
+from ..batch import LLMBatch
+from ..types import AgentType, LLMHistory, LLMResponse, LLMMessage
+from ..model_router import create_llm
 
 
 class SimpleAgentInterface:
@@ -12,31 +15,75 @@ class SimpleAgentInterface:
         response_format: list[str],
         model: str = None,
     ) -> None:
-        self.system_message = system_message
+        # Prompts are written indented in the source; the indentation only costs tokens.
+        self.system_message = inspect.cleandoc(system_message)
         self.agent_type = agent_type
         self.response_format = response_format
-        if model:
-            self.llm = LLMWrapper(model)
-        else:
-            self.llm = LLMWrapper()
+        self.llm = create_llm(agent_type, model)
+
+    def warm_up(self) -> None:
+        """
+        Prepares the LLM clients a first request would need.
+        """
+        self.llm.warm_up()
 
     def process(
         self,
         message: str,
+        context: Optional[str] = None,
     ) -> LLMResponse:
         pass
 
-    def generate_llm_history(self, message: str) -> List[LLMMessage]:
+    async def aprocess(
+        self,
+        message: str,
+        context: Optional[str] = None,
+    ) -> LLMResponse:
+        """
+        Async variant of process.
+
+        :param message: The message to process.
+        :param context: Input shared by many requests, sent ahead of the message.
+        :return: The structured LLMResponse for this agent.
+        """
+        llm_messages = self.generate_llm_history(message, context)
+        return await self.llm.aget_response(llm_messages, self.response_format)
+
+    def submit_batch(
+        self,
+        message: str,
+        batch: LLMBatch,
+        context: Optional[str] = None,
+    ) -> "Future[LLMResponse]":
+        """
+        Batch variant of process: queues the request on a batch job.
+
+        :param message: The message to process.
+        :param batch: The LLMBatch collecting the requests.
+        :param context: Input shared by many requests, sent ahead of the message.
+        :return: A future for the structured LLMResponse, resolved when the batch has run.
+        """
+        llm_messages = self.generate_llm_history(message, context)
+        return self.llm.get_batch_response(llm_messages, self.response_format, batch)
+
+    def generate_llm_history(
+        self, message: str, context: Optional[str] = None
+    ) -> LLMHistory:
         """
         Converts the message into a list of messages suitable for the LLM.
 
+        The system message and the shared context come first, so requests that differ only
+        in their message share a byte-identical prefix the provider can cache.
+
         :param message: The message to transform.
+        :param context: Input shared by many requests, e.g. the design document.
         :return: A list of LLMMessage dictionaries containing 'role' and 'content'.
         """
-        llm_messages: List[LLMMessage] = []
-
         # Add the system message as the first message
-        llm_messages.append({"role": "user", "content": self.system_message})
+        llm_messages = LLMHistory([{"role": "user", "content": self.system_message}])
+        if context is not None:
+            llm_messages.append(LLMMessage(role="user", content=context))
+        llm_messages.cache_breakpoints = tuple(range(len(llm_messages)))
         llm_messages.append(LLMMessage(role="user", content=message))
 
         return llm_messages
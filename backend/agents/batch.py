@@ -0,0 +1,470 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from openai.types.chat import ChatCompletion
+
+from .fake_llm import get_fake_llm
+from .llm_clients import get_openai_client
+from .prompt_cache import openai_usage
+from .types import LLMResponse, LLMUsage
+
+if TYPE_CHECKING:
+    from .llm_wrapper import LLMWrapper
+
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH = {
+    # "openai" submits to the OpenAI Batch API; "local" uses the file-backed emulator.
+    "BACKEND": "openai",
+    "POLL_INTERVAL": 30.0,
+    # Give up on a batch that has not finished after this many seconds.
+    "MAX_WAIT": 86_400.0,
+    "COMPLETION_WINDOW": "24h",
+    "LOCAL_DIR": "llm_batches",
+    "LOCAL_CONCURRENCY": 4,
+}
+
+# Statuses after which a batch will not change any more.
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# The OpenAI Batch API accepts at most this many requests per input file.
+MAX_BATCH_REQUESTS = 50_000
+
+_CHAT_COMPLETIONS_URL = "/v1/chat/completions"
+
+
+def _batch_config() -> Dict[str, Any]:
+    config = dict(DEFAULT_BATCH)
+    config.update(getattr(settings, "LLM_BATCH", {}))
+    return config
+
+
+class BatchBackend:
+    """
+    A place batch jobs run. Requests and results use the OpenAI Batch API line format, so
+    both backends are interchangeable:
+
+        request: {"custom_id": ..., "method": "POST", "url": ..., "body": {...}}
+        result:  {"custom_id": ..., "response": {"status_code": ..., "body": {...}},
+                  "error": ...}
+    """
+
+    def supports(self, model: str) -> bool:
+        """
+        Returns True if requests for this provider-qualified model can be batched here.
+        """
+        raise NotImplementedError
+
+    def submit(self, model: str, requests: List[Dict[str, Any]]) -> str:
+        """
+        Starts a batch job for requests that all use the same model.
+
+        :return: The batch id.
+        """
+        raise NotImplementedError
+
+    def status(self, batch_id: str) -> str:
+        raise NotImplementedError
+
+    def results(self, batch_id: str) -> List[Dict[str, Any]]:
+        """
+        Returns the result lines of a finished batch, failed requests included.
+        """
+        raise NotImplementedError
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """
+    Runs batch jobs through the OpenAI Batch API. Jobs are billed at a discount, count
+    against a separate batch queue rather than the per-minute limits, and finish within the
+    completion window.
+    """
+
+    def __init__(self, completion_window: str = "24h") -> None:
+        self.completion_window = completion_window
+        # Uploads and polls are cheap to repeat, so let the SDK retry them.
+        self.client = get_openai_client().with_options(max_retries=3)
+
+    def supports(self, model: str) -> bool:
+        return model.startswith("openai:")
+
+    def submit(self, model: str, requests: List[Dict[str, Any]]) -> str:
+        payload = "\n".join(json.dumps(request) for request in requests).encode("utf-8")
+        input_file = self.client.files.create(
+            file=("batch.jsonl", payload), purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=_CHAT_COMPLETIONS_URL,
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id: str) -> List[Dict[str, Any]]:
+        batch = self.client.batches.retrieve(batch_id)
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                content = self.client.files.content(file_id).text
+                lines.extend(json.loads(line) for line in content.splitlines() if line)
+        return lines
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    A file-backed stand-in for a provider batch API, for development and offline runs.
+
+    Each batch is a directory holding input.jsonl, output.jsonl and status.json, written in
+    the provider's formats. A background worker completes the requests through the regular
+    LLMWrapper path, so the batch code path can be exercised end to end with any model.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        concurrency: int = 4,
+        complete: Optional[
+            Callable[[str, List[Dict[str, str]]], Tuple[str, LLMUsage]]
+        ] = None,
+    ) -> None:
+        """
+        :param directory: Where batch directories are created.
+        :param concurrency: How many requests of a batch are worked on at once.
+        :param complete: Called with (model, messages) to answer one request. Defaults to an
+            uncached LLMWrapper completion.
+        """
+        self.directory = Path(directory)
+        self.concurrency = concurrency
+        self.complete = complete or self._complete
+
+    @staticmethod
+    def _complete(
+        model: str, messages: List[Dict[str, str]]
+    ) -> Tuple[str, LLMUsage]:
+        from .llm_wrapper import LLMWrapper
+
+        return LLMWrapper(model, cache=None)._get_completion(messages)
+
+    def supports(self, model: str) -> bool:
+        return True
+
+    def submit(self, model: str, requests: List[Dict[str, Any]]) -> str:
+        batch_id = f"batch_local_{uuid.uuid4().hex}"
+        batch_dir = self.directory / batch_id
+        batch_dir.mkdir(parents=True)
+        with open(batch_dir / "input.jsonl", "w", encoding="utf-8") as f:
+            for request in requests:
+                f.write(json.dumps(request) + "\n")
+        self._write_status(batch_dir, "in_progress", model)
+        threading.Thread(
+            target=self._run, args=(batch_dir, model), name=batch_id, daemon=True
+        ).start()
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        with open(self.directory / batch_id / "status.json", encoding="utf-8") as f:
+            return json.load(f)["status"]
+
+    def results(self, batch_id: str) -> List[Dict[str, Any]]:
+        output = self.directory / batch_id / "output.jsonl"
+        if not output.exists():
+            return []
+        with open(output, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _run(self, batch_dir: Path, model: str) -> None:
+        with open(batch_dir / "input.jsonl", encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        output_lock = threading.Lock()
+        output = open(batch_dir / "output.jsonl", "w", encoding="utf-8")
+
+        def run_request(request: Dict[str, Any]) -> None:
+            line = self._result_line(model, request)
+            with output_lock:
+                output.write(json.dumps(line) + "\n")
+                output.flush()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                list(executor.map(run_request, requests))
+            status = "completed"
+        except Exception:
+            logger.exception("Local batch %s failed", batch_dir.name)
+            status = "failed"
+        finally:
+            output.close()
+        self._write_status(batch_dir, status, model)
+
+    def _result_line(self, model: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        result = {
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": request["custom_id"],
+        }
+        try:
+            content, usage = self.complete(model, request["body"]["messages"])
+        except Exception as exc:
+            result["response"] = None
+            result["error"] = {"code": type(exc).__name__, "message": str(exc)}
+            return result
+        result["response"] = {
+            "status_code": 200,
+            "body": {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request["body"]["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": usage["prompt_tokens"],
+                    "completion_tokens": usage["completion_tokens"],
+                    "total_tokens": usage["prompt_tokens"] + usage["completion_tokens"],
+                    "prompt_tokens_details": {"cached_tokens": usage["cached_tokens"]},
+                },
+            },
+        }
+        result["error"] = None
+        return result
+
+    @staticmethod
+    def _write_status(batch_dir: Path, status: str, model: str) -> None:
+        # Write-then-rename, so a poller never reads a half-written file.
+        temp_path = batch_dir / "status.json.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"status": status, "model": model, "updated_at": time.time()}, f)
+        temp_path.replace(batch_dir / "status.json")
+
+
+def get_batch_backend() -> BatchBackend:
+    """
+    Returns the batch backend configured in settings.LLM_BATCH. The fake LLM has no batch
+    API, so batches run in the local emulator while it is enabled.
+    """
+    config = _batch_config()
+    if config["BACKEND"] == "local" or get_fake_llm() is not None:
+        return LocalBatchBackend(
+            Path(settings.BASE_DIR) / config["LOCAL_DIR"], config["LOCAL_CONCURRENCY"]
+        )
+    if config["BACKEND"] == "openai":
+        return OpenAIBatchBackend(config["COMPLETION_WINDOW"])
+    raise ValueError(f"Unknown LLM batch backend '{config['BACKEND']}'.")
+
+
+class _PendingRequest:
+    def __init__(
+        self,
+        custom_id: str,
+        llm: "LLMWrapper",
+        messages: List[Dict[str, str]],
+        expected_fields: Dict[str, str],
+        cache_key: Optional[str],
+    ) -> None:
+        self.custom_id = custom_id
+        self.llm = llm
+        self.messages = messages
+        self.expected_fields = expected_fields
+        self.cache_key = cache_key
+        self.future: "Future[LLMResponse]" = Future()
+
+
+class LLMBatch:
+    """
+    Collects LLM requests and runs them as provider batch jobs instead of one call each.
+
+    Requests are queued with LLMWrapper.get_batch_response, which returns a Future. run()
+    submits one job per model, polls until every job has finished and resolves the futures
+    with parsed LLMResponses, exactly as get_response would have returned them. Requests
+    for models the backend cannot batch are sent through the regular path instead.
+
+    Meant for large jobs that do not need interactive latency, such as regenerating code
+    overnight.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[BatchBackend] = None,
+        poll_interval: Optional[float] = None,
+        max_wait: Optional[float] = None,
+    ) -> None:
+        config = _batch_config()
+        self.backend = backend or get_batch_backend()
+        self.poll_interval = (
+            config["POLL_INTERVAL"] if poll_interval is None else poll_interval
+        )
+        self.max_wait = config["MAX_WAIT"] if max_wait is None else max_wait
+        self._pending: List[_PendingRequest] = []
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        llm: "LLMWrapper",
+        messages: List[Dict[str, str]],
+        expected_fields: Dict[str, str],
+        cache_key: Optional[str] = None,
+    ) -> "Future[LLMResponse]":
+        """
+        Queues a request. Use LLMWrapper.get_batch_response rather than calling this
+        directly, so cached responses skip the batch.
+        """
+        with self._lock:
+            request = _PendingRequest(
+                f"request-{len(self._pending)}", llm, messages, expected_fields, cache_key
+            )
+            self._pending.append(request)
+        return request.future
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def run(self) -> None:
+        """
+        Runs every queued request and resolves its future. Requests that fail, or whose
+        batch fails or does not finish within max_wait, resolve with an exception.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        by_model: Dict[str, List[_PendingRequest]] = {}
+        for request in pending:
+            by_model.setdefault(request.llm.model, []).append(request)
+
+        jobs: Dict[str, Dict[str, _PendingRequest]] = {}
+        for model, requests in by_model.items():
+            if not self.backend.supports(model):
+                self._run_directly(requests)
+                continue
+            for start in range(0, len(requests), MAX_BATCH_REQUESTS):
+                chunk = requests[start : start + MAX_BATCH_REQUESTS]
+                try:
+                    batch_id = self.backend.submit(
+                        model, [self._request_line(request) for request in chunk]
+                    )
+                except Exception as exc:
+                    logger.exception(
+                        "Could not submit a batch of %d %s requests", len(chunk), model
+                    )
+                    for request in chunk:
+                        request.future.set_exception(exc)
+                    continue
+                logger.info(
+                    "Submitted batch %s: %d %s requests", batch_id, len(chunk), model
+                )
+                jobs[batch_id] = {request.custom_id: request for request in chunk}
+
+        self._wait(jobs)
+
+    def _request_line(self, request: _PendingRequest) -> Dict[str, Any]:
+        return {
+            "custom_id": request.custom_id,
+            "method": "POST",
+            "url": _CHAT_COMPLETIONS_URL,
+            "body": request.llm._batch_body(request.messages),
+        }
+
+    def _wait(self, jobs: Dict[str, Dict[str, _PendingRequest]]) -> None:
+        """
+        Polls the submitted jobs and fans each finished job's results out to its requests.
+        """
+        deadline = time.monotonic() + self.max_wait
+        while jobs:
+            for batch_id in list(jobs):
+                try:
+                    status = self.backend.status(batch_id)
+                except Exception as exc:
+                    logger.warning("Polling batch %s failed: %s", batch_id, exc)
+                    continue
+                if status in TERMINAL_STATUSES:
+                    logger.info("Batch %s finished: %s", batch_id, status)
+                    self._resolve(batch_id, status, jobs.pop(batch_id))
+            if not jobs:
+                break
+            if time.monotonic() >= deadline:
+                for batch_id, requests in jobs.items():
+                    error = TimeoutError(
+                        f"Batch {batch_id} did not finish within {self.max_wait}s."
+                    )
+                    for request in requests.values():
+                        request.future.set_exception(error)
+                break
+            time.sleep(self.poll_interval)
+
+    def _resolve(
+        self, batch_id: str, status: str, requests: Dict[str, _PendingRequest]
+    ) -> None:
+        try:
+            lines = self.backend.results(batch_id)
+        except Exception as exc:
+            logger.exception("Could not read the results of batch %s", batch_id)
+            lines = []
+            status = f"{status} ({exc})"
+
+        for line in lines:
+            request = requests.pop(line.get("custom_id"), None)
+            if request is None:
+                continue
+            response = line.get("response") or {}
+            if line.get("error") or response.get("status_code") != 200:
+                request.future.set_exception(
+                    RuntimeError(
+                        f"Batch request {request.custom_id} failed: "
+                        f"{line.get('error') or response.get('body')}"
+                    )
+                )
+                continue
+            completion = ChatCompletion.model_validate(response["body"])
+            self._set_response(
+                request,
+                completion.choices[0].message.content,
+                openai_usage(completion.usage),
+            )
+
+        for request in requests.values():
+            request.future.set_exception(
+                RuntimeError(f"Batch {batch_id} returned no result ({status}).")
+            )
+
+    def _run_directly(self, requests: List[_PendingRequest]) -> None:
+        for request in requests:
+            try:
+                content, usage = request.llm._get_completion(request.messages)
+            except Exception as exc:
+                request.future.set_exception(exc)
+                continue
+            self._set_response(request, content, usage)
+
+    @staticmethod
+    def _set_response(request: _PendingRequest, content: str, usage: LLMUsage) -> None:
+        try:
+            try:
+                response = request.llm._build_response(
+                    content, request.expected_fields, request.cache_key, False, usage
+                )
+            except ValueError as exc:
+                response = request.llm._recover_response(
+                    request.messages,
+                    content,
+                    exc,
+                    request.expected_fields,
+                    request.cache_key,
+                    usage,
+                )
+        except Exception as exc:
+            request.future.set_exception(exc)
+            return
+        request.future.set_result(response)
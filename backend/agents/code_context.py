@@ -0,0 +1,287 @@
+import json
+import re
+from typing import Any, Dict, List, Set, Tuple
+
+from django.conf import settings
+
+from .java_lld import dicts, iter_classes, referenced_classes, simple_name
+
+# What each file generation is sent: "sliced" sends the file's own context (see
+# slice_context), "full" the whole design document, shared by every file.
+DEFAULT_CODE_CONTEXT_MODE = "sliced"
+
+# Sections whose classes implement the API contracts, and those that map database tables.
+# Services are given the API paths of the controllers that inject them and the tables of
+# the repositories and entities they use.
+_API_SECTIONS = ("controllers", "dtos")
+_TABLE_SECTIONS = ("entities", "repositories")
+
+_CLASS_SUFFIXES = ("controller", "resource", "entity", "repository", "dto", "model")
+_REF = re.compile(r"#/(?:definitions|components/schemas)/([^\"/]+)")
+
+ClassEntry = Tuple[str, Dict[str, Any]]
+
+
+def get_code_context_mode() -> str:
+    return getattr(settings, "LLM_CODE_CONTEXT_MODE", DEFAULT_CODE_CONTEXT_MODE)
+
+
+class LLDIndex:
+    """
+    A dependency index over a java LLD: its classes by simple name and, for each class, the
+    other classes of the LLD it references (parents, field and dependency types and method
+    signatures, including generic arguments) and those that reference it.
+    """
+
+    def __init__(self, java_lld: Dict[str, Any]) -> None:
+        self.entries: List[ClassEntry] = list(iter_classes(java_lld))
+        self.classes: Dict[str, ClassEntry] = {}
+        for section, item in self.entries:
+            self.classes.setdefault(simple_name(str(item["name"])), (section, item))
+        self._referrers: Dict[str, List[ClassEntry]] = {}
+        for section, item in self.entries:
+            for _, reference in self.references(item):
+                self._referrers.setdefault(simple_name(str(reference["name"])), []).append(
+                    (section, item)
+                )
+
+    def references(self, item: Dict[str, Any]) -> List[ClassEntry]:
+        """
+        Returns the LLD classes an entry references, by name.
+        """
+        own_name = simple_name(str(item["name"]))
+        return [
+            self.classes[name]
+            for name in sorted(referenced_classes(item))
+            if name in self.classes and name != own_name
+        ]
+
+    def referenced_by(self, item: Dict[str, Any]) -> List[ClassEntry]:
+        """
+        Returns the LLD classes that reference an entry.
+        """
+        return list(self._referrers.get(simple_name(str(item["name"])), []))
+
+
+def class_signature(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reduces a class entry to what code using the class needs: its type, parents, fields and
+    method signatures, without descriptions.
+    """
+    signature = {
+        key: item[key]
+        for key in ("type", "name", "package", "extends", "implements")
+        if item.get(key)
+    }
+    fields = [
+        {key: field[key] for key in ("name", "type") if key in field}
+        for field in dicts(item.get("fields"))
+    ]
+    if fields:
+        signature["fields"] = fields
+    methods = [
+        {
+            "name": method.get("name"),
+            "return_type": method.get("return_type", method.get("returnType")),
+            "parameters": [
+                {key: parameter[key] for key in ("name", "type") if key in parameter}
+                for parameter in dicts(method.get("parameters"))
+            ],
+        }
+        for method in dicts(item.get("methods"))
+    ]
+    if methods:
+        signature["methods"] = methods
+    return signature
+
+
+def slice_context(
+    section: str,
+    item: Dict[str, Any],
+    index: LLDIndex,
+    document_elements: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    Builds the context one class's file is generated from: its full LLD entry, the
+    signatures of the LLD classes it references, and for API-facing, service and persistence
+    classes the API paths and tables they correspond to.
+
+    :param section: The LLD section of the class.
+    :param item: The class entry.
+    :param index: The index of the LLD the class belongs to.
+    :param document_elements: The design document.
+    :return: The context, as a JSON-serializable object.
+    """
+    references = index.references(item)
+    context: Dict[str, Any] = {
+        "section": section,
+        "class": item,
+        "referenced classes": [class_signature(reference) for _, reference in references],
+    }
+    api_contracts = document_elements.get("api contracts")
+    if section in _API_SECTIONS and isinstance(api_contracts, dict):
+        context["api contracts"] = _relevant_api(section, item, references, api_contracts)
+    elif section == "services" and isinstance(api_contracts, dict):
+        api = _service_api(item, index, api_contracts)
+        if api:
+            context["api contracts"] = api
+    database_schema = document_elements.get("database schema")
+    if section in _TABLE_SECTIONS and isinstance(database_schema, dict):
+        context["database schema"] = {
+            "tables": _relevant_tables(section, item, references, database_schema)
+        }
+    elif section == "services" and isinstance(database_schema, dict):
+        tables = _relevant_tables(
+            section, item, _service_persistence(references, index), database_schema
+        )
+        if tables:
+            context["database schema"] = {"tables": tables}
+    return context
+
+
+def _relevant_api(
+    section: str,
+    item: Dict[str, Any],
+    references: List[ClassEntry],
+    api_contracts: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    Selects the paths a controller serves or a DTO appears in, and the definitions they use.
+    A controller is matched by its resource name ("UserController" serves "/users/...") or
+    by the DTOs it exchanges; one that matches no path gets all of them.
+    """
+    paths = api_contracts.get("paths")
+    if not isinstance(paths, dict):
+        return {}
+
+    mentioned = {simple_name(str(item["name"]))}
+    if section == "controllers":
+        mentioned.update(
+            simple_name(str(reference["name"]))
+            for reference_section, reference in references
+            if reference_section == "dtos"
+        )
+    pattern = re.compile(r"\b(" + "|".join(re.escape(name) for name in mentioned) + r")\b")
+    resource = _stem(str(item["name"])) if section == "controllers" else None
+
+    selected = {
+        path: operations
+        for path, operations in paths.items()
+        if (resource and resource in _path_stems(path))
+        or pattern.search(json.dumps(operations))
+    }
+    if not selected and section == "controllers":
+        selected = paths
+
+    api: Dict[str, Any] = {
+        key: api_contracts[key] for key in ("basePath", "servers") if key in api_contracts
+    }
+    api["paths"] = selected
+    definitions = _definitions(api_contracts)
+    if definitions:
+        used = set(_REF.findall(json.dumps(selected)))
+        used.update(name for name in definitions if name in mentioned)
+        api["definitions"] = {
+            name: schema for name, schema in definitions.items() if name in used
+        }
+    return api
+
+
+def _service_api(
+    item: Dict[str, Any], index: LLDIndex, api_contracts: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Selects the paths, and the definitions they use, of the controllers that inject a
+    service; the service implements them.
+    """
+    api: Dict[str, Any] = {}
+    for section, controller in index.referenced_by(item):
+        if section != "controllers":
+            continue
+        controller_api = _relevant_api(
+            section, controller, index.references(controller), api_contracts
+        )
+        for key, value in controller_api.items():
+            if key in ("paths", "definitions"):
+                api.setdefault(key, {}).update(value)
+            else:
+                api[key] = value
+    return api
+
+
+def _service_persistence(
+    references: List[ClassEntry], index: LLDIndex
+) -> List[ClassEntry]:
+    """
+    Returns the entities a service uses: those it references, and those managed by the
+    repositories it references.
+    """
+    entities = [entry for entry in references if entry[0] == "entities"]
+    for section, reference in references:
+        if section == "repositories":
+            entities.extend(
+                entry for entry in index.references(reference) if entry[0] == "entities"
+            )
+    return entities
+
+
+def _definitions(api_contracts: Dict[str, Any]) -> Dict[str, Any]:
+    # Swagger 2 keeps models in "definitions", OpenAPI 3 in "components.schemas".
+    definitions = api_contracts.get("definitions")
+    if not isinstance(definitions, dict):
+        components = api_contracts.get("components")
+        definitions = components.get("schemas") if isinstance(components, dict) else None
+    return definitions if isinstance(definitions, dict) else {}
+
+
+def _relevant_tables(
+    section: str,
+    item: Dict[str, Any],
+    references: List[ClassEntry],
+    database_schema: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    """
+    Selects the tables of an entity and of the entities it references, or of the entities
+    a repository manages or a service uses.
+    """
+    entities: List[Dict[str, Any]] = [item] if section == "entities" else []
+    entities.extend(
+        reference
+        for reference_section, reference in references
+        if reference_section == "entities"
+    )
+    wanted: Set[str] = set()
+    for entity in entities:
+        wanted.add(_stem(str(entity["name"])))
+        for key in ("table", "table_name", "tableName"):
+            if entity.get(key):
+                wanted.add(_stem(str(entity[key])))
+    return [
+        table
+        for table in dicts(database_schema.get("tables"))
+        if _stem(str(table.get("name", ""))) in wanted
+    ]
+
+
+def _path_stems(path: str) -> Set[str]:
+    return {
+        _stem(segment) for segment in path.split("/") if segment and "{" not in segment
+    }
+
+
+def _stem(name: str) -> str:
+    """
+    Normalizes class, table and path names for matching: "UserController", "users",
+    "user_entities" and "UserEntity" all become "user".
+    """
+    stem = re.sub(r"[^a-z0-9]", "", name.lower())
+    if stem.endswith("ies") and len(stem) > 3:
+        stem = stem[:-3] + "y"
+    elif stem.endswith(("sses", "uses", "xes", "ches", "shes")):
+        stem = stem[:-2]
+    elif stem.endswith("s") and not stem.endswith(("ss", "us")):
+        stem = stem[:-1]
+    for suffix in _CLASS_SUFFIXES:
+        if stem.endswith(suffix) and stem != suffix:
+            return stem[: -len(suffix)]
+    return stem
@@ -0,0 +1,252 @@
+import base64
+import hashlib
+import logging
+import os
+import string
+import subprocess
+import threading
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import httpx
+from django.conf import settings
+
+from .llm_cache import LLMResponseCache
+
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIAGRAM_RENDER = {
+    # "jar" runs a local plantuml.jar, which needs Java and the jar installed. "server"
+    # renders on the PlantUML server at SERVER instead, which must be set: a self-hosted
+    # one (e.g. the plantuml/plantuml-server image), so diagrams stay on machines you run.
+    "BACKEND": "jar",
+    "JAVA": "java",
+    "JAR": "plantuml.jar",
+    "SERVER": None,
+    "TIMEOUT": 30,
+    # PlantUML's security profile for the jar. SANDBOX refuses !include, !includeurl and
+    # every other file or network access a diagram could ask for.
+    "SECURITY_PROFILE": "SANDBOX",
+    # Each render is a JVM or server request; this bounds how many run at once.
+    "MAX_WORKERS": 2,
+    # Sources longer than this, encoded or decoded, are refused.
+    "MAX_ENCODED_CHARS": 100_000,
+    "MAX_SOURCE_CHARS": 500_000,
+    "MAX_MEMORY_ENTRIES": 128,
+    "MAX_DISK_ENTRIES": 5000,
+    # The SQLite file rendered diagrams are kept in across restarts; None keeps them in
+    # memory only.
+    "CACHE_PATH": None,
+}
+
+# PlantUML's URL encoding: raw deflate, then base64 with its own alphabet.
+_PLANTUML_ALPHABET = string.digits + string.ascii_uppercase + string.ascii_lowercase + "-_"
+_BASE64_ALPHABET = string.ascii_uppercase + string.ascii_lowercase + string.digits + "+/"
+_TO_BASE64 = str.maketrans(_PLANTUML_ALPHABET, _BASE64_ALPHABET)
+_FROM_BASE64 = str.maketrans(_BASE64_ALPHABET, _PLANTUML_ALPHABET)
+
+
+class DiagramSourceError(ValueError):
+    """
+    Raised when an encoded diagram can't be decoded or is too large.
+    """
+
+
+class DiagramRenderError(Exception):
+    """
+    Raised when the renderer rejects a diagram.
+    """
+
+
+class RendererUnavailableError(DiagramRenderError):
+    """
+    Raised when the renderer can't be run or doesn't answer in time.
+    """
+
+
+def diagram_render_config() -> Dict[str, Any]:
+    config = dict(DEFAULT_DIAGRAM_RENDER)
+    config.update(getattr(settings, "DIAGRAM_RENDER", {}))
+    return config
+
+
+def encode_source(source: str) -> str:
+    """
+    Encodes diagram source the way PlantUML servers (and the plantuml-encoder package the
+    frontend uses) expect it in URLs.
+    """
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    data = compressor.compress(source.encode("utf-8")) + compressor.flush()
+    return base64.b64encode(data).decode("ascii").rstrip("=").translate(_FROM_BASE64)
+
+
+def decode_source(encoded: str) -> str:
+    """
+    Decodes an encode_source string back into diagram source.
+
+    :raises DiagramSourceError: If it isn't valid, is longer than MAX_ENCODED_CHARS or
+        decodes to more than MAX_SOURCE_CHARS.
+    """
+    config = diagram_render_config()
+    if len(encoded) > config["MAX_ENCODED_CHARS"]:
+        raise DiagramSourceError(
+            f"Encoded diagram exceeds {config['MAX_ENCODED_CHARS']} characters"
+        )
+    max_chars = config["MAX_SOURCE_CHARS"]
+    try:
+        data = base64.b64decode(
+            encoded.translate(_TO_BASE64) + "=" * (-len(encoded) % 4), validate=True
+        )
+        decompressor = zlib.decompressobj(-15)
+        # Bounded, so a small URL can't inflate into an arbitrarily large source.
+        raw = decompressor.decompress(data, max_chars * 4 + 1)
+        source = raw.decode("utf-8")
+    except (ValueError, zlib.error) as exc:
+        raise DiagramSourceError(f"Invalid diagram encoding: {exc}") from exc
+    if decompressor.unconsumed_tail or len(source) > max_chars:
+        raise DiagramSourceError(f"Diagram source exceeds {max_chars} characters")
+    return source
+
+
+def diagram_digest(source: str, format: str = "svg") -> str:
+    """
+    Returns the content hash that identifies a rendered diagram.
+    """
+    return hashlib.sha256(f"{format}\n{source}".encode("utf-8")).hexdigest()
+
+
+class DiagramRenderer:
+    """
+    Renders diagram sources to SVG with a local PlantUML, caching the output by content hash.
+
+    Renders run on a bounded worker pool. Concurrent requests for the same diagram share one
+    render, and a diagram that is rendered once (for any document or version) is served
+    from the cache afterwards. PlantUML reads the diagram type from the source's @start
+    tag, so class diagrams as well as @startdot, @startmindmap etc. are supported.
+    """
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        self.config = config
+        self.cache = LLMResponseCache(
+            max_memory_entries=config["MAX_MEMORY_ENTRIES"],
+            path=config["CACHE_PATH"],
+            max_disk_entries=config["MAX_DISK_ENTRIES"],
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=config["MAX_WORKERS"], thread_name_prefix="diagram-render"
+        )
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+
+    def render_svg(self, source: str) -> str:
+        """
+        Returns the SVG for a diagram source.
+
+        :raises DiagramRenderError: If the renderer rejected the diagram.
+        :raises RendererUnavailableError: If the renderer failed to run or timed out.
+        """
+        digest = diagram_digest(source)
+        svg = self.cache.get(digest)
+        if svg is not None:
+            return svg
+
+        with self._lock:
+            future = self._in_flight.get(digest)
+            started = future is None
+            if started:
+                future = self._executor.submit(self._render_and_store, digest, source)
+                self._in_flight[digest] = future
+        if started:
+            # Outside the lock: a render that already finished runs the callback right here.
+            future.add_done_callback(lambda done: self._forget(digest, done))
+        try:
+            # Includes the time spent queued behind other renders.
+            return future.result(timeout=self.config["TIMEOUT"] * 2)
+        except TimeoutError as exc:
+            raise RendererUnavailableError("Timed out waiting for the renderer") from exc
+
+    def _forget(self, digest: str, future: Future) -> None:
+        with self._lock:
+            if self._in_flight.get(digest) is future:
+                del self._in_flight[digest]
+
+    def _render_and_store(self, digest: str, source: str) -> str:
+        if self.config["BACKEND"] == "server":
+            svg = self._render_server(source)
+        else:
+            svg = self._render_jar(source)
+        self.cache.set(digest, svg)
+        logger.info("Rendered diagram %s (%d bytes)", digest[:12], len(svg))
+        return svg
+
+    def _render_jar(self, source: str) -> str:
+        if not os.path.isfile(self.config["JAR"]):
+            raise RendererUnavailableError(
+                f"PlantUML jar not found at {self.config['JAR']}; download plantuml.jar "
+                'or set DIAGRAM_RENDER["BACKEND"] to "server" with a SERVER'
+            )
+        command = [
+            self.config["JAVA"],
+            "-Djava.awt.headless=true",
+            f"-DPLANTUML_SECURITY_PROFILE={self.config['SECURITY_PROFILE']}",
+            "-jar",
+            self.config["JAR"],
+            "-tsvg",
+            "-pipe",
+            "-charset",
+            "UTF-8",
+        ]
+        try:
+            result = subprocess.run(
+                command,
+                input=source.encode("utf-8"),
+                capture_output=True,
+                timeout=self.config["TIMEOUT"],
+            )
+        except (OSError, subprocess.TimeoutExpired) as exc:
+            raise RendererUnavailableError(f"PlantUML could not run: {exc}") from exc
+        if result.returncode != 0:
+            error = result.stderr.decode("utf-8", "replace").strip()
+            raise DiagramRenderError(error or f"PlantUML exited with {result.returncode}")
+        return result.stdout.decode("utf-8")
+
+    def _render_server(self, source: str) -> str:
+        server = self.config["SERVER"]
+        if not server:
+            raise RendererUnavailableError(
+                'DIAGRAM_RENDER["SERVER"] must be set when BACKEND is "server"'
+            )
+        url = f"{server.rstrip('/')}/svg/{encode_source(source)}"
+        try:
+            response = httpx.get(url, timeout=self.config["TIMEOUT"])
+        except httpx.HTTPError as exc:
+            raise RendererUnavailableError(f"PlantUML server failed: {exc}") from exc
+        if response.status_code >= 500:
+            raise RendererUnavailableError(
+                f"PlantUML server answered {response.status_code}"
+            )
+        if response.status_code >= 400:
+            # The server rejected the diagram; it reports the error in a header, and
+            # draws it into the body.
+            error = response.headers.get("X-PlantUML-Diagram-Error")
+            raise DiagramRenderError(
+                error or f"PlantUML server answered {response.status_code}"
+            )
+        return response.text
+
+
+_renderer: Optional[DiagramRenderer] = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer() -> DiagramRenderer:
+    """
+    Returns the process-wide renderer configured by settings.DIAGRAM_RENDER.
+    """
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = DiagramRenderer(diagram_render_config())
+        return _renderer
@@ -0,0 +1,102 @@
+import copy
+from typing import Any, Dict, List
+
+# A JSON Patch (RFC 6902) operation: {"op": "add" | "remove" | "replace", "path": ..., "value": ...}
+PatchOperation = Dict[str, Any]
+
+
+def _escape(key: Any) -> str:
+    # JSON Pointer escaping; API contract paths contain "/".
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def diff_documents(old: Any, new: Any) -> List[PatchOperation]:
+    """
+    Returns a compact structural diff from old to new as JSON Patch operations.
+
+    Objects are compared key by key and lists after trimming their common prefix and
+    suffix, so an element inserted into or removed from a long list is one operation
+    rather than a rewrite of the list. Anything else that changed is replaced as a whole.
+
+    :param old: The earlier version, e.g. a VersionedDocument's document_elements.
+    :param new: The later version.
+    :return: Operations that turn old into new when applied in order.
+    """
+    operations: List[PatchOperation] = []
+    _diff(old, new, "", operations)
+    return operations
+
+
+def _diff(old: Any, new: Any, path: str, operations: List[PatchOperation]) -> None:
+    if old == new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                operations.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key in old:
+                _diff(old[key], value, child, operations)
+            else:
+                operations.append({"op": "add", "path": child, "value": value})
+        return
+    if isinstance(old, list) and isinstance(new, list):
+        _diff_lists(old, new, path, operations)
+        return
+    operations.append({"op": "replace", "path": path, "value": new})
+
+
+def _diff_lists(
+    old: List[Any], new: List[Any], path: str, operations: List[PatchOperation]
+) -> None:
+    start = 0
+    while start < len(old) and start < len(new) and old[start] == new[start]:
+        start += 1
+    old_end, new_end = len(old), len(new)
+    while old_end > start and new_end > start and old[old_end - 1] == new[new_end - 1]:
+        old_end -= 1
+        new_end -= 1
+
+    # Elements changed in place are diffed individually.
+    common = min(old_end, new_end) - start
+    for index in range(start, start + common):
+        _diff(old[index], new[index], f"{path}/{index}", operations)
+    # Removals go from the end so the earlier indexes stay valid.
+    for index in reversed(range(start + common, old_end)):
+        operations.append({"op": "remove", "path": f"{path}/{index}"})
+    for index in range(start + common, new_end):
+        operations.append({"op": "add", "path": f"{path}/{index}", "value": new[index]})
+
+
+def apply_diff(document: Any, operations: List[PatchOperation]) -> Any:
+    """
+    Applies operations from diff_documents to a copy of document.
+
+    :return: The patched copy.
+    """
+    result = copy.deepcopy(document)
+    for operation in operations:
+        if operation["path"] == "":
+            result = copy.deepcopy(operation.get("value"))
+            continue
+        *parents, last = operation["path"].split("/")[1:]
+        container = result
+        for token in parents:
+            container = container[_index(container, _unescape(token))]
+        key = _index(container, _unescape(last))
+        if operation["op"] == "remove":
+            del container[key]
+        elif operation["op"] == "add" and isinstance(container, list):
+            container.insert(key, copy.deepcopy(operation["value"]))
+        else:
+            container[key] = copy.deepcopy(operation["value"])
+    return result
+
+
+def _index(container: Any, token: str) -> Any:
+    return int(token) if isinstance(container, list) else token
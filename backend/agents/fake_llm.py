@@ -0,0 +1,629 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import anthropic
+import httpx
+import openai
+from anthropic.types import Message
+from django.conf import settings
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from .prompt_cache import anthropic_usage, openai_usage
+from .rate_limiter import estimate_tokens
+from .types import LLMUsage
+
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
+DEFAULT_FAKE_LLM = {
+    "ENABLED": False,
+    # "synthetic" generates responses, "replay" serves recorded ones and "record" calls the
+    # real provider and saves what it returns.
+    "MODE": "synthetic",
+    "CASSETTE_DIR": "llm_cassettes",
+    # What replay does for a prompt without a cassette: "error" or "synthetic".
+    "REPLAY_MISS": "error",
+    "SEED": 0,
+    # DISTRIBUTION is "fixed" (VALUE), "uniform" (MIN, MAX), "lognormal" (MEDIAN, SIGMA) or,
+    # in replay mode, "recorded" (the latency seen while recording). In seconds.
+    "LATENCY": {"DISTRIBUTION": "lognormal", "MEDIAN": 2.0, "SIGMA": 0.5},
+    # Fractions of requests that fail with a 500 or a 429.
+    "FAILURE_RATE": 0.0,
+    "RATE_LIMIT_RATE": 0.0,
+    "RETRY_AFTER": 1.0,
+    # How many entries synthetic lists and sections get.
+    "SYNTHETIC_ITEMS": 5,
+    # Wrap synthetic JSON in a ```json fence, as the o1 models do.
+    "FENCE_JSON": True,
+    "STREAM_CHUNK_CHARS": 40,
+}
+
+_FAKE_URL = "https://fake-llm.local/v1"
+
+_RESPONSE_FORMAT_MARKER = "response in the following JSON format"
+
+
+# Synthetic values for the response keys the agents' prompts ask for.
+
+
+def _requirements(rng: random.Random, items: int, kind: str) -> List[str]:
+    return [
+        f"{kind} {index + 1}: the system must handle synthetic case {rng.randint(1, 999)}."
+        for index in range(items)
+    ]
+
+
+def _architecture(rng: random.Random, items: int) -> Dict[str, Any]:
+    return {
+        "high_level_overview": "A synthetic web platform split into independent services.",
+        "components": [
+            {
+                "name": f"Service{index + 1}",
+                "responsibility": f"Handles synthetic domain {rng.randint(1, 999)}.",
+                "technologies": ["Java", "Spring Boot", "PostgreSQL"],
+            }
+            for index in range(items)
+        ],
+    }
+
+
+def _api_contracts(rng: random.Random, items: int) -> Dict[str, Any]:
+    return {
+        "swagger": "2.0",
+        "info": {"title": "Synthetic API", "version": "1.0.0"},
+        "paths": {
+            f"/resources{index + 1}": {
+                "get": {
+                    "summary": f"Lists synthetic resources {index + 1}",
+                    "responses": {"200": {"description": "OK"}},
+                }
+            }
+            for index in range(items)
+        },
+    }
+
+
+def _database_schema(rng: random.Random, items: int) -> Dict[str, Any]:
+    return {
+        "name": "SyntheticDB",
+        "tables": [
+            {
+                "name": f"Table{index + 1}",
+                "columns": [
+                    {"name": "id", "type": "uuid", "primary_key": True},
+                    {"name": "name", "type": "varchar(255)"},
+                    {"name": "created_at", "type": "timestamp"},
+                ],
+            }
+            for index in range(items)
+        ],
+    }
+
+
+def _java_lld(rng: random.Random, items: int) -> Dict[str, Any]:
+    sections = {
+        "controllers": "Controller",
+        "dtos": "Dto",
+        "services": "Service",
+        "repositories": "Repository",
+        "entities": "",
+    }
+    return {
+        section: [
+            {
+                "type": "class",
+                "name": f"Synthetic{index + 1}{suffix}",
+                "description": f"Synthetic {section[:-1]} {rng.randint(1, 999)}.",
+                "package": f"com.example.synthetic.{section}",
+                "fields": [{"name": "id", "type": "UUID", "visibility": "private"}],
+                "methods": [
+                    {
+                        "name": "getId",
+                        "returnType": "UUID",
+                        "parameters": [],
+                        "visibility": "public",
+                    }
+                ],
+            }
+            for index in range(items)
+        ]
+        for section, suffix in sections.items()
+    }
+
+
+def _react_lld(rng: random.Random, items: int) -> Dict[str, Any]:
+    return {
+        "components": [
+            {
+                "name": f"SyntheticComponent{index + 1}",
+                "path": f"src/components/SyntheticComponent{index + 1}.tsx",
+                "props": [{"name": "id", "type": "string"}],
+            }
+            for index in range(items)
+        ]
+    }
+
+
+def _react_code(rng: random.Random, items: int) -> List[Dict[str, str]]:
+    return [
+        {
+            "path": f"src/components/SyntheticComponent{index + 1}.tsx",
+            "content": (
+                f"export const SyntheticComponent{index + 1} = () => <div>{index + 1}</div>;\n"
+            ),
+        }
+        for index in range(items)
+    ]
+
+
+def _java_file(rng: random.Random, items: int) -> str:
+    methods = "\n".join(
+        f"    public int method{index + 1}() {{\n        return {rng.randint(1, 999)};\n    }}\n"
+        for index in range(items)
+    )
+    return f"package com.example.synthetic;\n\npublic class Synthetic {{\n{methods}}}\n"
+
+
+def _plantuml(rng: random.Random, items: int) -> str:
+    classes = "\n".join(f"class Synthetic{index + 1}" for index in range(items))
+    return f"@startuml\n{classes}\n@enduml"
+
+
+SYNTHETIC_TEMPLATES: Dict[str, Callable[[random.Random, int], Any]] = {
+    "updated functional requirements": lambda rng, items: _requirements(
+        rng, items, "Functional requirement"
+    ),
+    "updated non functional requirements": lambda rng, items: _requirements(
+        rng, items, "Non functional requirement"
+    ),
+    "updated architecture": _architecture,
+    "updated api contracts": _api_contracts,
+    "updated database schema": _database_schema,
+    "updated java LLD": _java_lld,
+    "updated react LLD": _react_lld,
+    "updated react code": _react_code,
+    "file content": _java_file,
+    "plantuml": _plantuml,
+    "summary": lambda rng, items: "Synthetic summary of the earlier conversation.",
+    "communication": lambda rng, items: "Synthetic response generated offline.",
+}
+
+
+def synthetic_response(prompt: str, rng: random.Random, items: int) -> Dict[str, Any]:
+    """
+    Builds a response object with every key the prompt asks for.
+
+    Known agent response keys get a value of the right shape. For an unknown prompt, the
+    keys are read from the JSON template after "response in the following JSON format".
+    """
+    keys = [key for key in SYNTHETIC_TEMPLATES if f'"{key}"' in prompt]
+    if any(key != "communication" for key in keys):
+        return {key: SYNTHETIC_TEMPLATES[key](rng, items) for key in keys}
+
+    position = prompt.rfind(_RESPONSE_FORMAT_MARKER)
+    template = prompt[position:] if position != -1 else prompt
+    keys = list(dict.fromkeys(re.findall(r'"([^"\n]+)"\s*:', template))) or ["response"]
+    return {key: f"Synthetic {key}." for key in keys}
+
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    # Anthropic-style content blocks.
+    return "".join(block.get("text", "") for block in content)
+
+
+class FakeLLM:
+    """
+    A deterministic, local stand-in for the LLM providers, for benchmarks, load tests and
+    offline development.
+
+    In synthetic mode it answers every request with schema-valid JSON for the agent whose
+    prompt it received. In replay mode it serves responses recorded in record mode, keyed by
+    a hash of the model and prompt. Latency is drawn from a configurable distribution, and
+    500s and 429s can be injected at configurable rates. Randomness is seeded per prompt
+    and attempt, so runs repeat exactly regardless of thread scheduling.
+
+    get_client() and the other pooled clients return FakeLLM adapters when
+    settings.LLM_FAKE["ENABLED"] is set, so LLMWrapper uses it without other changes.
+    """
+
+    def __init__(self, config: Dict[str, Any], cassette_dir: Path) -> None:
+        self.config = config
+        self.mode = config["MODE"]
+        self.cassette_dir = cassette_dir
+        self.requests = 0
+        self._attempts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.chat_client = _FakeChatClient(self, "openai")
+        self.async_openai_client = _FakeAsyncChatClient(self)
+        self.anthropic_client = _FakeAnthropicClient(self)
+
+    @staticmethod
+    def prompt_key(model: str, messages: Any, system: Any = None) -> str:
+        payload = {"model": model, "messages": messages}
+        if system is not None:
+            payload["system"] = system
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def respond(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        system: Any = None,
+        real_call: Optional[Callable[[], Tuple[str, LLMUsage]]] = None,
+    ) -> Tuple[str, LLMUsage, float, Optional[Exception]]:
+        """
+        Decides the outcome of one request without sleeping; the caller waits out the
+        latency, so sync and async adapters share this.
+
+        :param model: The provider-qualified model.
+        :param real_call: Makes the request against the real provider, for record mode.
+        :return: The content, the usage, the latency and the error to raise (if any).
+        """
+        key = self.prompt_key(model, messages, system)
+        with self._lock:
+            attempt = self._attempts.get(key, 0)
+            self._attempts[key] = attempt + 1
+            self.requests += 1
+        rng = random.Random(f"{self.config['SEED']}:{key}:{attempt}")
+
+        roll = rng.random()
+        if roll < self.config["RATE_LIMIT_RATE"]:
+            error = _FakeError(429, self.config["RETRY_AFTER"])
+            return "", openai_usage(None), 0.0, error
+        if roll < self.config["RATE_LIMIT_RATE"] + self.config["FAILURE_RATE"]:
+            return "", openai_usage(None), self._latency(rng, None), _FakeError(500)
+
+        if self.mode == "record":
+            started = time.monotonic()
+            content, usage = real_call()
+            self._save_cassette(key, model, content, usage, time.monotonic() - started)
+            return content, usage, 0.0, None
+
+        if self.mode == "replay":
+            cassette = self._load_cassette(key)
+            if cassette is not None:
+                latency = self._latency(rng, cassette.get("latency"))
+                return cassette["content"], cassette["usage"], latency, None
+            if self.config["REPLAY_MISS"] != "synthetic":
+                return "", openai_usage(None), 0.0, LookupError(
+                    f"No recorded response for prompt {key} ({model})."
+                )
+
+        content = self._synthetic_content(messages, system, rng)
+        usage = LLMUsage(
+            prompt_tokens=estimate_tokens(messages),
+            completion_tokens=max(1, len(content) // 4),
+            cached_tokens=0,
+            cache_write_tokens=0,
+        )
+        return content, usage, self._latency(rng, None), None
+
+    def _synthetic_content(
+        self, messages: List[Dict[str, Any]], system: Any, rng: random.Random
+    ) -> str:
+        texts = [_content_text(message["content"]) for message in messages]
+        if system:
+            texts.insert(0, _content_text(system))
+        prompt = "\n".join(texts)
+        response = synthetic_response(prompt, rng, self.config["SYNTHETIC_ITEMS"])
+        text = json.dumps(response, indent=2)
+        return f"```json\n{text}\n```" if self.config["FENCE_JSON"] else text
+
+    def _latency(self, rng: random.Random, recorded: Optional[float]) -> float:
+        latency = self.config["LATENCY"]
+        distribution = latency.get("DISTRIBUTION", "fixed")
+        if distribution == "recorded" and recorded is not None:
+            return recorded
+        if distribution == "uniform":
+            return rng.uniform(latency["MIN"], latency["MAX"])
+        if distribution in ("lognormal", "recorded"):
+            return rng.lognormvariate(
+                math.log(latency.get("MEDIAN", 1.0)), latency.get("SIGMA", 0.5)
+            )
+        return latency.get("VALUE", 0.0)
+
+    def _cassette_path(self, key: str) -> Path:
+        return self.cassette_dir / f"{key}.json"
+
+    def _load_cassette(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._cassette_path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save_cassette(
+        self, key: str, model: str, content: str, usage: LLMUsage, latency: float
+    ) -> None:
+        self.cassette_dir.mkdir(parents=True, exist_ok=True)
+        path = self._cassette_path(key)
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"model": model, "content": content, "usage": usage, "latency": latency},
+                f,
+                indent=2,
+            )
+        temp_path.replace(path)
+        logger.info("Recorded %s response as %s", model, path.name)
+
+
+class _FakeError:
+    """
+    An injected failure, turned into the provider SDK's own exception by each adapter.
+    """
+
+    def __init__(self, status_code: int, retry_after: Optional[float] = None) -> None:
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    def to_exception(self, sdk: Any, url: str) -> Exception:
+        headers = {}
+        if self.retry_after is not None:
+            headers["retry-after"] = str(self.retry_after)
+        response = httpx.Response(
+            self.status_code, headers=headers, request=httpx.Request("POST", url)
+        )
+        if self.status_code == 429:
+            return sdk.RateLimitError(
+                "Rate limit reached (fake LLM).", response=response, body=None
+            )
+        return sdk.InternalServerError(
+            "Server error (fake LLM).", response=response, body=None
+        )
+
+
+def _raise(error: Any, sdk: Any, url: str) -> None:
+    if isinstance(error, _FakeError):
+        raise error.to_exception(sdk, url)
+    if error is not None:
+        raise error
+
+
+def _qualified(model: str, provider: str) -> str:
+    return model if ":" in model else f"{provider}:{model}"
+
+
+def _chat_completion(model: str, content: str, usage: LLMUsage) -> ChatCompletion:
+    return ChatCompletion.model_validate(
+        {
+            "id": f"chatcmpl-fake-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }
+            ],
+            "usage": _openai_usage_json(usage),
+        }
+    )
+
+
+def _openai_usage_json(usage: LLMUsage) -> Dict[str, Any]:
+    return {
+        "prompt_tokens": usage["prompt_tokens"],
+        "completion_tokens": usage["completion_tokens"],
+        "total_tokens": usage["prompt_tokens"] + usage["completion_tokens"],
+        "prompt_tokens_details": {"cached_tokens": usage["cached_tokens"]},
+    }
+
+
+def _chunk(
+    model: str, choices: List[Dict[str, Any]], **fields: Any
+) -> ChatCompletionChunk:
+    return ChatCompletionChunk.model_validate(
+        {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": choices,
+            **fields,
+        }
+    )
+
+
+class _FakeCompletions:
+    def __init__(self, fake: FakeLLM, provider: str) -> None:
+        self.fake = fake
+        self.provider = provider
+
+    def create(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        stream: bool = False,
+        **kwargs: Any,
+    ) -> Any:
+        qualified = _qualified(model, self.provider)
+
+        def real_call() -> Tuple[str, LLMUsage]:
+            from .llm_clients import _get_client
+
+            # Streams are recorded from a plain request and replayed in chunks.
+            params = {k: v for k, v in kwargs.items() if k != "stream_options"}
+            response = _get_client().chat.completions.create(
+                model=qualified, messages=messages, **params
+            )
+            return response.choices[0].message.content, openai_usage(
+                getattr(response, "usage", None)
+            )
+
+        content, usage, latency, error = self.fake.respond(
+            qualified, messages, real_call=real_call
+        )
+        if not stream:
+            time.sleep(latency)
+            _raise(error, openai, _FAKE_URL)
+            return _chat_completion(model, content, usage)
+        include_usage = (kwargs.get("stream_options") or {}).get("include_usage")
+        return self._stream(model, content, usage, latency, error, include_usage)
+
+    def _stream(
+        self,
+        model: str,
+        content: str,
+        usage: LLMUsage,
+        latency: float,
+        error: Any,
+        include_usage: bool,
+    ) -> Iterator[ChatCompletionChunk]:
+        size = self.fake.config["STREAM_CHUNK_CHARS"]
+        pieces = [content[i : i + size] for i in range(0, len(content), size)] or [""]
+        # Spend half the latency before the first token and spread the rest over the chunks.
+        time.sleep(latency / 2)
+        _raise(error, openai, _FAKE_URL)
+        for piece in pieces:
+            time.sleep(latency / 2 / len(pieces))
+            yield _chunk(
+                model,
+                [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            )
+        if include_usage:
+            yield _chunk(model, [], usage=_openai_usage_json(usage))
+
+
+class _FakeChatClient:
+    """
+    Stands in for aisuite.Client and openai.OpenAI (chat completions only).
+    """
+
+    def __init__(self, fake: FakeLLM, provider: str) -> None:
+        self.chat = type("Chat", (), {})()
+        self.chat.completions = _FakeCompletions(fake, provider)
+
+
+class _FakeAsyncCompletions:
+    def __init__(self, fake: FakeLLM) -> None:
+        self.fake = fake
+
+    async def create(
+        self, model: str, messages: List[Dict[str, Any]], **kwargs: Any
+    ) -> Any:
+        qualified = _qualified(model, "openai")
+
+        def real_call() -> Tuple[str, LLMUsage]:
+            from .llm_clients import _get_client
+
+            response = _get_client().chat.completions.create(
+                model=qualified, messages=messages, **kwargs
+            )
+            return response.choices[0].message.content, openai_usage(response.usage)
+
+        def respond() -> Tuple[str, LLMUsage, float, Any]:
+            return self.fake.respond(qualified, messages, real_call=real_call)
+
+        if self.fake.mode == "record":
+            content, usage, latency, error = await asyncio.to_thread(respond)
+        else:
+            content, usage, latency, error = respond()
+        await asyncio.sleep(latency)
+        _raise(error, openai, _FAKE_URL)
+        return _chat_completion(model, content, usage)
+
+
+class _FakeAsyncChatClient:
+    """
+    Stands in for openai.AsyncOpenAI (chat completions only).
+    """
+
+    def __init__(self, fake: FakeLLM) -> None:
+        self.chat = type("Chat", (), {})()
+        self.chat.completions = _FakeAsyncCompletions(fake)
+
+
+class _FakeMessages:
+    def __init__(self, fake: FakeLLM) -> None:
+        self.fake = fake
+
+    def create(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        system: Any = None,
+        **kwargs: Any,
+    ) -> Message:
+        qualified = _qualified(model, "anthropic")
+
+        def real_call() -> Tuple[str, LLMUsage]:
+            from .llm_clients import _get_anthropic_client
+
+            if system is not None:
+                kwargs["system"] = system
+            response = _get_anthropic_client().messages.create(
+                model=model, messages=messages, **kwargs
+            )
+            text = "".join(b.text for b in response.content if b.type == "text")
+            return text, anthropic_usage(response.usage)
+
+        content, usage, latency, error = self.fake.respond(
+            qualified, messages, system=system, real_call=real_call
+        )
+        time.sleep(latency)
+        _raise(error, anthropic, "https://fake-llm.local/v1/messages")
+        return Message.model_validate(
+            {
+                "id": f"msg_fake_{uuid.uuid4().hex}",
+                "type": "message",
+                "role": "assistant",
+                "model": model,
+                "content": [{"type": "text", "text": content}],
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": {
+                    "input_tokens": usage["prompt_tokens"]
+                    - usage["cached_tokens"]
+                    - usage["cache_write_tokens"],
+                    "output_tokens": usage["completion_tokens"],
+                    "cache_read_input_tokens": usage["cached_tokens"],
+                    "cache_creation_input_tokens": usage["cache_write_tokens"],
+                },
+            }
+        )
+
+
+class _FakeAnthropicClient:
+    """
+    Stands in for anthropic.Anthropic (messages only).
+    """
+
+    def __init__(self, fake: FakeLLM) -> None:
+        self.messages = _FakeMessages(fake)
+
+
+_fake: Optional[FakeLLM] = None
+_fake_config: Optional[Dict[str, Any]] = None
+_fake_lock = threading.Lock()
+
+
+def get_fake_llm() -> Optional[FakeLLM]:
+    """
+    Returns the FakeLLM configured in settings.LLM_FAKE, or None when it is not enabled.
+    """
+    global _fake, _fake_config
+    config = dict(DEFAULT_FAKE_LLM)
+    config.update(getattr(settings, "LLM_FAKE", {}))
+    if not config["ENABLED"]:
+        return None
+    with _fake_lock:
+        if _fake is None or config != _fake_config:
+            _fake = FakeLLM(config, Path(settings.BASE_DIR) / config["CASSETTE_DIR"])
+            _fake_config = config
+        return _fake
@@ -0,0 +1,88 @@
+import re
+from typing import Any, Dict, Iterator, List, Set, Tuple
+
+# The sections of a java LLD, in the order the prompt lists them.
+LLD_SECTIONS = (
+    "controllers",
+    "dtos",
+    "services",
+    "repositories",
+    "entities",
+    "enums",
+    "configurations",
+)
+
+# The (possibly qualified) type names in a Java type expression such as "Map<String, a.b.Dto>".
+TYPE_NAMES = re.compile(r"[A-Za-z_$][\w$.]*")
+
+
+def iter_classes(java_lld: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Yields (section, class entry) for every named class of a java LLD, in section order.
+    Entries that aren't objects or have no name are skipped.
+
+    :raises ValueError: If the LLD isn't an object, e.g. a document from before the LLD was
+        stored structured.
+    """
+    if not isinstance(java_lld, dict):
+        raise ValueError(f"java LLD must be an object, got {type(java_lld).__name__}")
+    for section in LLD_SECTIONS:
+        for item in dicts(java_lld.get(section)):
+            if item.get("name"):
+                yield section, item
+
+
+def file_path(item: Dict[str, Any]) -> str:
+    """
+    Returns the source file of a class entry, relative to the source root, or "" if the
+    entry has no package.
+    """
+    package, name = item.get("package"), item.get("name")
+    if not package or not name:
+        return ""
+    return f"{package.replace('.', '/')}/{name}.java"
+
+
+def referenced_classes(item: Dict[str, Any]) -> Set[str]:
+    """
+    Returns the simple names of every type a class entry mentions: its parents, the types of
+    its fields and dependencies, and its method signatures. Generic arguments are included,
+    so List<OrderDto> references OrderDto.
+    """
+    types = names(item.get("extends")) + names(item.get("implements"))
+    for member in dicts(item.get("fields")) + dicts(item.get("dependencies")):
+        types.append(str(member.get("type") or ""))
+    for method in dicts(item.get("methods")):
+        types.append(str(method.get("return_type", method.get("returnType")) or ""))
+        types.extend(
+            str(parameter.get("type") or "") for parameter in dicts(method.get("parameters"))
+        )
+    return {simple_name(name) for text in types for name in TYPE_NAMES.findall(text)}
+
+
+def simple_name(name: str) -> str:
+    """
+    Reduces "com.example.Base<T>" to "Base".
+    """
+    return name.split("<", 1)[0].strip().rsplit(".", 1)[-1]
+
+
+def names(value: Any) -> List[str]:
+    """
+    Reads a list of class names; extends / implements are lists in the prompt, but models
+    also return a single name.
+    """
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        return []
+    return [str(name) for name in value if name]
+
+
+def dicts(value: Any) -> List[Dict[str, Any]]:
+    """
+    Reads a list of objects, skipping anything else.
+    """
+    if not isinstance(value, list):
+        return []
+    return [item for item in value if isinstance(item, dict)]
@@ -0,0 +1,159 @@
+import json
+import re
+from typing import Any, List
+
+# Outside of strings: a whole string without escapes or control characters (skipped in one
+# step), or a character that changes the scanner state.
+_STRUCTURAL = re.compile(r'"[^"\\\x00-\x1f]*"|["{}]')
+# Inside a string: a character that ends the string or needs repairing.
+_IN_STRING = re.compile(r'["\\\x00-\x1f]')
+
+_VALID_ESCAPES = frozenset('"\\/bfnrtu')
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+# strict=False lets the C decoder accept raw control characters (e.g. newlines) in strings.
+_LENIENT_DECODER = json.JSONDecoder(strict=False)
+
+
+class IncrementalJSONExtractor:
+    """
+    A single-pass, tolerant extractor for the JSON object embedded in an LLM response.
+
+    Models often wrap the object in prose or a ```json fence, put raw newlines inside string
+    values and occasionally emit invalid escapes such as \\'. The extractor skips everything
+    before the first "{", repairs those string issues on the fly and stops at the brace that
+    closes the outermost object, so trailing text is ignored. It can be fed a token stream
+    chunk by chunk; the work done per chunk is proportional to the chunk's size.
+    """
+
+    def __init__(self) -> None:
+        self.started = False
+        self.complete = False
+        self._depth = 0
+        self._in_string = False
+        self._pending_escape = False
+        self._raw: List[str] = []
+        self._parts: List[str] = []
+
+    def feed(self, chunk: str) -> None:
+        """
+        Consumes the next chunk of the response.
+        """
+        if self.complete or not chunk:
+            return
+
+        pos = 0
+        if not self.started:
+            pos = chunk.find("{")
+            if pos == -1:
+                return
+            self.started = True
+
+        end = self._scan(chunk, pos)
+        self._raw.append(chunk[pos:end])
+
+    def text(self) -> str:
+        """
+        Returns the repaired JSON text consumed so far.
+        """
+        return "".join(self._parts)
+
+    def result(self) -> Any:
+        """
+        Decodes the extracted object.
+
+        :raises ValueError: If the response did not contain a JSON object.
+        :raises json.JSONDecodeError: If the extracted object is truncated or malformed.
+        """
+        if not self.started:
+            raise ValueError("No valid JSON object found in model response")
+        try:
+            return _LENIENT_DECODER.raw_decode("".join(self._raw))[0]
+        except json.JSONDecodeError:
+            # Only invalid escapes get here; the repaired text has them fixed.
+            return json.loads(self.text())
+
+    def _scan(self, chunk: str, pos: int) -> int:
+        """
+        Scans chunk[pos:], writing the repaired text, and returns where the scan stopped.
+        """
+        parts = self._parts
+        length = len(chunk)
+        if self._pending_escape:
+            self._pending_escape = False
+            pos = self._write_escape(chunk, pos)
+
+        while pos < length:
+            if self._in_string:
+                match = _IN_STRING.search(chunk, pos)
+                if match is None:
+                    parts.append(chunk[pos:])
+                    return length
+                idx = match.start()
+                parts.append(chunk[pos:idx])
+                char = chunk[idx]
+                if char == '"':
+                    parts.append('"')
+                    self._in_string = False
+                    pos = idx + 1
+                elif char == "\\":
+                    if idx + 1 == length:
+                        self._pending_escape = True
+                        return length
+                    pos = self._write_escape(chunk, idx + 1)
+                else:
+                    parts.append(_CONTROL_ESCAPES.get(char) or "\\u%04x" % ord(char))
+                    pos = idx + 1
+            else:
+                match = _STRUCTURAL.search(chunk, pos)
+                if match is None:
+                    parts.append(chunk[pos:])
+                    return length
+                end = match.end()
+                parts.append(chunk[pos:end])
+                pos = end
+                token = match.group()
+                if token == '"':
+                    self._in_string = True
+                elif token == "{":
+                    self._depth += 1
+                elif token == "}":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self.complete = True
+                        return pos
+        return length
+
+    def _write_escape(self, chunk: str, pos: int) -> int:
+        """
+        Writes the escape sequence whose backslash preceded chunk[pos]. Invalid escapes keep
+        their character and get the backslash itself escaped.
+        """
+        char = chunk[pos]
+        if char in _VALID_ESCAPES:
+            self._parts.append("\\" + char)
+        elif char < " ":
+            self._parts.append(
+                "\\\\" + (_CONTROL_ESCAPES.get(char) or "\\u%04x" % ord(char))
+            )
+        else:
+            self._parts.append("\\\\" + char)
+        return pos + 1
+
+
+def extract_json_object(raw_response: str) -> Any:
+    """
+    Extracts and decodes the outermost JSON object from a complete LLM response.
+
+    Well-formed objects (raw newlines in strings included) are decoded by the C decoder in a
+    single pass; only responses it rejects go through the repairing scanner.
+    """
+    start_idx = raw_response.find("{")
+    if start_idx == -1:
+        raise ValueError("No valid JSON object found in model response")
+    try:
+        return _LENIENT_DECODER.raw_decode(raw_response, start_idx)[0]
+    except json.JSONDecodeError:
+        extractor = IncrementalJSONExtractor()
+        extractor.feed(raw_response)
+        return json.loads(extractor.text())
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    """
+    A content-addressed cache for raw LLM responses.
+
+    Entries are keyed by a hash of the model, the canonicalized messages and the sampling
+    parameters, so a retried or replayed request is served without calling the provider.
+    Lookups go through an in-memory LRU tier first and fall back to an optional SQLite tier
+    that survives process restarts. Both tiers honour the same TTL.
+    """
+
+    def __init__(
+        self,
+        max_memory_entries: int = 256,
+        ttl_seconds: Optional[float] = None,
+        path: Optional[str] = None,
+        max_disk_entries: int = 5000,
+    ) -> None:
+        """
+        :param max_memory_entries: The maximum number of responses kept in memory.
+        :param ttl_seconds: How long an entry stays valid. None means entries never expire.
+        :param path: The SQLite file used as the persistent tier. None disables it.
+        :param max_disk_entries: The maximum number of responses kept in the SQLite file.
+        """
+        self.max_memory_entries = max_memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._memory: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_response_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(
+        model: str, messages: List[Dict[str, Any]], params: Dict[str, Any]
+    ) -> str:
+        """
+        Builds the cache key for a completion request.
+
+        :param model: The provider-qualified model name.
+        :param messages: The messages sent to the model.
+        :param params: The sampling parameters (temperature, response_format, ...).
+        :return: A hex digest identifying the request.
+        """
+        canonical = json.dumps(
+            {"model": model, "messages": messages, "params": params},
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns the cached response for the key, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._is_expired(entry[0], now):
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._memory[key]
+
+            value = self._disk_get(key, now)
+            if value is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.disk_hits += 1
+            self._memory_set(key, value, now)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        """
+        Stores a response in every tier.
+        """
+        now = time.time()
+        with self._lock:
+            self._memory_set(key, value, now)
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_response_cache VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                self._db.execute(
+                    "DELETE FROM llm_response_cache WHERE key IN ("
+                    " SELECT key FROM llm_response_cache"
+                    " ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,),
+                )
+                self._db.commit()
+            except sqlite3.Error as exc:
+                logger.warning("Failed to persist LLM response cache entry: %s", exc)
+
+    def clear(self) -> None:
+        """
+        Drops every entry from both tiers.
+        """
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_response_cache")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the hit/miss counters and the current in-memory size.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "memory_entries": len(self._memory),
+            }
+
+    def _is_expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+
+    def _memory_set(self, key: str, value: str, stored_at: float) -> None:
+        self._memory[key] = (stored_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str, now: float) -> Optional[str]:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT value, created_at FROM llm_response_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            if self._is_expired(row[1], now):
+                self._db.execute("DELETE FROM llm_response_cache WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute(
+                "UPDATE llm_response_cache SET accessed_at = ? WHERE key = ?",
+                (now, key),
+            )
+            self._db.commit()
+            return row[0]
+        except sqlite3.Error as exc:
+            logger.warning("Failed to read LLM response cache entry: %s", exc)
+            return None
+
+
+_default_cache: Optional[LLMResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[LLMResponseCache]:
+    """
+    Returns the process-wide response cache configured by settings.LLM_RESPONSE_CACHE, or
+    None when caching is disabled.
+    """
+    global _default_cache
+    config = getattr(settings, "LLM_RESPONSE_CACHE", {})
+    if not config.get("ENABLED", False):
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMResponseCache(
+                max_memory_entries=config.get("MAX_MEMORY_ENTRIES", 256),
+                ttl_seconds=config.get("TTL_SECONDS"),
+                path=config.get("PATH"),
+                max_disk_entries=config.get("MAX_DISK_ENTRIES", 5000),
+            )
+        return _default_cache
@@ -0,0 +1,168 @@
+import asyncio
+import importlib.util
+import logging
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+import aisuite as ai
+import anthropic
+import httpx
+import openai
+from aisuite.provider import ProviderFactory
+from django.conf import settings
+
+from .fake_llm import get_fake_llm
+
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
+# Providers whose SDK client accepts a pre-built httpx client.
+_HTTPX_PROVIDERS = ("openai", "anthropic")
+
+_client: Optional[ai.Client] = None
+_anthropic_client: Optional[anthropic.Anthropic] = None
+_openai_client: Optional[openai.OpenAI] = None
+_client_lock = threading.Lock()
+_async_openai_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, openai.AsyncOpenAI]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _pool_config() -> Dict[str, Any]:
+    config = {
+        "MAX_CONNECTIONS": 50,
+        "MAX_KEEPALIVE_CONNECTIONS": 20,
+        "KEEPALIVE_EXPIRY": 60.0,
+        "HTTP2": True,
+        "TIMEOUT": 600.0,
+    }
+    config.update(getattr(settings, "LLM_CLIENT_POOL", {}))
+    return config
+
+
+def _httpx_options() -> Dict[str, Any]:
+    """
+    Returns the keyword arguments shared by the pooled sync and async httpx clients.
+    """
+    config = _pool_config()
+    http2 = config["HTTP2"] and importlib.util.find_spec("h2") is not None
+    if config["HTTP2"] and not http2:
+        logger.info("HTTP/2 requested for LLM clients but 'h2' is not installed.")
+    return {
+        "limits": httpx.Limits(
+            max_connections=config["MAX_CONNECTIONS"],
+            max_keepalive_connections=config["MAX_KEEPALIVE_CONNECTIONS"],
+            keepalive_expiry=config["KEEPALIVE_EXPIRY"],
+        ),
+        "timeout": httpx.Timeout(config["TIMEOUT"], connect=10.0),
+        "http2": http2,
+    }
+
+
+def get_client() -> ai.Client:
+    """
+    Returns the process-wide aisuite client shared by every LLMWrapper.
+
+    Each provider SDK that supports it gets a pooled httpx client, so connections, keep-alive
+    and TLS sessions are reused across requests and threads. Providers are still created
+    lazily on their first call, as aisuite does by default.
+
+    When settings.LLM_FAKE is enabled, this and the other client getters return the fake
+    LLM's stand-ins instead.
+    """
+    fake = get_fake_llm()
+    if fake is not None:
+        return fake.chat_client
+    return _get_client()
+
+
+def _get_client() -> ai.Client:
+    global _client
+    with _client_lock:
+        if _client is None:
+            client = ai.Client()
+            # Assign a fresh dict: aisuite's default provider_configs is a shared mutable default.
+            # Retries are handled by LLMWrapper, so the SDKs' own retries are turned off.
+            client.provider_configs = {
+                provider: {
+                    "http_client": httpx.Client(**_httpx_options()),
+                    "max_retries": 0,
+                }
+                for provider in _HTTPX_PROVIDERS
+            }
+            _client = client
+        return _client
+
+
+def warm_up_provider(provider: str) -> None:
+    """
+    Creates the shared client's provider SDK client now rather than on its first call.
+    """
+    if get_fake_llm() is not None:
+        return
+    client = _get_client()
+    with _client_lock:
+        if provider not in client.providers:
+            client.providers[provider] = ProviderFactory.create_provider(
+                provider, client.provider_configs.get(provider, {})
+            )
+
+
+def get_async_openai_client() -> openai.AsyncOpenAI:
+    """
+    Returns the pooled async OpenAI client for the running event loop.
+
+    Async connection pools are bound to the loop they were opened on, so one client is kept
+    per loop (in practice one per ASGI worker).
+    """
+    fake = get_fake_llm()
+    if fake is not None:
+        return fake.async_openai_client
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        client = _async_openai_clients.get(loop)
+        if client is None:
+            client = openai.AsyncOpenAI(
+                http_client=httpx.AsyncClient(**_httpx_options()), max_retries=0
+            )
+            _async_openai_clients[loop] = client
+        return client
+
+
+def get_anthropic_client() -> anthropic.Anthropic:
+    """
+    Returns the process-wide pooled Anthropic client.
+
+    aisuite reduces Anthropic responses to their text, dropping token usage, and passes
+    message content through as plain strings, so requests that need prompt cache markers or
+    cache usage go through the SDK directly.
+    """
+    fake = get_fake_llm()
+    if fake is not None:
+        return fake.anthropic_client
+    return _get_anthropic_client()
+
+
+def _get_anthropic_client() -> anthropic.Anthropic:
+    global _anthropic_client
+    with _client_lock:
+        if _anthropic_client is None:
+            _anthropic_client = anthropic.Anthropic(
+                http_client=httpx.Client(**_httpx_options()), max_retries=0
+            )
+        return _anthropic_client
+
+
+def get_openai_client() -> openai.OpenAI:
+    """
+    Returns the process-wide pooled OpenAI client, for OpenAI endpoints aisuite does not
+    cover (files and batches).
+    """
+    global _openai_client
+    with _client_lock:
+        if _openai_client is None:
+            _openai_client = openai.OpenAI(
+                http_client=httpx.Client(**_httpx_options()), max_retries=0
+            )
+        return _openai_client
@@ -1,101 +1,728 @@
+import asyncio
 import json
-from typing import List, Dict
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Any, Callable, List, Dict, Optional, Tuple
 import logging
-import re
+import threading
+import time
 
-import aisuite as ai
-from .types import LLMResponse
+from .json_extractor import IncrementalJSONExtractor, extract_json_object
+from .llm_cache import LLMResponseCache, get_default_cache
+from .llm_clients import (
+    get_anthropic_client,
+    get_async_openai_client,
+    get_client,
+    warm_up_provider,
+)
+from .prompt_cache import anthropic_messages, anthropic_usage, empty_usage, openai_usage
+from .rate_limiter import estimate_tokens, get_governor
+from .repair import arepair_response, repair_config, repair_response
+from .resilience import (
+    HedgeCancelled,
+    acall_with_hedging,
+    acall_with_retries,
+    call_with_hedging,
+    call_with_retries,
+    get_policy,
+)
+from .schemas import get_schema
+from .streaming import JSONStringFieldStreamer, token_stream
+from .telemetry import LLMCall
+from .token_budget import get_token_counter
+from .types import AgentType, LLMResponse, LLMUsage
+
+if TYPE_CHECKING:
+    from .batch import LLMBatch
 
 # Create a logger for this module.
 logger = logging.getLogger(__name__)
 
+# Sentinel meaning "use the cache configured in settings".
+_DEFAULT_CACHE = object()
+
+# Anthropic requires an explicit output limit; this is Claude 3.5 Sonnet's maximum.
+ANTHROPIC_MAX_TOKENS = 8192
+
 
 class LLMWrapper:
     """
     A wrapper around an AI client for processing messages and retrieving structured responses.
     """
 
-    def __init__(self, model: str = "openai:o1-mini-2024-09-12") -> None:
+    def __init__(
+        self,
+        model: str = "openai:o1-mini-2024-09-12",
+        cache: Optional[LLMResponseCache] = _DEFAULT_CACHE,
+        agent_type: Optional[AgentType] = None,
+        repair: bool = True,
+        regenerate: bool = True,
+    ) -> None:
         """
-        Initializes the LLMWrapper with the default AI client and model.
+        Initializes the LLMWrapper with the shared AI client and model.
+
+        :param model: The provider-qualified model name.
+        :param cache: The response cache to use. Defaults to the cache configured in settings;
+            pass None to always call the provider.
+        :param agent_type: The agent making the calls, used to label telemetry.
+        :param repair: Whether to repair or regenerate responses that fail to parse
+            (settings.LLM_REPAIR).
+        :param regenerate: Whether a response the repair model can't fix is regenerated
+            with this model (if LLM_REPAIR["REGENERATE"] also allows it).
         """
-        self.client = ai.Client()
+        self.client = get_client()
+        self.agent_type = agent_type
+        self.repair = repair
+        self.regenerate = regenerate
+        self.provider = model.split(":", 1)[0]
         self.model = model  # "anthropic:claude-3-5-sonnet-20241022" # o1-mini-2024-09-12, o1-2024-12-17, gpt-4o-2024-08-06, o1-preview-2024-09-12
+        self.cache = get_default_cache() if cache is _DEFAULT_CACHE else cache
+        self.governor = get_governor(model)
+        self.resilience = get_policy(model)
+
+    def warm_up(self) -> None:
+        """
+        Builds the provider client and loads the model's token encoding, so the first
+        request doesn't pay for either.
+        """
+        if self.provider == "anthropic":
+            get_anthropic_client()
+        else:
+            warm_up_provider(self.provider)
+        get_token_counter(self.model)
 
     def get_response(
-        self, messages: List[Dict[str, str]], expected_fields: Dict[str, str]
+        self,
+        messages: List[Dict[str, str]],
+        expected_fields: Dict[str, str],
+        use_cache: bool = True,
+        on_token: Optional[Callable[[str], None]] = None,
     ) -> LLMResponse:
         """
         Gets a response from the LLM.
+
+        Identical requests are answered from the response cache. A response is only cached
+        once it has been parsed successfully, so a malformed completion is never replayed.
+        A completion that doesn't parse or validate is repaired or regenerated (see
+        _recover_response) before the call fails.
+
+        :param on_token: If given, the completion is streamed and the text of the
+            "response_message" field is passed to this callback as it arrives. If the
+            response has to be recovered, the streamed text is reset (see TokenStream) and
+            the recovered message is sent instead.
+        """
+        stream = token_stream(on_token) if on_token is not None else None
+        call = self._start_call()
+        with call.track():
+            cache_key, raw_response = self._get_cached_completion(messages, use_cache)
+            cache_hit = raw_response is not None
+            parsed_response = None
+            usage = empty_usage()
+            if not cache_hit and stream is not None:
+                # Parse the object while it streams in, so nothing is left to do at the end.
+                streamer = JSONStringFieldStreamer(
+                    expected_fields.get("response_message", ""), stream
+                )
+                extractor = IncrementalJSONExtractor()
+
+                def on_text(text: str) -> None:
+                    streamer.feed(text)
+                    extractor.feed(text)
+
+                raw_response, usage = self._stream_completion(messages, on_text, call)
+                started = time.monotonic()
+                try:
+                    parsed_response = self._parse_extracted(extractor)
+                except ValueError:
+                    # _build_response parses it again and reports the error.
+                    parsed_response = None
+                call.parse_time = time.monotonic() - started
+            elif not cache_hit:
+                raw_response, usage = self._get_completion(messages, call)
+
+            try:
+                resp = self._build_response(
+                    raw_response,
+                    expected_fields,
+                    cache_key,
+                    cache_hit,
+                    usage,
+                    parsed_response,
+                    call,
+                )
+            except ValueError as exc:
+                resp = self._recover_response(
+                    messages, raw_response, exc, expected_fields, cache_key, usage, call
+                )
+                if stream is not None:
+                    # The streamed text was the broken completion's.
+                    stream.reset()
+                    stream(resp.get("response_message") or "")
+            call.finish(self._outcome(call, cache_hit))
+        if cache_hit and stream is not None:
+            stream(resp.get("response_message") or "")
+        return resp
+
+    async def aget_response(
+        self,
+        messages: List[Dict[str, str]],
+        expected_fields: Dict[str, str],
+        use_cache: bool = True,
+    ) -> LLMResponse:
+        """
+        Async variant of get_response. The provider call is awaited on the running event loop,
+        so many requests can be in flight without holding a thread each.
+        """
+        call = self._start_call()
+        with call.track():
+            cache_key, raw_response = self._get_cached_completion(messages, use_cache)
+            cache_hit = raw_response is not None
+            usage = empty_usage()
+            if not cache_hit:
+                raw_response, usage = await self._aget_completion(messages, call)
+            try:
+                resp = self._build_response(
+                    raw_response, expected_fields, cache_key, cache_hit, usage, call=call
+                )
+            except ValueError as exc:
+                resp = await self._arecover_response(
+                    messages, raw_response, exc, expected_fields, cache_key, usage, call
+                )
+            call.finish(self._outcome(call, cache_hit))
+        return resp
+
+    def _start_call(self) -> LLMCall:
+        """
+        Starts the telemetry record of one call.
+        """
+        agent_type = self.agent_type.name if self.agent_type is not None else "unknown"
+        return LLMCall(agent_type, self.model)
+
+    @staticmethod
+    def _outcome(call: LLMCall, cache_hit: bool) -> str:
+        if call.recovery is not None:
+            return call.recovery
+        return "cache_hit" if cache_hit else "success"
+
+    def get_batch_response(
+        self,
+        messages: List[Dict[str, str]],
+        expected_fields: Dict[str, str],
+        batch: "LLMBatch",
+        use_cache: bool = True,
+    ) -> "Future[LLMResponse]":
         """
+        Queues the request on a batch instead of calling the provider right away. Cached
+        responses resolve immediately; the rest resolve once batch.run() has finished.
 
+        :param batch: The LLMBatch collecting the requests.
+        :return: A future for the LLMResponse get_response would have returned.
+        """
+        cache_key, raw_response = self._get_cached_completion(messages, use_cache)
+        if raw_response is None:
+            return batch.add(self, messages, expected_fields, cache_key)
+
+        future: "Future[LLMResponse]" = Future()
         try:
-            raw_response = self._get_completion(messages)
-            logger.info(raw_response)
-            # print to be removed after logging works properly
-            print(raw_response)
+            future.set_result(
+                self._build_response(
+                    raw_response, expected_fields, cache_key, True, empty_usage()
+                )
+            )
+        except ValueError as exc:
+            future.set_exception(exc)
+        return future
+
+    def _get_cached_completion(
+        self, messages: List[Dict[str, str]], use_cache: bool
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Looks the request up in the response cache.
+
+        :return: The cache key (None when caching is off) and the cached response, if any.
+        """
+        if self.cache is None or not use_cache:
+            return None, None
+        cache_key = self.cache.make_key(self.model, messages, self._completion_params())
+        return cache_key, self.cache.get(cache_key)
 
+    def _build_response(
+        self,
+        raw_response: str,
+        expected_fields: Dict[str, str],
+        cache_key: Optional[str],
+        cache_hit: bool,
+        usage: LLMUsage,
+        parsed_response: Optional[Dict[str, Any]] = None,
+        call: Optional[LLMCall] = None,
+    ) -> LLMResponse:
+        """
+        Parses a raw completion into an LLMResponse and caches it if it came from the provider.
+
+        :param usage: The provider's token usage for the completion.
+        :param parsed_response: The already decoded object, if it was parsed while streaming.
+        :param call: The telemetry record to add the parse time and usage to.
+        """
+        logger.debug("%s response: %s", self.model, raw_response)
+
+        if call is not None:
+            call.usage = usage
+        if parsed_response is None:
+            started = time.monotonic()
             parsed_response = self.parse_response(raw_response)
-            if not all(key in parsed_response for key in expected_fields.values()):
-                raise ValueError("Missing required fields in the model response.")
+            if call is not None:
+                call.parse_time = time.monotonic() - started
+        if not all(key in parsed_response for key in expected_fields.values()):
+            raise ValueError("Missing required fields in the model response.")
+        parsed_response = self._validate_elements(parsed_response, expected_fields, call)
+
+        if cache_key is not None and not cache_hit:
+            self.cache.set(cache_key, raw_response)
 
-            resp = LLMResponse()
-            resp["raw_response"] = raw_response
+        resp = LLMResponse()
+        resp["raw_response"] = raw_response
+        resp["model"] = self.model
+        resp["usage"] = usage
 
-            for key, value in expected_fields.items():
-                resp[key] = parsed_response[value]
+        for key, value in expected_fields.items():
+            resp[key] = parsed_response[value]
 
+        return resp
+
+    def _recover_response(
+        self,
+        messages: List[Dict[str, str]],
+        raw_response: str,
+        error: ValueError,
+        expected_fields: Dict[str, str],
+        cache_key: Optional[str],
+        usage: LLMUsage,
+        call: Optional[LLMCall] = None,
+    ) -> LLMResponse:
+        """
+        Recovers from a completion that didn't parse or validate. First only the broken
+        response and the error go to the repair model, which takes seconds; only if that
+        fails (and regeneration is on) is the whole request sent to this model again.
+
+        :param error: Why the completion was unusable.
+        :param usage: The failed completion's token usage, reported with a repaired response.
+        :raises ValueError: The original error, if repair is off, or the regenerated
+            response's error.
+        """
+        if not self.repair:
+            raise error
+        repaired = repair_response(
+            self.agent_type, raw_response, error, expected_fields
+        )
+        resp = self._use_repaired(repaired, expected_fields, cache_key, usage, call)
+        if resp is not None:
+            return resp
+        if not self.regenerate or not repair_config()["REGENERATE"]:
+            raise error
+
+        logger.warning("%s: regenerating after an unusable response", self.model)
+        if call is not None:
+            call.recovery = "regenerated"
+        raw_response, usage = self._get_completion(messages, call)
+        return self._build_response(
+            raw_response, expected_fields, cache_key, False, usage, call=call
+        )
+
+    async def _arecover_response(
+        self,
+        messages: List[Dict[str, str]],
+        raw_response: str,
+        error: ValueError,
+        expected_fields: Dict[str, str],
+        cache_key: Optional[str],
+        usage: LLMUsage,
+        call: Optional[LLMCall] = None,
+    ) -> LLMResponse:
+        """
+        Async variant of _recover_response.
+        """
+        if not self.repair:
+            raise error
+        repaired = await arepair_response(
+            self.agent_type, raw_response, error, expected_fields
+        )
+        resp = self._use_repaired(repaired, expected_fields, cache_key, usage, call)
+        if resp is not None:
             return resp
-        except Exception as exc:
-            # For unexpected exceptions, raise them directly
-            raise exc
+        if not self.regenerate or not repair_config()["REGENERATE"]:
+            raise error
+
+        logger.warning("%s: regenerating after an unusable response", self.model)
+        if call is not None:
+            call.recovery = "regenerated"
+        raw_response, usage = await self._aget_completion(messages, call)
+        return self._build_response(
+            raw_response, expected_fields, cache_key, False, usage, call=call
+        )
+
+    def _use_repaired(
+        self,
+        repaired: Optional[str],
+        expected_fields: Dict[str, str],
+        cache_key: Optional[str],
+        usage: LLMUsage,
+        call: Optional[LLMCall],
+    ) -> Optional[LLMResponse]:
+        """
+        Builds the response from a repaired completion and caches it under the original
+        request, so the repair isn't repeated.
 
-    def _get_completion(self, messages: List[Dict[str, str]]) -> str:
+        :return: The response, or None if there is no usable repair.
+        """
+        if repaired is None:
+            return None
+        try:
+            resp = self._build_response(
+                repaired, expected_fields, cache_key, False, usage, call=call
+            )
+        except ValueError as exc:
+            logger.warning("%s: repaired response is still unusable: %s", self.model, exc)
+            return None
+        logger.info("%s: repaired an unusable response", self.model)
+        if call is not None:
+            call.recovery = "repaired"
+        return resp
+
+    def _validate_elements(
+        self,
+        parsed_response: Dict[str, Any],
+        expected_fields: Dict[str, str],
+        call: Optional[LLMCall],
+    ) -> Dict[str, Any]:
+        """
+        Checks each expected field against its schema, dropping the invalid parts of a
+        partially valid element instead of rejecting the whole completion.
+
+        :raises SchemaValidationError: If an element has nothing valid left.
+        """
+        validated = dict(parsed_response)
+        for key in expected_fields.values():
+            schema = get_schema(key)
+            if schema is None:
+                continue
+            validated[key], dropped = schema.validate(parsed_response[key])
+            if dropped and call is not None:
+                call.dropped_elements += len(dropped)
+        return validated
+
+    def _completion_params(self) -> Dict[str, Any]:
+        """
+        Returns the sampling parameters sent with every completion request for this model.
+        """
+        if self.model.startswith("openai:o1"):
+            # current o1-preview-2024-09-12 model doesn't support response_format as json_object, o1 models support json_object start from 2024-12-17
+            return {}
+        if self.provider == "anthropic":
+            # Anthropic has no JSON mode; the prompts ask for JSON explicitly.
+            return {"temperature": 0.25}
+        return {"temperature": 0.25, "response_format": {"type": "json_object"}}
+
+    def _request_params(self, timeout: float) -> Dict[str, Any]:
+        """
+        Returns the keyword arguments for a single provider request.
+        """
+        params = self._completion_params()
+        if self.provider in ("openai", "anthropic"):
+            # Only these SDKs are known to accept a per-request timeout through aisuite.
+            params["timeout"] = timeout
+        return params
+
+    def _batch_body(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """
+        Returns the chat completion request body for a batch job.
+        """
+        return {
+            "model": self.model.split(":", 1)[1],
+            "messages": [dict(message) for message in messages],
+            **self._completion_params(),
+        }
+
+    def _get_completion(
+        self, messages: List[Dict[str, str]], call: Optional[LLMCall] = None
+    ) -> Tuple[str, LLMUsage]:
         """
         Sends a chat completion request to the AI client.
 
+        Transient failures are retried with jittered exponential backoff within the model's
+        deadline, and a slow attempt may be hedged with a duplicate request; the losing
+        request is stopped (see _request_completion).
+
         :param messages: A list of dicts containing the conversation history with 'role' and
             'content' keys.
-        :return: The AI model's response content as a string.
+        :param call: The telemetry record of the call, if any.
+        :return: The AI model's response content as a string, and the token usage.
         """
-        if self.model.startswith("openai:o1"):
-            # current o1-preview-2024-09-12 model doesn't support response_format as json_object, o1 models support json_object start from 2024-12-17
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
+
+        def attempt(timeout: float) -> Tuple[str, LLMUsage]:
+            if call is not None:
+                call.attempts += 1
+            return call_with_hedging(
+                self.resilience,
+                lambda hedge_timeout, cancelled: self._request_completion(
+                    messages, hedge_timeout, call, cancelled
+                ),
+                timeout,
             )
-        else:
-            response = self.client.chat.completions.create(
-                model=self.model,
+
+        return call_with_retries(self.resilience, attempt)
+
+    def _request_completion(
+        self,
+        messages: List[Dict[str, str]],
+        timeout: float,
+        call: Optional[LLMCall] = None,
+        cancelled: Optional[threading.Event] = None,
+    ) -> Tuple[str, LLMUsage]:
+        """
+        Sends a single chat completion request, without retries. Waiting for the rate
+        governor counts against the timeout.
+
+        :param cancelled: Set when the request has lost a hedge. If it is set by the time the
+            request is admitted, the slot is given back without sending anything; an OpenAI
+            request is streamed so it can also close its connection mid-completion. Either
+            way it raises HedgeCancelled.
+        """
+        estimated_tokens = estimate_tokens(messages)
+        queued = time.monotonic()
+        with self.governor.slot(estimated_tokens, timeout=timeout):
+            started = time.monotonic()
+            if call is not None:
+                call.add_queue_wait(started - queued)
+            timeout -= started - queued
+            if cancelled is not None and cancelled.is_set():
+                raise HedgeCancelled(f"{self.model} request lost its hedge")
+            if self.provider == "anthropic":
+                content, usage = self._request_anthropic(messages, timeout)
+            elif cancelled is not None:
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **self._request_params(timeout),
+                )
+                parts: List[str] = []
+                usage = self._read_stream(response, parts.append, cancelled)
+                content = "".join(parts)
+            else:
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    **self._request_params(timeout),
+                )
+                content = response.choices[0].message.content
+                usage = openai_usage(getattr(response, "usage", None))
+            self._record_latency(time.monotonic() - started, call)
+        self._record_usage(estimated_tokens, usage)
+        return content, usage
+
+    def _request_anthropic(
+        self, messages: List[Dict[str, str]], timeout: float
+    ) -> Tuple[str, LLMUsage]:
+        """
+        Sends a single request through the Anthropic SDK, with a cache_control marker at the
+        end of each stable prefix of the conversation.
+        """
+        system, anthropic_request = anthropic_messages(messages)
+        params = self._request_params(timeout)
+        if system is not None:
+            params["system"] = system
+        response = get_anthropic_client().messages.create(
+            model=self.model.split(":", 1)[1],
+            messages=anthropic_request,
+            max_tokens=ANTHROPIC_MAX_TOKENS,
+            # Prompt caching was still in beta for this SDK release.
+            extra_headers={"anthropic-beta": "prompt-caching-2024-07-31"},
+            **params,
+        )
+        content = "".join(
+            block.text for block in response.content if block.type == "text"
+        )
+        return content, anthropic_usage(response.usage)
+
+    def _record_latency(self, latency: float, call: Optional[LLMCall]) -> None:
+        self.resilience.record_latency(latency)
+        if call is not None:
+            call.provider_latency = latency
+
+    def _record_usage(self, estimated_tokens: int, usage: LLMUsage) -> None:
+        """
+        Logs a completion's token usage and corrects the rate governor's token estimate.
+        """
+        if not usage["prompt_tokens"]:
+            return
+        logger.debug(
+            "%s usage: %d prompt tokens (%d cached, %d cache writes), %d completion tokens",
+            self.model,
+            usage["prompt_tokens"],
+            usage["cached_tokens"],
+            usage["cache_write_tokens"],
+            usage["completion_tokens"],
+        )
+        self.governor.record_usage(
+            usage["prompt_tokens"] + usage["completion_tokens"] - estimated_tokens
+        )
+
+    def _stream_completion(
+        self,
+        messages: List[Dict[str, str]],
+        on_text: Callable[[str], None],
+        call: Optional[LLMCall] = None,
+    ) -> Tuple[str, LLMUsage]:
+        """
+        Sends a streaming chat completion request to the AI client.
+
+        A failed attempt is only retried if nothing has been streamed yet.
+
+        :param messages: A list of dicts containing the conversation history with 'role' and
+            'content' keys.
+        :param on_text: Called with each raw text delta as it arrives.
+        :param call: The telemetry record of the call, if any.
+        :return: The complete response content as a string, and the token usage.
+        """
+        if self.provider != "openai":
+            # aisuite normalizes other providers into a single finished message, so there is
+            # nothing to stream; hand the whole completion over at once.
+            content, usage = self._get_completion(messages, call)
+            on_text(content)
+            return content, usage
+
+        parts = []
+
+        def stream_once(timeout: float) -> Tuple[str, LLMUsage]:
+            estimated_tokens = estimate_tokens(messages)
+            if call is not None:
+                call.attempts += 1
+            queued = time.monotonic()
+            with self.governor.slot(estimated_tokens, timeout=timeout):
+                started = time.monotonic()
+                if call is not None:
+                    call.add_queue_wait(started - queued)
+                timeout -= started - queued
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    stream=True,
+                    # The usage arrives in a final chunk without choices.
+                    stream_options={"include_usage": True},
+                    **self._request_params(timeout),
+                )
+
+                def on_delta(delta: str) -> None:
+                    if not parts and call is not None:
+                        call.time_to_first_token = time.monotonic() - started
+                    parts.append(delta)
+                    on_text(delta)
+
+                usage = self._read_stream(response, on_delta)
+                self._record_latency(time.monotonic() - started, call)
+            self._record_usage(estimated_tokens, usage)
+            return "".join(parts), usage
+
+        return call_with_retries(
+            self.resilience, stream_once, should_retry=lambda exc: not parts
+        )
+
+    @staticmethod
+    def _read_stream(
+        response: Any,
+        on_delta: Callable[[str], None],
+        cancelled: Optional[threading.Event] = None,
+    ) -> LLMUsage:
+        """
+        Reads an OpenAI chat completion stream, passing each text delta to on_delta.
+
+        :param cancelled: If it is set between chunks, the stream is closed, which drops the
+            connection so the provider stops generating, and HedgeCancelled is raised.
+        :return: The token usage from the stream's final chunk.
+        """
+        usage = empty_usage()
+        for chunk in response:
+            if cancelled is not None and cancelled.is_set():
+                close = getattr(response, "close", None)
+                if close is not None:
+                    close()
+                raise HedgeCancelled("Request lost its hedge")
+            if getattr(chunk, "usage", None) is not None:
+                usage = openai_usage(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                on_delta(delta)
+        return usage
+
+    async def _aget_completion(
+        self, messages: List[Dict[str, str]], call: Optional[LLMCall] = None
+    ) -> Tuple[str, LLMUsage]:
+        """
+        Async variant of _get_completion.
+
+        OpenAI models are called through the SDK's native async client. aisuite only ships
+        blocking providers, so other providers run their blocking call on a worker thread.
+        """
+        if self.provider != "openai":
+            return await asyncio.to_thread(self._get_completion, messages, call)
+
+        async def attempt(timeout: float) -> Tuple[str, LLMUsage]:
+            if call is not None:
+                call.attempts += 1
+            return await acall_with_hedging(
+                self.resilience,
+                lambda hedge_timeout: self._arequest_completion(
+                    messages, hedge_timeout, call
+                ),
+                timeout,
+            )
+
+        return await acall_with_retries(self.resilience, attempt)
+
+    async def _arequest_completion(
+        self,
+        messages: List[Dict[str, str]],
+        timeout: float,
+        call: Optional[LLMCall] = None,
+    ) -> Tuple[str, LLMUsage]:
+        """
+        Async variant of _request_completion, for OpenAI models.
+        """
+        estimated_tokens = estimate_tokens(messages)
+        queued = time.monotonic()
+        async with self.governor.aslot(estimated_tokens, timeout=timeout):
+            started = time.monotonic()
+            if call is not None:
+                call.add_queue_wait(started - queued)
+            timeout -= started - queued
+            response = await get_async_openai_client().chat.completions.create(
+                model=self.model.split(":", 1)[1],
                 messages=messages,
-                temperature=0.25,
-                response_format={"type": "json_object"},
+                **self._request_params(timeout),
             )
-        return response.choices[0].message.content
+            self._record_latency(time.monotonic() - started, call)
+        usage = openai_usage(response.usage)
+        self._record_usage(estimated_tokens, usage)
+        return response.choices[0].message.content, usage
 
     def parse_response(self, raw_response: str) -> Dict[str, str]:
         # Some models return extra text before and after the JSON object, so we need to extract just the JSON portion
-        start_idx = raw_response.find("{")
-        end_idx = raw_response.rfind("}")
-        if start_idx == -1 or end_idx == -1:
-            raise ValueError("No valid JSON object found in model response")
-        json_str = raw_response[start_idx : end_idx + 1]
-        pattern = r"\"(.*?)\""
-
-        # Function to escape newlines within string literals
-        def escape_newlines(match):
-            # Replace actual newlines with escaped newlines
-            escaped_str = match.group(1).replace("\n", "\\n").replace("\r", "\\r")
-            return f'"{escaped_str}"'
-
-        # Apply the regex to escape newlines within strings
-        fixed_json_str = re.sub(pattern, escape_newlines, json_str, flags=re.DOTALL)
+        try:
+            return extract_json_object(raw_response)
+        except json.JSONDecodeError as e:
+            logger.error("JSONDecodeError: %s", e)
+            logger.error("Original JSON string: %s", raw_response)
+            raise e
 
+    def _parse_extracted(self, extractor: IncrementalJSONExtractor) -> Dict[str, str]:
+        """
+        Decodes the object collected by an extractor that has consumed the whole response.
+        """
         try:
-            parsed_response = json.loads(fixed_json_str)
-            return parsed_response
+            return extractor.result()
         except json.JSONDecodeError as e:
             logger.error("JSONDecodeError: %s", e)
-            logger.error("Original JSON string: %s", json_str)
-            logger.error("Fixed JSON string: %s", fixed_json_str)
+            logger.error("Repaired JSON string: %s", extractor.text())
             raise e
@@ -0,0 +1,56 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .telemetry import finish_request_timing, server_timing, start_request_timing
+
+
+def _server_timing_enabled() -> bool:
+    return getattr(settings, "LLM_TELEMETRY", {}).get("SERVER_TIMING", False)
+
+
+class LLMServerTimingMiddleware:
+    """
+    Adds a Server-Timing header listing the LLM calls made while handling the request
+    (agent, model, outcome and duration, plus total queue wait and parse time), so browser
+    dev tools show where a slow request spent its time.
+
+    Enabled with settings.LLM_TELEMETRY["SERVER_TIMING"]. Streamed responses send their
+    headers before the calls finish, so they get no header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not _server_timing_enabled():
+            return self.get_response(request)
+        token = start_request_timing()
+        try:
+            response = self.get_response(request)
+        finally:
+            calls = finish_request_timing(token)
+        return self._add_header(response, calls)
+
+    async def __acall__(self, request):
+        if not _server_timing_enabled():
+            return await self.get_response(request)
+        token = start_request_timing()
+        try:
+            response = await self.get_response(request)
+        finally:
+            calls = finish_request_timing(token)
+        return self._add_header(response, calls)
+
+    @staticmethod
+    def _add_header(response, calls):
+        if calls and not response.streaming:
+            response["Server-Timing"] = server_timing(calls)
+        return response
@@ -0,0 +1,197 @@
+import logging
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Union
+
+from django.conf import settings
+
+from .llm_wrapper import LLMWrapper
+from .streaming import token_stream
+from .types import AgentType, LLMResponse
+
+if TYPE_CHECKING:
+    from .batch import LLMBatch
+
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
+
+class ModelRouter:
+    """
+    Routes an agent's LLM calls through a cascade of model tiers, cheapest first.
+
+    A request starts at the cheapest tier unless it is judged complex (long history or large
+    prompt), in which case it goes straight to the strongest tier. A tier's answer is accepted
+    if it parses and has every expected field; otherwise the request escalates to the next
+    tier. The serving model and tier are recorded on the response.
+
+    ModelRouter exposes the same get_response / aget_response interface as LLMWrapper, so
+    agents use it transparently.
+    """
+
+    def __init__(
+        self,
+        agent_type: AgentType,
+        tiers: List[LLMWrapper],
+        complex_history_messages: Optional[int] = None,
+        complex_prompt_chars: Optional[int] = None,
+    ) -> None:
+        """
+        :param agent_type: The agent whose calls are routed (used for logging).
+        :param tiers: The wrappers to try, cheapest first; the last one is the strongest.
+        :param complex_history_messages: Requests with more messages skip to the last tier.
+        :param complex_prompt_chars: Requests with a larger prompt skip to the last tier.
+        """
+        self.agent_type = agent_type
+        self.tiers = tiers
+        self.complex_history_messages = complex_history_messages
+        self.complex_prompt_chars = complex_prompt_chars
+
+    @property
+    def model(self) -> str:
+        """
+        The strongest model, i.e. the one the agent would use without routing.
+        """
+        return self.tiers[-1].model
+
+    def warm_up(self) -> None:
+        """
+        Warms up every tier.
+        """
+        for tier in self.tiers:
+            tier.warm_up()
+
+    def get_response(
+        self,
+        messages: List[Dict[str, str]],
+        expected_fields: Dict[str, str],
+        use_cache: bool = True,
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> LLMResponse:
+        """
+        Gets a response from the first tier that produces a valid one. When streaming, the
+        text a failed tier already streamed is reset (see TokenStream) before the next tier
+        streams its own.
+        """
+        stream = token_stream(on_token) if on_token is not None else None
+        first_tier = self._first_tier(messages)
+        for index in range(first_tier, len(self.tiers)):
+            try:
+                response = self.tiers[index].get_response(
+                    messages, expected_fields, use_cache=use_cache, on_token=stream
+                )
+            except ValueError as exc:
+                self._on_tier_failure(index, exc)
+                if stream is not None:
+                    stream.reset()
+                continue
+            return self._on_tier_success(index, response)
+
+    async def aget_response(
+        self,
+        messages: List[Dict[str, str]],
+        expected_fields: Dict[str, str],
+        use_cache: bool = True,
+    ) -> LLMResponse:
+        """
+        Async variant of get_response.
+        """
+        first_tier = self._first_tier(messages)
+        for index in range(first_tier, len(self.tiers)):
+            try:
+                response = await self.tiers[index].aget_response(
+                    messages, expected_fields, use_cache=use_cache
+                )
+            except ValueError as exc:
+                self._on_tier_failure(index, exc)
+                continue
+            return self._on_tier_success(index, response)
+
+    def get_batch_response(
+        self,
+        messages: List[Dict[str, str]],
+        expected_fields: Dict[str, str],
+        batch: "LLMBatch",
+        use_cache: bool = True,
+    ) -> "Future[LLMResponse]":
+        """
+        Queues the request on a batch for the strongest tier. A batch has no second round to
+        escalate in, so the cascade is skipped.
+        """
+        return self.tiers[-1].get_batch_response(
+            messages, expected_fields, batch, use_cache=use_cache
+        )
+
+    def _first_tier(self, messages: List[Dict[str, str]]) -> int:
+        """
+        Returns the tier a request starts at: the strongest one for complex requests.
+        """
+        last_tier = len(self.tiers) - 1
+        if (
+            self.complex_history_messages is not None
+            and len(messages) > self.complex_history_messages
+        ):
+            return last_tier
+        if self.complex_prompt_chars is not None:
+            prompt_chars = sum(len(str(message["content"])) for message in messages)
+            if prompt_chars > self.complex_prompt_chars:
+                return last_tier
+        return 0
+
+    def _on_tier_failure(self, index: int, exc: Exception) -> None:
+        """
+        Escalates past a tier whose response could not be parsed or was incomplete
+        (JSONDecodeError is a ValueError). The last tier's failure is re-raised.
+        """
+        if index == len(self.tiers) - 1:
+            raise exc
+        logger.warning(
+            "%s: %s gave an unusable response (%s), escalating to %s",
+            self.agent_type.name,
+            self.tiers[index].model,
+            exc,
+            self.tiers[index + 1].model,
+        )
+
+    def _on_tier_success(self, index: int, response: LLMResponse) -> LLMResponse:
+        model = self.tiers[index].model
+        logger.info("%s served by tier %d (%s)", self.agent_type.name, index, model)
+        response["model"] = model
+        response["model_tier"] = index
+        return response
+
+
+def create_llm(
+    agent_type: AgentType, model: Optional[str] = None
+) -> Union[LLMWrapper, ModelRouter]:
+    """
+    Returns the LLM an agent should call.
+
+    Agent types listed in settings.LLM_ROUTING get a ModelRouter whose tiers are the
+    configured cheaper models followed by the agent's own model; every other agent gets a
+    plain LLMWrapper for its model.
+
+    :param agent_type: The type of the agent.
+    :param model: The agent's own model, or None for the LLMWrapper default.
+    """
+    final_tier = (
+        LLMWrapper(model, agent_type=agent_type)
+        if model
+        else LLMWrapper(agent_type=agent_type)
+    )
+    config: Dict[str, Any] = getattr(settings, "LLM_ROUTING", {}).get(agent_type.name)
+    if not config:
+        return final_tier
+
+    # A cheaper tier only gets its syntax repaired: instead of regenerating an unusable
+    # response with the same model, the router escalates to the next tier.
+    tiers = [
+        LLMWrapper(tier, agent_type=agent_type, regenerate=False)
+        for tier in config["TIERS"]
+        if tier != final_tier.model
+    ]
+    return ModelRouter(
+        agent_type,
+        tiers + [final_tier],
+        complex_history_messages=config.get("COMPLEX_HISTORY_MESSAGES"),
+        complex_prompt_chars=config.get("COMPLEX_PROMPT_CHARS"),
+    )
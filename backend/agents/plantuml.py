@@ -0,0 +1,185 @@
+import logging
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+
+from .java_lld import LLD_SECTIONS, TYPE_NAMES, dicts, names, simple_name
+
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
+DEFAULT_PLANTUML = {
+    # "local" compiles the java LLD to PlantUML in process; "llm" asks
+    # JavaLLDHTMLGeneratorAgent to write it.
+    "COMPILER": "local",
+    # Fall back to the LLM when the LLD can't be compiled locally.
+    "LLM_FALLBACK": True,
+}
+
+# The stereotype each LLD section's classes are shown with.
+STEREOTYPES = {
+    "controllers": "Controller",
+    "dtos": "DTO",
+    "services": "Service",
+    "repositories": "Repository",
+    "entities": "Entity",
+    "enums": None,
+    "configurations": "Configuration",
+}
+
+_VISIBILITY = {"public": "+", "private": "-", "protected": "#", "package": "~"}
+_IDENTIFIER = re.compile(r"^[A-Za-z_$][\w$]*$")
+
+
+class PlantUMLCompileError(ValueError):
+    """
+    Raised when a java LLD doesn't have the shape the compiler needs.
+    """
+
+
+def plantuml_config() -> Dict[str, Any]:
+    config = dict(DEFAULT_PLANTUML)
+    config.update(getattr(settings, "PLANTUML", {}))
+    return config
+
+
+def lld_to_plantuml(java_lld: Dict[str, Any]) -> str:
+    """
+    Compiles a java LLD document element into a PlantUML class diagram.
+
+    Every class of every section is declared with its fields and method signatures, grouped
+    by package. Inheritance (extends / implements), injected dependencies and fields whose
+    type is another class of the LLD are drawn as relations. The output depends only on the
+    input, so an unchanged LLD always produces the same diagram.
+
+    :param java_lld: The java LLD, as validated against schemas.JavaLLD.
+    :return: The diagram source, from @startuml to @enduml.
+    :raises PlantUMLCompileError: If the LLD isn't an object or has no classes.
+    """
+    if not isinstance(java_lld, dict):
+        raise PlantUMLCompileError(
+            f"java LLD must be an object, got {type(java_lld).__name__}"
+        )
+
+    classes: List[Tuple[Dict[str, Any], Optional[str]]] = []
+    for section in LLD_SECTIONS:
+        stereotype = STEREOTYPES.get(section)
+        items = java_lld.get(section) or []
+        if not isinstance(items, list):
+            raise PlantUMLCompileError(f"java LLD section '{section}' must be a list")
+        for item in items:
+            if isinstance(item, dict) and item.get("name"):
+                classes.append((item, stereotype))
+    if not classes:
+        raise PlantUMLCompileError("java LLD has no classes")
+
+    known = {simple_name(str(item["name"])) for item, _ in classes}
+    # With no namespace separator, packages are only labels and a class can be referenced
+    # by its simple name from anywhere in the diagram.
+    lines = [
+        "@startuml",
+        "set separator none",
+        "skinparam classAttributeIconSize 0",
+        "hide empty members",
+    ]
+    relations: List[str] = []
+    seen_relations: Set[str] = set()
+
+    for package, members in _by_package(classes):
+        if package:
+            lines.append(f"package {package} {{")
+        for item, stereotype in members:
+            lines.extend(_declaration(item, stereotype))
+        if package:
+            lines.append("}")
+
+    for item, _ in classes:
+        for relation in _relations(item, known):
+            if relation not in seen_relations:
+                seen_relations.add(relation)
+                relations.append(relation)
+
+    lines.extend(relations)
+    lines.append("@enduml")
+    return "\n".join(lines)
+
+
+def _by_package(
+    classes: List[Tuple[Dict[str, Any], Optional[str]]]
+) -> Iterable[Tuple[str, List[Tuple[Dict[str, Any], Optional[str]]]]]:
+    # Packages in order of first appearance, so the diagram follows the LLD's layering.
+    packages: Dict[str, List[Tuple[Dict[str, Any], Optional[str]]]] = {}
+    for item, stereotype in classes:
+        package = _text(item.get("package"))
+        if package and not all(_IDENTIFIER.match(part) for part in package.split(".")):
+            package = f'"{package}"'
+        packages.setdefault(package, []).append((item, stereotype))
+    return packages.items()
+
+
+def _declaration(item: Dict[str, Any], stereotype: Optional[str]) -> List[str]:
+    kind = _text(item.get("type")).lower()
+    name = _reference(simple_name(_text(item["name"])))
+    if "enum" in kind:
+        lines = [f"enum {name} {{"]
+        lines.extend(f"  {_text(field.get('name'))}" for field in dicts(item.get("fields")))
+        lines.append("}")
+        return lines
+
+    if "interface" in kind:
+        keyword = "interface"
+    elif "abstract" in kind:
+        keyword = "abstract class"
+    else:
+        keyword = "class"
+    header = f"{keyword} {name}"
+    if stereotype and keyword != "interface":
+        header += f" <<{stereotype}>>"
+
+    lines = [header + " {"]
+    for field in dicts(item.get("fields")) + dicts(item.get("dependencies")):
+        visibility = _VISIBILITY.get(_text(field.get("visibility")).lower(), "-")
+        lines.append(f"  {visibility}{_text(field.get('name'))} : {_text(field.get('type'))}")
+    for method in dicts(item.get("methods")):
+        visibility = _VISIBILITY.get(_text(method.get("visibility")).lower(), "+")
+        parameters = ", ".join(
+            f"{_text(parameter.get('name'))} : {_text(parameter.get('type'))}"
+            for parameter in dicts(method.get("parameters"))
+        )
+        return_type = _text(method.get("return_type", method.get("returnType"))) or "void"
+        lines.append(f"  {visibility}{_text(method.get('name'))}({parameters}) : {return_type}")
+    lines.append("}")
+    return lines
+
+
+def _relations(item: Dict[str, Any], known: Set[str]) -> List[str]:
+    name = _reference(simple_name(_text(item["name"])))
+    kind = _text(item.get("type")).lower()
+    relations = []
+    # An interface's "extends" lists interfaces, but the arrow is the same.
+    for parent in names(item.get("extends")):
+        relations.append(f"{_reference(simple_name(_text(parent)))} <|-- {name}")
+    arrow = "<|--" if "interface" in kind else "<|.."
+    for parent in names(item.get("implements")):
+        relations.append(f"{_reference(simple_name(_text(parent)))} {arrow} {name}")
+
+    for member in dicts(item.get("dependencies")) + dicts(item.get("fields")):
+        for target in TYPE_NAMES.findall(_text(member.get("type"))):
+            target = simple_name(target)
+            if target in known and target != simple_name(_text(item["name"])):
+                relations.append(f"{name} --> {_reference(target)}")
+    return relations
+
+
+def _reference(name: str) -> str:
+    if _IDENTIFIER.match(name):
+        return name
+    return '"' + name.replace('"', "'") + '"'
+
+
+def _text(value: Any) -> str:
+    # Member lines are single lines; a stray newline or brace would end the class body.
+    if value is None:
+        return ""
+    return " ".join(str(value).split()).replace("{", "(").replace("}", ")")
@@ -0,0 +1,85 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .types import LLMMessage, LLMUsage
+
+# Anthropic accepts at most four cache_control blocks per request.
+MAX_ANTHROPIC_BREAKPOINTS = 4
+
+
+def cache_breakpoints(messages: Sequence[LLMMessage]) -> Tuple[int, ...]:
+    """
+    Returns the indexes of the messages that end a stable prefix: those recorded on an
+    LLMHistory, or just the leading system prompt for a plain list.
+    """
+    breakpoints = getattr(messages, "cache_breakpoints", None)
+    if breakpoints is None:
+        breakpoints = (0,) if messages else ()
+    return tuple(sorted(set(breakpoints)))[-MAX_ANTHROPIC_BREAKPOINTS:]
+
+
+def anthropic_messages(
+    messages: Sequence[LLMMessage],
+) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """
+    Converts messages into an Anthropic request, marking each cache breakpoint with an
+    ephemeral cache_control block so the provider caches the prefix up to it.
+
+    :return: The system prompt (if the first message has the "system" role) and the messages.
+    """
+    breakpoints = cache_breakpoints(messages)
+    system = None
+    converted = []
+    for index, message in enumerate(messages):
+        if index in breakpoints:
+            content = [
+                {
+                    "type": "text",
+                    "text": message["content"],
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ]
+        else:
+            content = message["content"]
+        if index == 0 and message["role"] == "system":
+            system = content
+        else:
+            converted.append({"role": message["role"], "content": content})
+    return system, converted
+
+
+def empty_usage() -> LLMUsage:
+    return LLMUsage(
+        prompt_tokens=0, completion_tokens=0, cached_tokens=0, cache_write_tokens=0
+    )
+
+
+def openai_usage(usage: Any) -> LLMUsage:
+    """
+    Reads an OpenAI usage object. OpenAI caches prompt prefixes automatically and reports
+    the reused part as prompt_tokens_details.cached_tokens.
+    """
+    if usage is None:
+        return empty_usage()
+    details = getattr(usage, "prompt_tokens_details", None)
+    return LLMUsage(
+        prompt_tokens=usage.prompt_tokens or 0,
+        completion_tokens=usage.completion_tokens or 0,
+        cached_tokens=(getattr(details, "cached_tokens", None) or 0) if details else 0,
+        cache_write_tokens=0,
+    )
+
+
+def anthropic_usage(usage: Any) -> LLMUsage:
+    """
+    Reads an Anthropic usage object, whose input_tokens leave out cache reads and writes.
+    """
+    if usage is None:
+        return empty_usage()
+    cached_tokens = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_write_tokens = getattr(usage, "cache_creation_input_tokens", None) or 0
+    return LLMUsage(
+        prompt_tokens=usage.input_tokens + cached_tokens + cache_write_tokens,
+        completion_tokens=usage.output_tokens,
+        cached_tokens=cached_tokens,
+        cache_write_tokens=cache_write_tokens,
+    )
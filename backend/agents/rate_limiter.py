@@ -0,0 +1,301 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE_LIMITS = {
+    "REQUESTS_PER_MINUTE": 500,
+    "TOKENS_PER_MINUTE": 200_000,
+    "MAX_CONCURRENCY": 16,
+    "MIN_CONCURRENCY": 1,
+    # Calls slower than this (seconds) make the governor back off.
+    "LATENCY_TARGET": 90.0,
+    # How long to pause a model after a 429 without a Retry-After header.
+    "RATE_LIMIT_COOLDOWN": 5.0,
+}
+
+
+def is_rate_limit_error(exc: BaseException) -> bool:
+    """
+    Returns True if the exception is a provider 429 / rate-limit error.
+    """
+    if getattr(exc, "status_code", None) == 429:
+        return True
+    response = getattr(exc, "response", None)
+    return getattr(response, "status_code", None) == 429
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    """
+    Roughly estimates the prompt tokens of a message list (about four characters per token).
+    """
+    return max(1, len(json.dumps(messages, ensure_ascii=False)) // 4)
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at capacity-per-minute.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Returns how long to wait until `amount` can be consumed. Requests larger than the
+        bucket only wait for a full bucket.
+        """
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= amount
+
+    def drain(self, seconds: float, now: float) -> None:
+        """
+        Empties the bucket so nothing is admitted for roughly `seconds`.
+        """
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class RateGovernor:
+    """
+    Admits LLM calls for a single model within its requests/min and tokens/min budgets.
+
+    Callers are served strictly in arrival order. The number of concurrent calls adapts to
+    the provider: it is halved on every 429 (and the model is paused for the Retry-After
+    period), shrinks slightly when calls exceed the latency target, and grows back by one
+    slot per window of healthy calls.
+    """
+
+    def __init__(self, model: str, limits: Dict[str, Any]) -> None:
+        self.model = model
+        self.max_concurrency = limits["MAX_CONCURRENCY"]
+        self.min_concurrency = limits["MIN_CONCURRENCY"]
+        self.latency_target = limits["LATENCY_TARGET"]
+        self.rate_limit_cooldown = limits["RATE_LIMIT_COOLDOWN"]
+        self.concurrency_limit = float(self.max_concurrency)
+        self.requests = TokenBucket(limits["REQUESTS_PER_MINUTE"])
+        self.tokens = TokenBucket(limits["TOKENS_PER_MINUTE"])
+        self.in_flight = 0
+        self.rate_limited_count = 0
+        self._condition = threading.Condition()
+        self._next_ticket = 0
+        self._serving = 0
+        self._abandoned = set()
+
+    @contextmanager
+    def slot(self, estimated_tokens: int, timeout: Optional[float] = None):
+        """
+        Blocks until the call may proceed, then records its outcome when the block exits.
+
+        :param estimated_tokens: The tokens charged against the tokens/min budget.
+        :param timeout: How long to wait for admission before raising TimeoutError.
+        """
+        self.acquire(estimated_tokens, timeout)
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as exc:
+            self.release(time.monotonic() - started, exc)
+            raise
+        self.release(time.monotonic() - started)
+
+    @asynccontextmanager
+    async def aslot(self, estimated_tokens: int, timeout: Optional[float] = None):
+        """
+        Async variant of slot; waiting for admission does not block the event loop.
+        """
+        await self.aacquire(estimated_tokens, timeout)
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as exc:
+            self.release(time.monotonic() - started, exc)
+            raise
+        self.release(time.monotonic() - started)
+
+    def acquire(self, estimated_tokens: int, timeout: Optional[float] = None) -> float:
+        """
+        Waits for admission and returns the time spent waiting.
+        """
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        with self._condition:
+            ticket = self._take_ticket()
+            while True:
+                wait = self._try_admit(ticket, estimated_tokens)
+                if wait == 0:
+                    return time.monotonic() - started
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._abandon(ticket)
+                        raise TimeoutError(f"Timed out waiting for a {self.model} slot")
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._condition.wait(wait)
+
+    async def aacquire(
+        self, estimated_tokens: int, timeout: Optional[float] = None
+    ) -> float:
+        """
+        Async variant of acquire.
+        """
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        with self._condition:
+            ticket = self._take_ticket()
+        try:
+            while True:
+                with self._condition:
+                    wait = self._try_admit(ticket, estimated_tokens)
+                    if wait == 0:
+                        return time.monotonic() - started
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise TimeoutError(f"Timed out waiting for a {self.model} slot")
+                await asyncio.sleep(0.05 if wait is None else min(wait, 0.05))
+        except BaseException:
+            # Timed out or cancelled: give up our place so the queue keeps moving.
+            with self._condition:
+                self._abandon(ticket)
+            raise
+
+    def release(self, latency: float, exc: Optional[BaseException] = None) -> None:
+        """
+        Frees a slot and adapts the concurrency limit to the call's outcome.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if exc is not None and is_rate_limit_error(exc):
+                self.rate_limited_count += 1
+                self.concurrency_limit = max(
+                    self.min_concurrency, self.concurrency_limit / 2
+                )
+                cooldown = _retry_after(exc) or self.rate_limit_cooldown
+                self.requests.drain(cooldown, now)
+                logger.warning(
+                    "%s rate limited; concurrency limit now %d, pausing %.1fs",
+                    self.model,
+                    self.concurrency_limit,
+                    cooldown,
+                )
+            elif exc is None and latency > self.latency_target:
+                self.concurrency_limit = max(
+                    self.min_concurrency, self.concurrency_limit * 0.9
+                )
+            elif exc is None:
+                self.concurrency_limit = min(
+                    self.max_concurrency,
+                    self.concurrency_limit + 1 / max(self.concurrency_limit, 1),
+                )
+            self._condition.notify_all()
+
+    def record_usage(self, extra_tokens: int) -> None:
+        """
+        Charges (or refunds, if negative) the difference between the estimated and the
+        actual tokens of a finished call.
+        """
+        with self._condition:
+            self.tokens.consume(extra_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "in_flight": self.in_flight,
+                "concurrency_limit": int(self.concurrency_limit),
+                "queued": self._next_ticket - self._serving - len(self._abandoned),
+                "rate_limited": self.rate_limited_count,
+            }
+
+    def _take_ticket(self) -> int:
+        ticket = self._next_ticket
+        self._next_ticket += 1
+        return ticket
+
+    def _try_admit(self, ticket: int, estimated_tokens: int) -> Optional[float]:
+        """
+        Admits the ticket if it is at the head of the queue and the budgets allow it.
+
+        :return: 0 if admitted, otherwise a hint of how long to wait (None: until notified).
+        """
+        while self._serving in self._abandoned:
+            self._abandoned.discard(self._serving)
+            self._serving += 1
+        if ticket != self._serving or self.in_flight >= int(self.concurrency_limit):
+            return None
+        now = time.monotonic()
+        wait = max(
+            self.requests.wait_time(1, now),
+            self.tokens.wait_time(estimated_tokens, now),
+        )
+        if wait > 0:
+            return wait
+        self.requests.consume(1)
+        self.tokens.consume(estimated_tokens)
+        self.in_flight += 1
+        self._serving += 1
+        self._condition.notify_all()
+        return 0
+
+    def _abandon(self, ticket: int) -> None:
+        if ticket == self._serving:
+            self._serving += 1
+        else:
+            self._abandoned.add(ticket)
+        self._condition.notify_all()
+
+
+_governors: Dict[str, RateGovernor] = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(model: str) -> RateGovernor:
+    """
+    Returns the process-wide RateGovernor for a model, configured from
+    settings.LLM_RATE_LIMITS (the "default" entry overlaid with the model's own entry).
+    """
+    with _governors_lock:
+        governor = _governors.get(model)
+        if governor is None:
+            config = getattr(settings, "LLM_RATE_LIMITS", {})
+            limits = dict(DEFAULT_RATE_LIMITS)
+            limits.update(config.get("default", {}))
+            limits.update(config.get(model, {}))
+            governor = RateGovernor(model, limits)
+            _governors[model] = governor
+        return governor
+
+
+def get_governors() -> Dict[str, RateGovernor]:
+    """
+    Returns the governors created so far, by model.
+    """
+    with _governors_lock:
+        return dict(_governors)
@@ -0,0 +1,130 @@
+import functools
+import json
+import logging
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from django.conf import settings
+
+from .types import AgentType, LLMMessage
+
+if TYPE_CHECKING:
+    from .llm_wrapper import LLMWrapper
+
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPAIR = {
+    "ENABLED": True,
+    # A fast model that only has to re-emit the object with its syntax fixed.
+    "MODEL": "openai:gpt-4o-mini-2024-07-18",
+    # The repair model writes the whole object back, so responses longer than its output
+    # limit can't be repaired and go straight to regeneration.
+    "MAX_CHARS": 48_000,
+    # Call the original model again if the repair fails.
+    "REGENERATE": True,
+}
+
+REPAIR_PROMPT = """You repair malformed JSON produced by another model.
+
+You will receive the error a JSON parser or validator reported and the malformed output.
+Return the same content as one valid JSON object with exactly these keys: {keys}.
+
+- Fix only what is needed to make the JSON valid: quoting, escaping, commas, brackets,
+  comments and truncation (close any unfinished strings, arrays and objects).
+- Keep every value as it is. Don't summarise, shorten or add content.
+- Return only the JSON object."""
+
+
+def repair_config() -> Dict[str, Any]:
+    config = dict(DEFAULT_REPAIR)
+    config.update(getattr(settings, "LLM_REPAIR", {}))
+    return config
+
+
+def build_repair_messages(
+    raw_response: str, error: Exception, expected_fields: Dict[str, str]
+) -> List[LLMMessage]:
+    """
+    Builds the repair request: the parser error and the broken response, without the
+    conversation that produced it.
+    """
+    keys = ", ".join(json.dumps(key) for key in expected_fields.values())
+    prompt = REPAIR_PROMPT.format(keys=keys)
+    # One user message, so it works for models without a system role too.
+    return [
+        {
+            "role": "user",
+            "content": f"{prompt}\n\nError: {error}\n\nMalformed output:\n{raw_response}",
+        }
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def get_repair_llm(agent_type: Optional[AgentType], model: str) -> "LLMWrapper":
+    """
+    Returns the wrapper that sends repair requests for an agent. It doesn't cache (the
+    repaired response is cached under the original request) and doesn't repair itself.
+    """
+    from .llm_wrapper import LLMWrapper
+
+    return LLMWrapper(model, cache=None, agent_type=agent_type, repair=False)
+
+
+def _repair_llm(
+    agent_type: Optional[AgentType], raw_response: str
+) -> Optional["LLMWrapper"]:
+    config = repair_config()
+    if not config["ENABLED"]:
+        return None
+    if len(raw_response) > config["MAX_CHARS"]:
+        logger.info(
+            "Response is %d characters, too long to repair (limit %d)",
+            len(raw_response),
+            config["MAX_CHARS"],
+        )
+        return None
+    return get_repair_llm(agent_type, config["MODEL"])
+
+
+def repair_response(
+    agent_type: Optional[AgentType],
+    raw_response: str,
+    error: Exception,
+    expected_fields: Dict[str, str],
+) -> Optional[str]:
+    """
+    Asks the repair model to fix a response that failed to parse or validate.
+
+    :return: The repaired response, which has been parsed and validated, or None if repair
+        is disabled or failed.
+    """
+    llm = _repair_llm(agent_type, raw_response)
+    if llm is None:
+        return None
+    messages = build_repair_messages(raw_response, error, expected_fields)
+    try:
+        return llm.get_response(messages, expected_fields)["raw_response"]
+    except Exception as exc:
+        logger.warning("Repair with %s failed: %s", llm.model, exc)
+        return None
+
+
+async def arepair_response(
+    agent_type: Optional[AgentType],
+    raw_response: str,
+    error: Exception,
+    expected_fields: Dict[str, str],
+) -> Optional[str]:
+    """
+    Async variant of repair_response.
+    """
+    llm = _repair_llm(agent_type, raw_response)
+    if llm is None:
+        return None
+    messages = build_repair_messages(raw_response, error, expected_fields)
+    try:
+        response = await llm.aget_response(messages, expected_fields)
+    except Exception as exc:
+        logger.warning("Repair with %s failed: %s", llm.model, exc)
+        return None
+    return response["raw_response"]
@@ -0,0 +1,300 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+from django.conf import settings
+
+from .rate_limiter import get_governor, is_rate_limit_error
+
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_RESILIENCE = {
+    # Per-attempt timeout handed to the provider SDK, in seconds.
+    "TIMEOUT": 300.0,
+    # Overall budget for a call including every retry, in seconds.
+    "DEADLINE": 600.0,
+    "MAX_ATTEMPTS": 3,
+    "BACKOFF_BASE": 1.0,
+    "BACKOFF_MAX": 30.0,
+    # Fire a duplicate request once a call runs longer than this latency quantile.
+    "HEDGING": False,
+    "HEDGE_QUANTILE": 0.95,
+    "HEDGE_MIN_SAMPLES": 20,
+}
+
+_TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class HedgeCancelled(Exception):
+    """
+    Raised by a hedged request that stopped because the other request already won.
+    """
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """
+    Returns True for errors worth retrying: rate limits, timeouts, connection failures and
+    provider-side 5xx responses.
+    """
+    if is_rate_limit_error(exc) or isinstance(exc, (TimeoutError, httpx.TransportError)):
+        return True
+    # openai and anthropic share these exception names.
+    if type(exc).__name__ in ("APIConnectionError", "APITimeoutError", "InternalServerError"):
+        return True
+    status_code = getattr(exc, "status_code", None)
+    return status_code in _TRANSIENT_STATUS_CODES
+
+
+class ResiliencePolicy:
+    """
+    Deadline, retry and hedging settings for one model, together with the latency samples
+    used to decide when to hedge.
+    """
+
+    def __init__(self, model: str, config: Dict[str, Any]) -> None:
+        self.model = model
+        self.timeout = config["TIMEOUT"]
+        self.deadline = config["DEADLINE"]
+        self.max_attempts = config["MAX_ATTEMPTS"]
+        self.backoff_base = config["BACKOFF_BASE"]
+        self.backoff_max = config["BACKOFF_MAX"]
+        self.hedging = config["HEDGING"]
+        self.hedge_quantile = config["HEDGE_QUANTILE"]
+        self.hedge_min_samples = config["HEDGE_MIN_SAMPLES"]
+        self._latencies: "deque[float]" = deque(maxlen=200)
+        self._lock = threading.Lock()
+        # Threads for hedged calls: a request and its hedge each, for as many calls as the
+        # model's rate governor lets run at once. Created on the first hedged call.
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+        self._hedge_threads = 2 * get_governor(model).max_concurrency
+        self._free_hedge_threads = self._hedge_threads
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Returns the full-jitter exponential backoff before retry number `attempt` (from 1).
+        """
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        )
+
+    def record_latency(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Returns how long to wait before hedging, or None if hedging is off or there are not
+        enough latency samples yet.
+        """
+        if not self.hedging:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            samples = sorted(self._latencies)
+        return samples[min(len(samples) - 1, int(len(samples) * self.hedge_quantile))]
+
+    def reserve_hedge_threads(self) -> Optional[ThreadPoolExecutor]:
+        """
+        Reserves the two threads a hedged call needs, so neither of its requests ever waits
+        for a thread.
+
+        :return: The executor to run them on, or None if every thread is taken.
+        """
+        with self._lock:
+            if self._free_hedge_threads < 2:
+                return None
+            self._free_hedge_threads -= 2
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=self._hedge_threads,
+                    thread_name_prefix=f"llm-hedge-{self.model}",
+                )
+            return self._hedge_executor
+
+    def release_hedge_thread(self) -> None:
+        with self._lock:
+            self._free_hedge_threads += 1
+
+
+def call_with_retries(
+    policy: ResiliencePolicy,
+    call: Callable[[float], T],
+    should_retry: Optional[Callable[[BaseException], bool]] = None,
+) -> T:
+    """
+    Calls call(timeout) until it succeeds, retrying transient errors with jittered
+    exponential backoff while attempts and the overall deadline allow.
+
+    :param should_retry: An extra check that must also pass before a retry.
+    """
+    deadline = time.monotonic() + policy.deadline
+    attempt = 1
+    while True:
+        timeout = min(policy.timeout, deadline - time.monotonic())
+        try:
+            return call(timeout)
+        except Exception as exc:
+            delay = policy.backoff(attempt)
+            if (
+                not is_transient_error(exc)
+                or (should_retry is not None and not should_retry(exc))
+                or attempt >= policy.max_attempts
+                or time.monotonic() + delay >= deadline
+            ):
+                raise
+            logger.warning(
+                "%s call failed (%s), retry %d in %.1fs", policy.model, exc, attempt, delay
+            )
+            time.sleep(delay)
+            attempt += 1
+
+
+async def acall_with_retries(
+    policy: ResiliencePolicy,
+    call: Callable[[float], Awaitable[T]],
+    should_retry: Optional[Callable[[BaseException], bool]] = None,
+) -> T:
+    """
+    Async variant of call_with_retries.
+    """
+    deadline = time.monotonic() + policy.deadline
+    attempt = 1
+    while True:
+        timeout = min(policy.timeout, deadline - time.monotonic())
+        try:
+            return await call(timeout)
+        except Exception as exc:
+            delay = policy.backoff(attempt)
+            if (
+                not is_transient_error(exc)
+                or (should_retry is not None and not should_retry(exc))
+                or attempt >= policy.max_attempts
+                or time.monotonic() + delay >= deadline
+            ):
+                raise
+            logger.warning(
+                "%s call failed (%s), retry %d in %.1fs", policy.model, exc, attempt, delay
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def call_with_hedging(
+    policy: ResiliencePolicy,
+    call: Callable[[float, Optional[threading.Event]], T],
+    timeout: float,
+) -> T:
+    """
+    Calls call(timeout, cancelled). If it is still running after the policy's hedge delay, a
+    duplicate is started and whichever succeeds first wins. The loser's `cancelled` event is
+    then set; the request is expected to stop (raising HedgeCancelled) and close its
+    connection as soon as it notices, so it doesn't keep its governor slot or its tokens.
+
+    Hedged calls run on the policy's own threads. When they are all taken, the call runs
+    unhedged on the caller's thread (with `cancelled` None) instead of queueing for one.
+    """
+    hedge_after = policy.hedge_delay()
+    if hedge_after is None:
+        return call(timeout, None)
+    executor = policy.reserve_hedge_threads()
+    if executor is None:
+        logger.debug("%s hedge threads busy, calling without hedging", policy.model)
+        return call(timeout, None)
+
+    started = time.monotonic()
+    cancel_events: Dict[Future, threading.Event] = {}
+
+    def submit(request_timeout: float) -> Future:
+        cancelled = threading.Event()
+        future = executor.submit(call, request_timeout, cancelled)
+        future.add_done_callback(lambda _: policy.release_hedge_thread())
+        cancel_events[future] = cancelled
+        return future
+
+    pending = {submit(timeout)}
+    done, pending = wait(pending, timeout=hedge_after)
+    if not done:
+        logger.info("%s call exceeded %.1fs, sending hedge", policy.model, hedge_after)
+        pending.add(submit(timeout - (time.monotonic() - started)))
+    else:
+        # The hedge's thread was never used.
+        policy.release_hedge_thread()
+
+    error = None
+    try:
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+            if not pending:
+                raise error
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+    finally:
+        for future in pending:
+            cancel_events[future].set()
+
+
+async def acall_with_hedging(
+    policy: ResiliencePolicy, call: Callable[[float], Awaitable[T]], timeout: float
+) -> T:
+    """
+    Async variant of call_with_hedging; the losing request is cancelled.
+    """
+    hedge_after = policy.hedge_delay()
+    if hedge_after is None:
+        return await call(timeout)
+
+    started = time.monotonic()
+    pending = {asyncio.ensure_future(call(timeout))}
+    done, pending = await asyncio.wait(pending, timeout=hedge_after)
+    if not done:
+        logger.info("%s call exceeded %.1fs, sending hedge", policy.model, hedge_after)
+        pending.add(
+            asyncio.ensure_future(call(timeout - (time.monotonic() - started)))
+        )
+
+    error = None
+    try:
+        while True:
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            if not pending:
+                raise error
+            done, pending = await asyncio.wait(pending, return_when=FIRST_COMPLETED)
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+_policies: Dict[str, ResiliencePolicy] = {}
+_policies_lock = threading.Lock()
+
+
+def get_policy(model: str) -> ResiliencePolicy:
+    """
+    Returns the process-wide ResiliencePolicy for a model, configured from
+    settings.LLM_RESILIENCE (the "default" entry overlaid with the model's own entry).
+    """
+    with _policies_lock:
+        policy = _policies.get(model)
+        if policy is None:
+            config = getattr(settings, "LLM_RESILIENCE", {})
+            merged = dict(DEFAULT_RESILIENCE)
+            merged.update(config.get("default", {}))
+            merged.update(config.get(model, {}))
+            policy = ResiliencePolicy(model, merged)
+            _policies[model] = policy
+        return policy
@@ -0,0 +1,415 @@
+import asyncio
+import contextvars
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from enum import Enum
+from typing import (
+    Any,
+    Callable,
+    Coroutine,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
+
+from django.conf import settings
+
+from .telemetry import SCHEDULER_WAIT_SECONDS
+
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCHEDULER = {
+    # When the caller doesn't say (see generation_priority), generations that fan out into
+    # at most this many tasks are interactive and larger ones are bulk.
+    "INTERACTIVE_MAX_TASKS": 4,
+    # While bulk work is waiting, at most this many interactive tasks start in a row, so a
+    # steady stream of small edits can't starve a regeneration.
+    "INTERACTIVE_BURST": 4,
+    # How many generation tasks run at once per model, across all requests. Model entries
+    # override "default".
+    "CONCURRENCY": {"default": 6},
+}
+
+
+class Priority(str, Enum):
+    """
+    The scheduling class of a generation. Interactive tasks start before bulk ones.
+    """
+
+    INTERACTIVE = "interactive"
+    BULK = "bulk"
+
+
+# The priority of the generations started in the current context; see generation_priority.
+_current_priority: contextvars.ContextVar[Optional[Priority]] = contextvars.ContextVar(
+    "generation_priority", default=None
+)
+
+
+@contextmanager
+def generation_priority(priority: Priority) -> Iterator[None]:
+    """
+    Gives the generations started within the block the given priority: a user waiting on a
+    chat reply is interactive, offline regeneration is bulk.
+    """
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def scheduler_config() -> Dict[str, Any]:
+    config = dict(DEFAULT_SCHEDULER)
+    config.update(getattr(settings, "LLM_SCHEDULER", {}))
+    return config
+
+
+def model_concurrency(model: str) -> int:
+    """
+    Returns the number of generation tasks that may run at once for a model.
+    """
+    concurrency = dict(DEFAULT_SCHEDULER["CONCURRENCY"])
+    concurrency.update(scheduler_config()["CONCURRENCY"])
+    return max(1, int(concurrency.get(model, concurrency["default"])))
+
+
+class _Task:
+    def __init__(
+        self,
+        request: "GenerationRequest",
+        fn: Callable[..., Any],
+        args: tuple,
+    ) -> None:
+        self.request = request
+        self.fn = fn
+        self.args = args
+        # Run in a copy of the submitter's context, so the task's LLM calls are still
+        # attributed to the request that submitted it.
+        self.context = contextvars.copy_context()
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+
+    def run(self) -> None:
+        if not self.future.set_running_or_notify_cancel():
+            return
+        SCHEDULER_WAIT_SECONDS.observe(
+            time.monotonic() - self.enqueued_at,
+            self.request.model,
+            self.request.priority.value,
+        )
+        try:
+            result = self.context.run(self.fn, *self.args)
+        except BaseException as exc:
+            self.future.set_exception(exc)
+        else:
+            self.future.set_result(result)
+
+    def start(self, queue: "_ModelQueue") -> None:
+        threading.Thread(
+            target=queue._work, args=(self,), name=f"generation-{queue.model}", daemon=True
+        ).start()
+
+    def cancel(self) -> None:
+        self.future.cancel()
+
+
+class _SlotGrant:
+    """
+    A slot for a coroutine awaiting it on an event loop. Once granted, the slot is held
+    without a thread until the coroutine releases it.
+    """
+
+    def __init__(
+        self, request: "GenerationRequest", loop: asyncio.AbstractEventLoop
+    ) -> None:
+        self.request = request
+        self.loop = loop
+        self.granted: asyncio.Future = loop.create_future()
+        self.enqueued_at = time.monotonic()
+
+    def start(self, queue: "_ModelQueue") -> None:
+        SCHEDULER_WAIT_SECONDS.observe(
+            time.monotonic() - self.enqueued_at,
+            self.request.model,
+            self.request.priority.value,
+        )
+        try:
+            self.loop.call_soon_threadsafe(self._grant, queue)
+        except RuntimeError:
+            # The loop is closed, so nobody is waiting.
+            queue.release()
+
+    def cancel(self) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self.granted.cancel)
+        except RuntimeError:
+            pass
+
+    def _grant(self, queue: "_ModelQueue") -> None:
+        if self.granted.done():
+            # Cancelled while the grant was on its way; the slot goes to the next task.
+            queue.release()
+        else:
+            self.granted.set_result(None)
+
+
+_Queued = Union[_Task, _SlotGrant]
+
+
+class _ModelQueue:
+    """
+    The tasks waiting for one model, and the slots running them.
+
+    Each priority holds one queue of tasks per request. Requests of a priority take turns,
+    one task each, so a request that fans out into hundreds of files shares the model with
+    one that needs three instead of going first. At most the model's concurrency of slots
+    are taken at once. A task runs on a worker thread, which moves on to the next task
+    while there is one; a slot grant is handed to its event loop and holds the slot until
+    its coroutine releases it.
+    """
+
+    def __init__(self, model: str, concurrency: int, interactive_burst: int) -> None:
+        self.model = model
+        self.concurrency = concurrency
+        self.interactive_burst = interactive_burst
+        self.lock = threading.Lock()
+        self.pending: Dict[Priority, "OrderedDict[int, Deque[_Queued]]"] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self.running = 0
+        self._interactive_streak = 0
+
+    def put(self, task: _Queued) -> None:
+        with self.lock:
+            requests = self.pending[task.request.priority]
+            requests.setdefault(task.request.id, deque()).append(task)
+            task = self._take()
+        if task is not None:
+            task.start(self)
+
+    def release(self) -> None:
+        """
+        Frees a slot, and gives it to the next task if one is waiting.
+        """
+        with self.lock:
+            self.running -= 1
+            task = self._take()
+        if task is not None:
+            task.start(self)
+
+    def discard(self, request: "GenerationRequest") -> List[_Queued]:
+        """
+        Removes a request's tasks that haven't started.
+        """
+        with self.lock:
+            tasks = self.pending[request.priority].pop(request.id, None)
+        return list(tasks or [])
+
+    def queued(self) -> Dict[Priority, int]:
+        with self.lock:
+            return {
+                priority: sum(len(tasks) for tasks in requests.values())
+                for priority, requests in self.pending.items()
+            }
+
+    def requests(self) -> int:
+        with self.lock:
+            return sum(len(requests) for requests in self.pending.values())
+
+    def _take(self) -> Optional[_Queued]:
+        # Called with the lock held. Takes a slot for the next task, if one is free.
+        if self.running >= self.concurrency:
+            return None
+        task = self._next()
+        if task is not None:
+            self.running += 1
+        return task
+
+    def _next(self) -> Optional[_Queued]:
+        # Called with the lock held.
+        interactive = self.pending[Priority.INTERACTIVE]
+        bulk = self.pending[Priority.BULK]
+        if interactive and not (bulk and self._interactive_streak >= self.interactive_burst):
+            self._interactive_streak = self._interactive_streak + 1 if bulk else 0
+            requests = interactive
+        elif bulk:
+            self._interactive_streak = 0
+            requests = bulk
+        else:
+            return None
+
+        request_id, tasks = next(iter(requests.items()))
+        task = tasks.popleft()
+        if tasks:
+            # Round robin: the request goes behind the others of its priority.
+            requests.move_to_end(request_id)
+        else:
+            del requests[request_id]
+        return task
+
+    def _work(self, task: _Task) -> None:
+        while True:
+            try:
+                task.run()
+            finally:
+                with self.lock:
+                    self.running -= 1
+                    task = self._take()
+            if task is None:
+                return
+            if not isinstance(task, _Task):
+                task.start(self)
+                return
+
+
+class GenerationRequest:
+    """
+    The tasks one generation submits to the scheduler for one model. Its tasks share the
+    model fairly with those of other requests of the same priority.
+    """
+
+    def __init__(
+        self, scheduler: "GenerationScheduler", model: str, priority: Priority
+    ) -> None:
+        self.scheduler = scheduler
+        self.model = model
+        self.priority = priority
+        self.id = next(scheduler._ids)
+        self._queue = scheduler._queue(model)
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        """
+        Queues fn(*args) to run on a worker of the model.
+
+        :return: A future for its result.
+        """
+        task = _Task(self, fn, args)
+        self._queue.put(task)
+        return task.future
+
+    async def run_async(self, coroutine_fn: Callable[[], Coroutine]) -> Any:
+        """
+        Awaits coroutine_fn() on the current event loop once the scheduler grants it a slot.
+        The slot is held until the coroutine finishes; no thread waits on it meanwhile.
+        """
+        grant = _SlotGrant(self, asyncio.get_running_loop())
+        self._queue.put(grant)
+        try:
+            await grant.granted
+        except asyncio.CancelledError:
+            # A grant still queued is skipped when its turn comes.
+            grant.granted.cancel()
+            if not grant.granted.cancelled():
+                # Cancelled just as the slot was granted.
+                self._queue.release()
+            raise
+        try:
+            return await coroutine_fn()
+        finally:
+            self._queue.release()
+
+    def cancel(self) -> None:
+        """
+        Cancels the request's tasks that haven't started.
+        """
+        for task in self._queue.discard(self):
+            task.cancel()
+
+
+class GenerationScheduler:
+    """
+    Runs the file-level tasks of code generations within a process-wide concurrency budget
+    per model (settings.LLM_SCHEDULER), instead of each generation starting its own pool.
+
+    Interactive requests are served before bulk ones and requests of the same priority take
+    turns. Calls made by the tasks still go through the model's rate governor.
+    """
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        self.config = config
+        self._lock = threading.Lock()
+        self._queues: Dict[str, _ModelQueue] = {}
+        self._ids = itertools.count(1)
+
+    def request(
+        self, model: str, task_count: int, priority: Optional[Priority] = None
+    ) -> GenerationRequest:
+        """
+        Starts a request for a generation that will submit task_count tasks to a model.
+
+        :param priority: The request's priority. Defaults to the one set by
+            generation_priority, or else follows from its size (INTERACTIVE_MAX_TASKS).
+        """
+        if priority is None:
+            priority = _current_priority.get()
+        if priority is None:
+            priority = (
+                Priority.INTERACTIVE
+                if task_count <= self.config["INTERACTIVE_MAX_TASKS"]
+                else Priority.BULK
+            )
+        logger.debug(
+            "Generation request for %s: %d tasks, %s", model, task_count, priority.value
+        )
+        return GenerationRequest(self, model, priority)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns, by model, the queued tasks by priority, the running tasks, the requests
+        with queued tasks and the concurrency.
+        """
+        with self._lock:
+            queues = dict(self._queues)
+        return {
+            model: {
+                "queued": queue.queued(),
+                "running": queue.running,
+                "requests": queue.requests(),
+                "concurrency": queue.concurrency,
+            }
+            for model, queue in queues.items()
+        }
+
+    def _queue(self, model: str) -> _ModelQueue:
+        with self._lock:
+            queue = self._queues.get(model)
+            if queue is None:
+                queue = _ModelQueue(
+                    model, model_concurrency(model), self.config["INTERACTIVE_BURST"]
+                )
+                self._queues[model] = queue
+            return queue
+
+
+_scheduler: Optional[GenerationScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> GenerationScheduler:
+    """
+    Returns the process-wide scheduler configured by settings.LLM_SCHEDULER.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = GenerationScheduler(scheduler_config())
+        return _scheduler
+
+
+def get_scheduler_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Returns the scheduler's stats, or none if no generation has used it yet.
+    """
+    with _scheduler_lock:
+        scheduler = _scheduler
+    return scheduler.stats() if scheduler is not None else {}
@@ -0,0 +1,296 @@
+import copy
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError
+
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
+# Each salvage pass drops every element reported by one validation; nested damage (a bad
+# field, then its now incomplete parent) can take a few passes.
+MAX_SALVAGE_PASSES = 8
+
+Location = Tuple[Any, ...]
+
+
+class ElementModel(BaseModel):
+    """
+    Base for document element schemas. Only the keys the pipeline relies on are declared;
+    anything else the model adds is kept as-is.
+    """
+
+    model_config = ConfigDict(extra="allow")
+
+
+# Architecture
+
+
+class Layer(ElementModel):
+    layer_name: str
+    description: Optional[str] = None
+    primary_responsibilities: Optional[List[str]] = None
+
+
+class Service(ElementModel):
+    name: str
+    purpose_or_responsibilities: Optional[List[str]] = None
+    dependencies: Optional[List[str]] = None
+
+
+class DataFlow(ElementModel):
+    name: str
+    steps: Optional[List[str]] = None
+    critical_paths: Optional[List[str]] = None
+
+
+class RequirementCoverage(ElementModel):
+    requirement_id: Optional[str] = None
+    requirement_description: Optional[str] = None
+    coverage_details: Optional[str] = None
+
+
+class Coverage(ElementModel):
+    functional_requirements: Optional[List[RequirementCoverage]] = None
+    non_functional_requirements: Optional[List[RequirementCoverage]] = None
+
+
+class Integration(ElementModel):
+    integration_name: str
+    purpose: Optional[str] = None
+    communication_protocols: Optional[List[str]] = None
+
+
+class TradeOff(ElementModel):
+    decision: str
+    rationale: Optional[str] = None
+
+
+class Architecture(ElementModel):
+    high_level_overview: Optional[str] = None
+    layers: Optional[List[Layer]] = None
+    services: Optional[List[Service]] = None
+    data_flow: Optional[List[DataFlow]] = None
+    requirement_coverage: Optional[Coverage] = None
+    cross_cutting_concerns: Optional[Dict[str, Any]] = None
+    external_integrations: Optional[List[Integration]] = None
+    deployment_and_ci_cd: Optional[Dict[str, Any]] = None
+    trade_offs_and_rationale: Optional[List[TradeOff]] = None
+
+
+# API contracts
+
+
+class Operation(ElementModel):
+    summary: Optional[str] = None
+    parameters: Optional[List[Dict[str, Any]]] = None
+    responses: Optional[Dict[str, Dict[str, Any]]] = None
+
+
+class ApiContracts(ElementModel):
+    paths: Dict[str, Dict[str, Operation]]
+
+
+# Database schema
+
+
+class Column(ElementModel):
+    name: str
+    type: str
+
+
+class ForeignKey(ElementModel):
+    column: str
+    references: Dict[str, Any]
+
+
+class Index(ElementModel):
+    name: Optional[str] = None
+    columns: List[str]
+
+
+class Table(ElementModel):
+    name: str
+    columns: List[Column]
+    foreignKeys: Optional[List[ForeignKey]] = None
+    indexes: Optional[List[Index]] = None
+
+
+class DatabaseSchema(ElementModel):
+    name: Optional[str] = None
+    tables: List[Table]
+
+
+# Java LLD
+
+
+class JavaClass(ElementModel):
+    # The code generator places each class in a file by its package and name.
+    name: str
+    package: str
+    type: Optional[str] = None
+    fields: Optional[List[Dict[str, Any]]] = None
+    methods: Optional[List[Dict[str, Any]]] = None
+
+
+class JavaLLD(ElementModel):
+    controllers: Optional[List[JavaClass]] = None
+    dtos: Optional[List[JavaClass]] = None
+    services: Optional[List[JavaClass]] = None
+    repositories: Optional[List[JavaClass]] = None
+    entities: Optional[List[JavaClass]] = None
+    enums: Optional[List[JavaClass]] = None
+    configurations: Optional[List[JavaClass]] = None
+
+
+# React LLD and code
+
+
+class ReactComponent(ElementModel):
+    name: str
+    location: Optional[str] = None
+    props: Optional[List[Dict[str, Any]]] = None
+    state: Optional[List[Dict[str, Any]]] = None
+    children: Optional[List[str]] = None
+
+
+class ReactPage(ElementModel):
+    path: str
+    component: str
+
+
+class ReactApi(ElementModel):
+    name: str
+    location: Optional[str] = None
+
+
+class ReactLLD(ElementModel):
+    components: Optional[List[ReactComponent]] = None
+    pages: Optional[List[ReactPage]] = None
+    apis: Optional[List[ReactApi]] = None
+
+
+class ReactFile(ElementModel):
+    path: str
+    content: str
+
+
+class SchemaValidationError(ValueError):
+    """
+    Raised when a document element can't be salvaged: it has the wrong shape at the top
+    level, or every part of it is invalid.
+    """
+
+
+class ElementSchema:
+    """
+    A schema for one key of an agent's JSON response, compiled once into a TypeAdapter.
+
+    validate() checks the whole element in one pass. If that fails, the elements the
+    errors point at (a list item, a mapping entry or an optional field) are dropped and the
+    rest is validated again, so one malformed item doesn't cost the whole completion.
+    """
+
+    def __init__(self, key: str, element_type: Any) -> None:
+        self.key = key
+        self.adapter = TypeAdapter(element_type)
+
+    def validate(self, value: Any) -> Tuple[Any, List[str]]:
+        """
+        :param value: The decoded element from the model's response.
+        :return: The element with its invalid parts removed, and the location of each
+            removed part (relative to the element as it was on the pass that removed it).
+            The element is returned unchanged (not copied) when it is valid.
+        :raises SchemaValidationError: If nothing valid is left.
+        """
+        try:
+            self.adapter.validate_python(value)
+            return value, []
+        except ValidationError as exc:
+            error = exc
+
+        salvaged = copy.deepcopy(value)
+        dropped: List[str] = []
+        for _ in range(MAX_SALVAGE_PASSES):
+            targets = _drop_targets(error)
+            if not targets or any(not target for target in targets):
+                break
+            for target in targets:
+                _delete(salvaged, target)
+                dropped.append(_format_location(target))
+            try:
+                self.adapter.validate_python(salvaged)
+            except ValidationError as exc:
+                error = exc
+                continue
+            logger.warning(
+                "Salvaged %r by dropping %d invalid part(s): %s",
+                self.key,
+                len(dropped),
+                ", ".join(dropped),
+            )
+            return salvaged, dropped
+
+        raise SchemaValidationError(
+            f"The {self.key!r} element doesn't match its schema: {error}"
+        )
+
+
+def _drop_targets(error: ValidationError) -> List[Location]:
+    """
+    Maps validation errors to the locations to delete, outermost first within each
+    container and with list indexes in descending order, so deleting one doesn't shift
+    another.
+    """
+    targets = set()
+    for detail in error.errors():
+        location = tuple(detail["loc"])
+        # A missing field can't be dropped; its parent has to go instead.
+        if detail["type"] == "missing":
+            location = location[:-1]
+        targets.add(location)
+    # Drop nested locations whose ancestor is dropped anyway.
+    kept = [
+        target
+        for target in targets
+        if not any(
+            other != target and target[: len(other)] == other for other in targets
+        )
+    ]
+    return sorted(kept, reverse=True)
+
+
+def _delete(value: Any, location: Location) -> None:
+    container = value
+    for part in location[:-1]:
+        container = container[part]
+    del container[location[-1]]
+
+
+def _format_location(location: Location) -> str:
+    return ".".join(str(part) for part in location)
+
+
+RESPONSE_SCHEMAS: Dict[str, ElementSchema] = {
+    schema.key: schema
+    for schema in (
+        ElementSchema("updated functional requirements", List[str]),
+        ElementSchema("updated non functional requirements", List[str]),
+        ElementSchema("updated architecture", Architecture),
+        ElementSchema("updated api contracts", ApiContracts),
+        ElementSchema("updated database schema", DatabaseSchema),
+        ElementSchema("updated java LLD", JavaLLD),
+        ElementSchema("updated react LLD", ReactLLD),
+        ElementSchema("updated react code", List[ReactFile]),
+        ElementSchema("file content", str),
+        ElementSchema("plantuml", str),
+        ElementSchema("summary", str),
+    )
+}
+
+
+def get_schema(key: str) -> Optional[ElementSchema]:
+    """
+    Returns the schema for a response key, or None if the key isn't validated.
+    """
+    return RESPONSE_SCHEMAS.get(key)
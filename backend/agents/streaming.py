@@ -0,0 +1,163 @@
+from typing import Callable, List, Optional, Union
+
+_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class TokenStream:
+    """
+    Where a streamed response message goes. It is called with each chunk of text, like a
+    plain on_token callback, and reset() takes back everything sent so far: when a response
+    that was already streamed is repaired, regenerated or replaced by another model's, the
+    client is told to discard the text before the replacement is streamed.
+    """
+
+    def __init__(
+        self,
+        on_token: Callable[[str], None],
+        on_reset: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        :param on_token: Called with each chunk of the message.
+        :param on_reset: Called when the text sent so far is to be discarded.
+        """
+        self.on_token = on_token
+        self.on_reset = on_reset
+        self.sent = False
+
+    def __call__(self, text: str) -> None:
+        if text:
+            self.sent = True
+            self.on_token(text)
+
+    def reset(self) -> None:
+        """
+        Discards the text sent so far, if any.
+        """
+        if self.sent and self.on_reset is not None:
+            self.on_reset()
+        self.sent = False
+
+
+def token_stream(on_token: Union[TokenStream, Callable[[str], None]]) -> TokenStream:
+    """
+    Returns on_token as a TokenStream. A plain callback can't be told to discard text, so
+    resetting it does nothing.
+    """
+    if isinstance(on_token, TokenStream):
+        return on_token
+    return TokenStream(on_token)
+
+
+class JSONStringFieldStreamer:
+    """
+    Extracts the value of one top-level string field from a JSON object while it is still being
+    streamed, so e.g. the "communication" text can be shown before the completion has finished.
+
+    Feed it the raw completion chunks in order; the decoded characters of the field's value are
+    passed to on_text as soon as they arrive. Text before the first "{" is ignored, and raw
+    newlines inside strings (which some models emit) are passed through unchanged.
+    """
+
+    def __init__(self, field: str, on_text: Callable[[str], None]) -> None:
+        """
+        :param field: The top-level key whose string value should be streamed.
+        :param on_text: Called with each decoded chunk of the value.
+        """
+        self.field = field
+        self.on_text = on_text
+        self.done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._unicode: Optional[str] = None
+        self._expect_key = False
+        self._string_is_key = False
+        self._key: List[str] = []
+        self._last_key: Optional[str] = None
+        self._after_colon = False
+        self._emitting = False
+
+    def feed(self, chunk: str) -> None:
+        """
+        Consumes the next chunk of the raw completion.
+        """
+        if self.done:
+            return
+        out: List[str] = []
+        for char in chunk:
+            if self._in_string:
+                self._consume_string_char(char, out)
+                if self.done:
+                    break
+            else:
+                self._consume_structural_char(char)
+        if out:
+            self.on_text("".join(out))
+
+    def _consume_structural_char(self, char: str) -> None:
+        if char == '"':
+            self._in_string = True
+            self._string_is_key = self._depth == 1 and self._expect_key
+            self._emitting = (
+                self._depth == 1
+                and self._after_colon
+                and self._last_key == self.field
+            )
+            self._key = []
+            self._expect_key = False
+            self._after_colon = False
+        elif char in "{[":
+            self._depth += 1
+            self._expect_key = char == "{" and self._depth == 1
+            self._after_colon = False
+        elif char in "}]":
+            self._depth -= 1
+        elif char == "," and self._depth == 1:
+            self._expect_key = True
+            self._after_colon = False
+        elif char == ":" and self._depth == 1:
+            self._after_colon = True
+
+    def _consume_string_char(self, char: str, out: List[str]) -> None:
+        if self._unicode is not None:
+            self._unicode += char
+            if len(self._unicode) == 4:
+                try:
+                    self._append(chr(int(self._unicode, 16)), out)
+                except ValueError:
+                    pass
+                self._unicode = None
+            return
+        if self._escape:
+            self._escape = False
+            if char == "u":
+                self._unicode = ""
+            else:
+                self._append(_ESCAPES.get(char, char), out)
+            return
+        if char == "\\":
+            self._escape = True
+        elif char == '"':
+            self._in_string = False
+            if self._string_is_key:
+                self._last_key = "".join(self._key)
+            elif self._emitting:
+                self._emitting = False
+                self.done = True
+        else:
+            self._append(char, out)
+
+    def _append(self, text: str, out: List[str]) -> None:
+        if self._string_is_key:
+            self._key.append(text)
+        elif self._emitting:
+            out.append(text)
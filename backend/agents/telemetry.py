@@ -0,0 +1,472 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+from .types import LLMUsage
+
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+PARSE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_TELEMETRY = {
+    "SERVER_TIMING": False,
+    # Whether /metrics/ is served at all.
+    "METRICS": True,
+    # A scraper presenting this as "Authorization: Bearer <token>" may read /metrics/ from
+    # anywhere; None disables token access.
+    "METRICS_TOKEN": None,
+    # Addresses that may read /metrics/ without a token.
+    "METRICS_ALLOWED_IPS": ("127.0.0.1", "::1"),
+}
+
+
+def telemetry_config() -> Dict[str, Any]:
+    config = dict(DEFAULT_TELEMETRY)
+    config.update(getattr(settings, "LLM_TELEMETRY", {}))
+    return config
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """
+    A labelled metric family rendered in the Prometheus text exposition format.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str]) -> None:
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str]) -> None:
+        super().__init__(name, description, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Sequence[str],
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(buckets)
+        # Per label set: the count in each bucket (non-cumulative), the sum and the count.
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = ([0] * (len(self.buckets) + 1), [0.0, 0])
+                self._series[label_values] = series
+            series[0][index] += 1
+            series[1][0] += value
+            series[1][1] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = sorted(
+                (labels, (list(counts), list(totals)))
+                for labels, (counts, totals) in self._series.items()
+            )
+        lines = []
+        for labels, (counts, (total, count)) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                bucket_labels = _format_labels(
+                    self.label_names + ("le",), labels + (le,)
+                )
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {_format_value(count)}")
+        return lines
+
+
+class GaugeCallback(Metric):
+    """
+    A gauge family whose samples are read from a callback at scrape time.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[LabelValues, float]]],
+    ) -> None:
+        super().__init__(name, description, label_names)
+        self.collect = collect
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in sorted(self.collect())
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+_LABELS = ("agent_type", "model")
+
+LLM_CALLS = REGISTRY.register(
+    Counter(
+        "llm_calls_total",
+        "LLM calls by outcome (success, cache_hit, repaired, regenerated, invalid_response "
+        "or error).",
+        _LABELS + ("outcome",),
+    )
+)
+LLM_RETRIES = REGISTRY.register(
+    Counter(
+        "llm_retries_total", "Provider requests repeated after a failure.", _LABELS
+    )
+)
+LLM_TOKENS = REGISTRY.register(
+    Counter(
+        "llm_tokens_total",
+        "Tokens by kind (prompt, completion, cached, cache_write).",
+        _LABELS + ("kind",),
+    )
+)
+LLM_DROPPED_ELEMENTS = REGISTRY.register(
+    Counter(
+        "llm_dropped_elements_total",
+        "Invalid parts of partially valid responses dropped by schema validation.",
+        _LABELS,
+    )
+)
+LLM_CALL_SECONDS = REGISTRY.register(
+    Histogram(
+        "llm_call_seconds",
+        "End-to-end LLM call time, including queueing, retries and parsing.",
+        _LABELS,
+    )
+)
+LLM_QUEUE_WAIT_SECONDS = REGISTRY.register(
+    Histogram(
+        "llm_queue_wait_seconds", "Time spent waiting for the rate governor.", _LABELS
+    )
+)
+LLM_PROVIDER_SECONDS = REGISTRY.register(
+    Histogram(
+        "llm_provider_latency_seconds",
+        "Provider request latency of the successful attempt.",
+        _LABELS,
+    )
+)
+LLM_TTFT_SECONDS = REGISTRY.register(
+    Histogram(
+        "llm_time_to_first_token_seconds",
+        "Time from sending a streaming request to its first token.",
+        _LABELS,
+    )
+)
+LLM_PARSE_SECONDS = REGISTRY.register(
+    Histogram(
+        "llm_parse_seconds",
+        "Time spent extracting the JSON object from a response.",
+        _LABELS,
+        buckets=PARSE_BUCKETS,
+    )
+)
+
+
+def _governor_gauge(attribute: str) -> Callable[[], List[Tuple[LabelValues, float]]]:
+    def collect() -> List[Tuple[LabelValues, float]]:
+        from .rate_limiter import get_governors
+
+        return [
+            ((model,), governor.stats()[attribute])
+            for model, governor in get_governors().items()
+        ]
+
+    return collect
+
+
+REGISTRY.register(
+    GaugeCallback(
+        "llm_in_flight",
+        "Provider requests currently running.",
+        ("model",),
+        _governor_gauge("in_flight"),
+    )
+)
+REGISTRY.register(
+    GaugeCallback(
+        "llm_queued",
+        "Requests waiting for the rate governor.",
+        ("model",),
+        _governor_gauge("queued"),
+    )
+)
+REGISTRY.register(
+    GaugeCallback(
+        "llm_concurrency_limit",
+        "The rate governor's current adaptive concurrency limit.",
+        ("model",),
+        _governor_gauge("concurrency_limit"),
+    )
+)
+
+SCHEDULER_WAIT_SECONDS = REGISTRY.register(
+    Histogram(
+        "generation_scheduler_wait_seconds",
+        "Time a code generation task waited for the generation scheduler.",
+        ("model", "priority"),
+    )
+)
+
+
+def _scheduler_queued() -> List[Tuple[LabelValues, float]]:
+    from .scheduler import get_scheduler_stats
+
+    return [
+        ((model, priority.value), queued)
+        for model, stats in get_scheduler_stats().items()
+        for priority, queued in stats["queued"].items()
+    ]
+
+
+def _scheduler_gauge(key: str) -> Callable[[], List[Tuple[LabelValues, float]]]:
+    def collect() -> List[Tuple[LabelValues, float]]:
+        from .scheduler import get_scheduler_stats
+
+        return [((model,), stats[key]) for model, stats in get_scheduler_stats().items()]
+
+    return collect
+
+
+REGISTRY.register(
+    GaugeCallback(
+        "generation_scheduler_queued",
+        "Code generation tasks waiting for the generation scheduler.",
+        ("model", "priority"),
+        _scheduler_queued,
+    )
+)
+REGISTRY.register(
+    GaugeCallback(
+        "generation_scheduler_running",
+        "Code generation tasks currently running.",
+        ("model",),
+        _scheduler_gauge("running"),
+    )
+)
+REGISTRY.register(
+    GaugeCallback(
+        "generation_scheduler_requests",
+        "Code generations with tasks waiting for the generation scheduler.",
+        ("model",),
+        _scheduler_gauge("requests"),
+    )
+)
+
+# The LLM calls made while handling the current HTTP request, for the Server-Timing header.
+_request_calls: contextvars.ContextVar[Optional[List["LLMCall"]]] = (
+    contextvars.ContextVar("llm_request_calls", default=None)
+)
+
+
+class LLMCall:
+    """
+    Timings and token counts of one LLMWrapper call, from cache lookup to parsed response.
+
+    The wrapper fills it in as the call proceeds; finish() records it in the metrics and in
+    the current request's timings. Hedged attempts may update it from two threads; the
+    last writer wins, which is the attempt that was used.
+    """
+
+    def __init__(self, agent_type: str, model: str) -> None:
+        self.agent_type = agent_type
+        self.model = model
+        self.started = time.monotonic()
+        self.duration: Optional[float] = None
+        self.queue_wait = 0.0
+        self.provider_latency: Optional[float] = None
+        self.time_to_first_token: Optional[float] = None
+        self.parse_time: Optional[float] = None
+        self.attempts = 0
+        self.dropped_elements = 0
+        # "repaired" or "regenerated" once an unusable completion has been recovered.
+        self.recovery: Optional[str] = None
+        self.usage: Optional[LLMUsage] = None
+        self.outcome: Optional[str] = None
+
+    def add_queue_wait(self, seconds: float) -> None:
+        self.queue_wait += seconds
+
+    @contextmanager
+    def track(self):
+        """
+        Finishes the call as "invalid_response" or "error" if the block raises. The block
+        finishes it itself on success.
+        """
+        try:
+            yield self
+        except ValueError:
+            # Includes JSONDecodeError.
+            self.finish("invalid_response")
+            raise
+        except BaseException:
+            self.finish("error")
+            raise
+
+    def finish(self, outcome: str) -> None:
+        if self.outcome is not None:
+            return
+        self.outcome = outcome
+        self.duration = time.monotonic() - self.started
+        labels = (self.agent_type, self.model)
+
+        LLM_CALLS.inc(*labels, outcome)
+        LLM_CALL_SECONDS.observe(self.duration, *labels)
+        if self.attempts > 1:
+            LLM_RETRIES.inc(*labels, amount=self.attempts - 1)
+        if self.dropped_elements:
+            LLM_DROPPED_ELEMENTS.inc(*labels, amount=self.dropped_elements)
+        if self.attempts:
+            LLM_QUEUE_WAIT_SECONDS.observe(self.queue_wait, *labels)
+        if self.provider_latency is not None:
+            LLM_PROVIDER_SECONDS.observe(self.provider_latency, *labels)
+        if self.time_to_first_token is not None:
+            LLM_TTFT_SECONDS.observe(self.time_to_first_token, *labels)
+        if self.parse_time is not None:
+            LLM_PARSE_SECONDS.observe(self.parse_time, *labels)
+        if self.usage is not None:
+            for kind in ("prompt", "completion", "cached", "cache_write"):
+                LLM_TOKENS.inc(*labels, kind, amount=self.usage[f"{kind}_tokens"])
+
+        calls = _request_calls.get()
+        if calls is not None:
+            calls.append(self)
+
+        logger.info(
+            "%s %s %s in %.2fs (queue %.2fs, provider %s, ttft %s, parse %s, attempts %d)",
+            self.agent_type,
+            self.model,
+            outcome,
+            self.duration,
+            self.queue_wait,
+            _seconds(self.provider_latency),
+            _seconds(self.time_to_first_token),
+            _seconds(self.parse_time),
+            self.attempts,
+        )
+
+
+def _seconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.3f}s"
+
+
+def start_request_timing() -> contextvars.Token:
+    """
+    Starts collecting the LLM calls made in the current context (an HTTP request).
+    """
+    return _request_calls.set([])
+
+
+def finish_request_timing(token: contextvars.Token) -> List[LLMCall]:
+    """
+    Stops collecting and returns the calls made since start_request_timing.
+    """
+    calls = _request_calls.get() or []
+    _request_calls.reset(token)
+    return calls
+
+
+def server_timing(calls: List[LLMCall]) -> str:
+    """
+    Formats LLM calls as a Server-Timing header value: one entry per call, plus the total
+    queue wait and parse time.
+    """
+    entries = [
+        f"llm;dur={call.duration * 1000:.1f};"
+        f'desc="{call.agent_type} {call.model} {call.outcome}"'
+        for call in calls
+    ]
+    entries.append(f"llm-queue;dur={sum(c.queue_wait for c in calls) * 1000:.1f}")
+    entries.append(f"llm-parse;dur={sum(c.parse_time or 0 for c in calls) * 1000:.1f}")
+    return ", ".join(entries)
@@ -0,0 +1,75 @@
+import functools
+import logging
+from typing import Optional
+
+from django.conf import settings
+
+from .types import LLMMessage
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+# Create a logger for this module.
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTEXT_BUDGET = 100_000
+
+# Tokens the chat format adds around every message.
+_MESSAGE_OVERHEAD = 4
+
+
+class TokenCounter:
+    """
+    Counts tokens for a model using its tiktoken encoding.
+
+    When tiktoken (or the model's encoding) is unavailable, it falls back to the usual
+    estimate of four characters per token.
+    """
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+        self.encoding = self._load_encoding(model)
+
+    @staticmethod
+    def _load_encoding(model: str):
+        if tiktoken is None:
+            return None
+        provider, model_name = model.split(":", 1)
+        try:
+            if provider == "openai":
+                try:
+                    return tiktoken.encoding_for_model(model_name)
+                except KeyError:
+                    pass
+            # Close enough for budgeting other providers' models as well.
+            return tiktoken.get_encoding("o200k_base")
+        except Exception as exc:  # e.g. the encoding file cannot be downloaded
+            logger.warning("No tiktoken encoding for %s, estimating: %s", model, exc)
+            return None
+
+    def count(self, text: str) -> int:
+        if self.encoding is None:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def count_message(self, message: LLMMessage) -> int:
+        return self.count(message["content"]) + _MESSAGE_OVERHEAD
+
+
+@functools.lru_cache(maxsize=None)
+def get_token_counter(model: str) -> TokenCounter:
+    """
+    Returns the shared TokenCounter for a model.
+    """
+    return TokenCounter(model)
+
+
+def get_context_budget(model: Optional[str]) -> int:
+    """
+    Returns the prompt token budget for a model from settings.LLM_CONTEXT_BUDGETS (the model's
+    own entry, else "default").
+    """
+    budgets = getattr(settings, "LLM_CONTEXT_BUDGETS", {})
+    return budgets.get(model, budgets.get("default", DEFAULT_CONTEXT_BUDGET))
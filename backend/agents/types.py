@@ -1,5 +1,5 @@
 from enum import Enum, auto
-from typing import Any, TypedDict
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
 
 
 class AgentType(str, Enum):
@@ -20,6 +20,7 @@ class AgentType(str, Enum):
     REACT_LLD = auto()
     JAVA_FILE_CODE_GENERATOR = auto()
     JAVA_LLD_HTML_GENERATOR = auto()
+    CONVERSATION_SUMMARY = auto()
 
 
 class LLMMessage(TypedDict):
@@ -35,6 +36,73 @@ class LLMMessage(TypedDict):
     content: str
 
 
+class LLMHistory(List[LLMMessage]):
+    """
+    The list of messages sent to an LLM for one request.
+
+    Attributes:
+        token_count: The number of prompt tokens the messages take up.
+        dropped_messages: How many older chat messages were left out to fit the token budget.
+        cache_breakpoints: Indexes of the messages that end a stable, reusable prefix. They
+            become prompt cache markers for providers that take explicit ones.
+    """
+
+    token_count: int = 0
+    dropped_messages: int = 0
+    cache_breakpoints: Tuple[int, ...] = ()
+
+
+class HistoryEntry(TypedDict):
+    """
+    One chat message converted for an agent's prompt.
+
+    Attributes:
+        role: "user" or "assistant".
+        content: The message content as sent to the LLM.
+        tokens: The number of tokens the message takes up for the agent's model.
+    """
+
+    role: str
+    content: str
+    tokens: int
+
+
+class ChatHistory(List[Any]):
+    """
+    The ChatMessages an agent processes, possibly preceded by messages that were already
+    converted for its prompt in an earlier turn.
+
+    Attributes:
+        prefix: The converted messages before these ones, oldest first, or None if the list
+            holds the whole conversation.
+        previous_document: In compact history mode, the document elements of the last user
+            message in prefix, which the next user message is diffed against.
+        summary: A summary of the conversation before the prefix, if older messages have
+            been summarized.
+    """
+
+    prefix: Optional[List[HistoryEntry]] = None
+    previous_document: Optional[Dict[str, Any]] = None
+    summary: Optional[str] = None
+
+
+class LLMUsage(TypedDict):
+    """
+    Token usage reported by the provider for one completion.
+
+    Attributes:
+        prompt_tokens: Input tokens, including cached ones.
+        completion_tokens: Output tokens.
+        cached_tokens: Input tokens read from the provider's prompt cache.
+        cache_write_tokens: Input tokens written to the provider's prompt cache.
+    """
+
+    prompt_tokens: int
+    completion_tokens: int
+    cached_tokens: int
+    cache_write_tokens: int
+
+
 class LLMResponse(TypedDict):
     """
     A structured response from the LLM, containing:
@@ -47,9 +115,15 @@ class LLMResponse(TypedDict):
             Use Any if the structure can vary, or a more specific type if known.
         response_message: The LLM's response message or summary.
         raw_response: The raw response from the LLM.
+        model: The model that produced the response.
+        model_tier: The routing tier that served the response, when the agent is routed.
+        usage: The provider's token usage; all zero when the response came from the cache.
     """
 
     updated_doc_element: Any
     response_message: str
     raw_response: str
     html: str
+    model: str
+    model_tier: int
+    usage: LLMUsage
@@ -0,0 +1,85 @@
+import hmac
+
+from django.http import Http404, HttpResponse, HttpResponseForbidden, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.views import View
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+
+from .diagrams import (
+    DiagramRenderError,
+    DiagramSourceError,
+    RendererUnavailableError,
+    decode_source,
+    diagram_digest,
+    get_renderer,
+)
+from .telemetry import REGISTRY, telemetry_config
+
+
+class MetricsView(View):
+    """
+    Exposes the LLM call metrics in the Prometheus text format. They reveal call volumes,
+    token spend and queue depths, so only the addresses in LLM_TELEMETRY
+    ["METRICS_ALLOWED_IPS"] and scrapers presenting METRICS_TOKEN as a bearer token may
+    read them.
+    """
+
+    def get(self, request, *args, **kwargs):
+        config = telemetry_config()
+        if not config["METRICS"]:
+            raise Http404
+        if not self._is_allowed(request, config):
+            return HttpResponseForbidden()
+        return HttpResponse(
+            REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+    @staticmethod
+    def _is_allowed(request, config) -> bool:
+        token = config["METRICS_TOKEN"]
+        scheme, _, presented = request.headers.get("Authorization", "").partition(" ")
+        if token and scheme.lower() == "bearer":
+            return hmac.compare_digest(presented.encode(), str(token).encode())
+        return request.META.get("REMOTE_ADDR") in config["METRICS_ALLOWED_IPS"]
+
+
+class DiagramView(APIView):
+    """
+    GET /diagrams/svg/<encoded>/
+    Renders a PlantUML diagram to SVG for an authenticated user. The source is in the URL,
+    encoded as for a PlantUML server, so the URL names the content: responses can be kept
+    by the browser for good and carry a strong ETag (the source's content hash) for
+    conditional requests.
+    """
+
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [SessionAuthentication, TokenAuthentication]
+
+    def get(self, request, encoded, *args, **kwargs):
+        try:
+            source = decode_source(encoded)
+        except DiagramSourceError as exc:
+            return HttpResponse(str(exc), status=400, content_type="text/plain")
+
+        etag = f'"{diagram_digest(source)}"'
+        if_none_match = request.headers.get("If-None-Match", "")
+        if etag in if_none_match.split(", ") or if_none_match.strip() == "*":
+            response = HttpResponseNotModified()
+        else:
+            try:
+                svg = get_renderer().render_svg(source)
+            except RendererUnavailableError as exc:
+                return HttpResponse(str(exc), status=503, content_type="text/plain")
+            except DiagramRenderError as exc:
+                return HttpResponse(str(exc), status=422, content_type="text/plain")
+            response = HttpResponse(svg, content_type="image/svg+xml")
+            # The SVG is opened as a document when downloaded; it has no business running
+            # anything.
+            response["Content-Security-Policy"] = "default-src 'none'; style-src 'unsafe-inline'"
+            response["X-Content-Type-Options"] = "nosniff"
+        response["ETag"] = etag
+        # Private: only the user's own browser may keep it, not shared caches.
+        patch_cache_control(response, private=True, max_age=31536000, immutable=True)
+        return response
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
+    "agents.middleware.LLMServerTimingMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -132,3 +133,205 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 CORS_ALLOW_ALL_ORIGINS = True
+
+
+# LLM settings
+
+# Identical completion requests (same model, messages and sampling parameters) are served
+# from an in-memory LRU backed by a SQLite file instead of calling the provider again.
+LLM_RESPONSE_CACHE = {
+    "ENABLED": True,
+    "PATH": BASE_DIR / "llm_cache.sqlite3",
+    "MAX_MEMORY_ENTRIES": 256,
+    "MAX_DISK_ENTRIES": 5000,
+    "TTL_SECONDS": 7 * 24 * 60 * 60,
+}
+
+# Connection pool shared by every LLMWrapper. HTTP/2 is used when the 'h2' package is
+# installed.
+LLM_CLIENT_POOL = {
+    "MAX_CONNECTIONS": 50,
+    "MAX_KEEPALIVE_CONNECTIONS": 20,
+    "KEEPALIVE_EXPIRY": 60.0,
+    "HTTP2": True,
+    "TIMEOUT": 600.0,
+}
+
+# Per-model request and token budgets for LLM calls. Model entries override "default";
+# concurrency adapts between MIN and MAX from observed 429s and latency.
+LLM_RATE_LIMITS = {
+    "default": {
+        "REQUESTS_PER_MINUTE": 500,
+        "TOKENS_PER_MINUTE": 200_000,
+        "MAX_CONCURRENCY": 16,
+        "MIN_CONCURRENCY": 1,
+        "LATENCY_TARGET": 90.0,
+        "RATE_LIMIT_COOLDOWN": 5.0,
+    },
+    "openai:o1-mini-2024-09-12": {
+        "REQUESTS_PER_MINUTE": 500,
+        "TOKENS_PER_MINUTE": 200_000,
+        "MAX_CONCURRENCY": 8,
+        "LATENCY_TARGET": 120.0,
+    },
+    "openai:gpt-4o-2024-08-06": {
+        "REQUESTS_PER_MINUTE": 500,
+        "TOKENS_PER_MINUTE": 30_000,
+        "MAX_CONCURRENCY": 12,
+        "LATENCY_TARGET": 60.0,
+    },
+}
+
+# Deadlines, retries and hedging for LLM calls. Model entries override "default". With
+# HEDGING on, a duplicate request is sent once a call outlives the model's observed p95.
+LLM_RESILIENCE = {
+    "default": {
+        "TIMEOUT": 300.0,
+        "DEADLINE": 600.0,
+        "MAX_ATTEMPTS": 3,
+        "BACKOFF_BASE": 1.0,
+        "BACKOFF_MAX": 30.0,
+        "HEDGING": False,
+        "HEDGE_QUANTILE": 0.95,
+        "HEDGE_MIN_SAMPLES": 20,
+    },
+    "openai:gpt-4o-2024-08-06": {
+        "TIMEOUT": 120.0,
+        "HEDGING": True,
+    },
+}
+
+# Model cascades per AgentType name. Requests try the TIERS models first and escalate to
+# the agent's own model when a response does not parse or misses fields; requests with more
+# than COMPLEX_HISTORY_MESSAGES messages or COMPLEX_PROMPT_CHARS prompt characters go
+# straight to the agent's own model.
+LLM_ROUTING = {
+    "FUNCTIONAL_REQUIREMENT": {
+        "TIERS": ["openai:gpt-4o-mini-2024-07-18"],
+        "COMPLEX_HISTORY_MESSAGES": 12,
+        "COMPLEX_PROMPT_CHARS": 60_000,
+    },
+    "NON_FUNCTIONAL_REQUIREMENT": {
+        "TIERS": ["openai:gpt-4o-mini-2024-07-18"],
+        "COMPLEX_HISTORY_MESSAGES": 12,
+        "COMPLEX_PROMPT_CHARS": 60_000,
+    },
+}
+
+# Prompt token budgets per model. Agents keep the system prompt and the latest message and
+# add older chat history newest-first until the budget is reached. Leave room for the
+# completion within the model's context window.
+LLM_CONTEXT_BUDGETS = {
+    "default": 100_000,
+    "openai:o1-mini-2024-09-12": 60_000,
+    "openai:o1-2024-12-17": 120_000,
+    "openai:gpt-4o-2024-08-06": 100_000,
+    "openai:gpt-4o-mini-2024-07-18": 100_000,
+    "anthropic:claude-3-5-sonnet-20241022": 150_000,
+}
+
+# How agents present earlier chat turns. "full" repeats the document in every user message;
+# "compact" sends it once, in the latest message, and earlier user messages carry only the
+# changes since the previous one.
+LLM_HISTORY_MODE = "compact"
+
+# What each Java file generation is sent: "sliced" sends only the class's LLD entry, the
+# signatures of the classes it references and its API paths and tables; "full" sends the
+# whole design document (one shared, provider-cacheable prefix, but N times the tokens).
+LLM_CODE_CONTEXT_MODE = "sliced"
+
+# The process-wide scheduler code generations submit their file tasks to. CONCURRENCY caps
+# the tasks running at once per model (model entries override "default"), across all
+# requests; requests take turns. Generations of at most INTERACTIVE_MAX_TASKS files go
+# before larger ones, but at most INTERACTIVE_BURST in a row while bulk work waits.
+LLM_SCHEDULER = {
+    "INTERACTIVE_MAX_TASKS": 4,
+    "INTERACTIVE_BURST": 4,
+    "CONCURRENCY": {
+        "default": 6,
+        "openai:gpt-4o-2024-08-06": 8,
+    },
+}
+
+# Class diagrams for the java LLD. COMPILER "local" builds the PlantUML from the structured
+# LLD in process (agents/plantuml.py); "llm" has JavaLLDHTMLGeneratorAgent write it, which
+# is also the fallback for LLDs the compiler rejects when LLM_FALLBACK is set.
+PLANTUML = {
+    "COMPILER": "local",
+    "LLM_FALLBACK": True,
+}
+
+# Server-side diagram rendering for GET /diagrams/svg/<encoded>/ (agents/diagrams.py).
+# BACKEND "jar" runs JAR with JAVA, so diagrams never leave the machine; it needs a JRE and
+# plantuml.jar (https://plantuml.com/download) at JAR, and answers 503 until they are there.
+# "server" uses a self-hosted PlantUML server at SERVER instead. Renders run MAX_WORKERS at
+# a time and are cached by content hash, persistently when CACHE_PATH is set.
+DIAGRAM_RENDER = {
+    "BACKEND": "jar",
+    "SERVER": None,
+    "JAR": BASE_DIR / "plantuml.jar",
+    "MAX_WORKERS": 2,
+    "CACHE_PATH": BASE_DIR / "diagram_cache.sqlite3",
+}
+
+# Build every agent, its LLM clients and prompt token counts when a WSGI/ASGI worker starts,
+# instead of on the first request that needs them.
+LLM_PRELOAD_AGENTS = True
+
+# Rolling summaries of long conversations. Once THRESHOLD_MESSAGES messages aren't covered
+# by the summary, a background job folds all but the KEEP_RECENT newest into it with MODEL;
+# agents then get the summary in place of those messages.
+LLM_SUMMARY = {
+    "ENABLED": False,
+    "MODEL": "openai:gpt-4o-mini-2024-07-18",
+    "THRESHOLD_MESSAGES": 40,
+    "KEEP_RECENT": 20,
+    "MAX_WORKERS": 2,
+}
+
+# Recovery from completions that don't parse or validate. The broken response and the error
+# are sent to MODEL for a corrected object; if that fails and REGENERATE is set, the
+# original request is sent again. Responses over MAX_CHARS skip the repair.
+LLM_REPAIR = {
+    "ENABLED": True,
+    "MODEL": "openai:gpt-4o-mini-2024-07-18",
+    "MAX_CHARS": 48_000,
+    "REGENERATE": True,
+}
+
+# Offline batch generation. BACKEND is "openai" (the OpenAI Batch API) or "local" (a
+# file-backed emulator under LOCAL_DIR that completes requests through the regular path).
+LLM_BATCH = {
+    "BACKEND": "openai",
+    "POLL_INTERVAL": 30.0,
+    "MAX_WAIT": 86_400.0,
+    "COMPLETION_WINDOW": "24h",
+    "LOCAL_DIR": "llm_batches",
+    "LOCAL_CONCURRENCY": 4,
+}
+
+# Local stand-in for the LLM providers, for benchmarks and offline work. With ENABLED set,
+# every LLMWrapper talks to it instead of the real providers. MODE is "synthetic",
+# "replay" (recorded responses from CASSETTE_DIR) or "record" (call the provider and save).
+LLM_FAKE = {
+    "ENABLED": False,
+    "MODE": "synthetic",
+    "CASSETTE_DIR": "llm_cassettes",
+    "REPLAY_MISS": "error",
+    "SEED": 0,
+    "LATENCY": {"DISTRIBUTION": "lognormal", "MEDIAN": 2.0, "SIGMA": 0.5},
+    "FAILURE_RATE": 0.0,
+    "RATE_LIMIT_RATE": 0.0,
+    "RETRY_AFTER": 1.0,
+    "SYNTHETIC_ITEMS": 5,
+}
+
+# LLM call telemetry. Metrics are served at /metrics/ in the Prometheus format, to
+# METRICS_ALLOWED_IPS and to scrapers sending "Authorization: Bearer <METRICS_TOKEN>"; with
+# SERVER_TIMING on, responses list their LLM calls in a Server-Timing header.
+LLM_TELEMETRY = {
+    "SERVER_TIMING": True,
+    "METRICS": True,
+    "METRICS_TOKEN": None,
+    "METRICS_ALLOWED_IPS": ["127.0.0.1", "::1"],
+}
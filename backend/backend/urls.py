@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path
 from django.urls import include
 from orchestratorV2 import urls
+from agents.views import DiagramView, MetricsView
 
 ...
 from django.urls import re_path
@@ -43,6 +44,8 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("orchestrator/", include("orchestratorV2.urls")),
     path("authenticate/", include("authenticate.urls")),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    path("diagrams/svg/<str:encoded>/", DiagramView.as_view(), name="diagram-svg"),
     path(
         "swagger<format>/", schema_view.without_ui(cache_timeout=0), name="schema-json"
     ),
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if getattr(settings, "LLM_PRELOAD_AGENTS", False):
+    from agents.agent_factory import AgentFactory
+
+    AgentFactory.preload()
@@ -0,0 +1,139 @@
+"""
+Benchmarks LLMWrapper's JSON extraction against the previous regex-based implementation.
+
+Recorded responses are read from the llm_raw_response column of the chat messages in a
+SQLite database (the development db.sqlite3 by default) and from any extra files given on
+the command line. --scale additionally builds larger responses by embedding several copies
+of each recorded object, to approximate the 100-300 KB API-contract and java LLD responses.
+
+Usage (from the backend directory):
+    python -m benchmarks.parse_response [--db PATH] [--scale N] [--repeat N] [FILE ...]
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+from agents.json_extractor import IncrementalJSONExtractor, extract_json_object
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def legacy_parse_response(raw_response: str):
+    """
+    The regex-based LLMWrapper.parse_response this benchmark compares against.
+    """
+    start_idx = raw_response.find("{")
+    end_idx = raw_response.rfind("}")
+    if start_idx == -1 or end_idx == -1:
+        raise ValueError("No valid JSON object found in model response")
+    json_str = raw_response[start_idx : end_idx + 1]
+
+    def escape_newlines(match):
+        escaped_str = match.group(1).replace("\n", "\\n").replace("\r", "\\r")
+        return f'"{escaped_str}"'
+
+    fixed_json_str = re.sub(r"\"(.*?)\"", escape_newlines, json_str, flags=re.DOTALL)
+    return json.loads(fixed_json_str)
+
+
+def streamed_parse_response(raw_response: str, chunk_size: int = 16):
+    """
+    Feeds the response to the extractor in small chunks, the way a token stream arrives.
+    """
+    extractor = IncrementalJSONExtractor()
+    for i in range(0, len(raw_response), chunk_size):
+        extractor.feed(raw_response[i : i + chunk_size])
+    return extractor.result()
+
+
+def load_recorded_responses(db_path: Path) -> List[Tuple[str, str]]:
+    if not db_path.exists():
+        return []
+    connection = sqlite3.connect(str(db_path))
+    try:
+        rows = connection.execute(
+            "SELECT id, llm_raw_response FROM orchestratorV2_chatmessage"
+            " WHERE llm_raw_response IS NOT NULL AND llm_raw_response != ''"
+        ).fetchall()
+    finally:
+        connection.close()
+    return [(f"message #{row_id}", raw) for row_id, raw in rows]
+
+
+def scale_response(raw_response: str, copies: int) -> str:
+    """
+    Builds a larger response in the same style (fenced, pretty-printed) from a recorded one.
+    """
+    body = json.dumps(extract_json_object(raw_response), indent=4)
+    items = ",\n".join([body] * copies)
+    return f'```json\n{{\n    "items": [\n{items}\n],\n    "communication": "scaled"\n}}\n```'
+
+
+def measure(parse: Callable[[str], object], raw_response: str, repeat: int):
+    """
+    Returns (best wall time in ms, peak traced memory in KB, result or exception).
+    """
+    try:
+        result = parse(raw_response)
+    except Exception as exc:  # the legacy parser fails on escaped quotes
+        return None, None, exc
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(raw_response)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    parse(raw_response)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best * 1000, peak / 1024, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("files", nargs="*", type=Path, help="extra raw responses")
+    parser.add_argument("--db", type=Path, default=BASE_DIR / "db.sqlite3")
+    parser.add_argument("--scale", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    responses = load_recorded_responses(args.db)
+    responses += [(path.name, path.read_text(encoding="utf-8")) for path in args.files]
+    if args.scale > 1:
+        responses += [
+            (f"{name} x{args.scale}", scale_response(raw, args.scale))
+            for name, raw in list(responses)
+        ]
+
+    header = f"{'response':<22}{'KB':>8}{'legacy ms':>12}{'new ms':>10}{'stream ms':>11}{'speedup':>9}{'legacy KB':>11}{'new KB':>9}  match"
+    print(header)
+    print("-" * len(header))
+    for name, raw in responses:
+        legacy_ms, legacy_kb, legacy_result = measure(
+            legacy_parse_response, raw, args.repeat
+        )
+        new_ms, new_kb, new_result = measure(extract_json_object, raw, args.repeat)
+        stream_ms, _, _ = measure(streamed_parse_response, raw, args.repeat)
+        if legacy_ms is None:
+            print(
+                f"{name:<22}{len(raw) / 1024:>8.1f}{'error':>12}{new_ms:>10.2f}"
+                f"{stream_ms:>11.2f}{'-':>9}{'-':>11}{new_kb:>9.0f}  legacy failed"
+            )
+            continue
+        print(
+            f"{name:<22}{len(raw) / 1024:>8.1f}{legacy_ms:>12.2f}{new_ms:>10.2f}"
+            f"{stream_ms:>11.2f}{legacy_ms / new_ms:>8.1f}x{legacy_kb:>11.0f}{new_kb:>9.0f}"
+            f"  {'yes' if legacy_result == new_result else 'no'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
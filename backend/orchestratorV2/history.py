@@ -0,0 +1,201 @@
+import logging
+from typing import Dict, List, Optional, Sequence
+
+from django.db import IntegrityError, transaction
+from django.db.models.fields.json import KeyTransform
+
+from agents.agents.agent_interface import (
+    DOCUMENT_KEYS_BY_AGENT,
+    AgentInterface,
+    get_history_mode,
+)
+from agents.types import AgentType, ChatHistory
+
+from .models import ChatMessage, Conversation, ConversationContext, VersionedDocument
+from .summaries import get_current_summary
+
+logger = logging.getLogger(__name__)
+
+# The ChatMessage columns agents read from the history.
+HISTORY_FIELDS = (
+    "id",
+    "creation_time",
+    "message",
+    "is_user_message",
+    "llm_raw_response",
+    "current_document_id",
+)
+
+
+def load_chat_history(
+    conversation: Conversation,
+    keys: Optional[Sequence[str]] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> List[ChatMessage]:
+    """
+    Loads a conversation's active messages for an agent in two queries, however long the
+    conversation is: one for the messages and one for the document versions they point at.
+
+    Only the given document elements are read from each version, extracted by the database
+    (JSON1 on SQLite, JSONB on PostgreSQL), so the full document_elements and html_document
+    columns are never loaded. Messages that point at the same version share one projection.
+
+    :param conversation: The conversation to load.
+    :param keys: The document element names the agent reads, or None for all of them.
+    :param after_id: Only load the messages after this one.
+    :param limit: Only load this many of the newest messages.
+    :return: The messages, oldest first. Each message's current_document is a partial
+        VersionedDocument whose document_elements hold only the requested keys (keys whose
+        value is null are left out).
+    """
+    queryset = ChatMessage.objects.filter(conversation=conversation, is_deleted=False)
+    if after_id is not None:
+        queryset = queryset.filter(pk__gt=after_id)
+    queryset = queryset.only(*HISTORY_FIELDS)
+    if limit is not None:
+        messages = list(queryset.order_by("-creation_time")[:limit])[::-1]
+    else:
+        messages = list(queryset.order_by("creation_time"))
+
+    version_ids = {m.current_document_id for m in messages if m.current_document_id}
+    versions = _load_versions(version_ids, keys)
+    for message in messages:
+        if message.current_document_id is not None:
+            message.current_document = versions[message.current_document_id]
+
+    logger.debug(
+        "Loaded %d messages and %d document versions for conversation %s",
+        len(messages),
+        len(versions),
+        conversation.pk,
+    )
+    return messages
+
+
+def _load_versions(
+    version_ids: set, keys: Optional[Sequence[str]]
+) -> Dict[int, VersionedDocument]:
+    """
+    Loads the projections of the given versions, by primary key.
+    """
+    if not version_ids:
+        return {}
+
+    queryset = VersionedDocument.objects.filter(pk__in=version_ids)
+    if keys is None:
+        return {version.pk: version for version in queryset.only("id", "document_elements")}
+
+    # Annotation names must be identifiers; element names contain spaces.
+    aliases = {f"element_{index}": key for index, key in enumerate(keys)}
+    queryset = queryset.only("id").annotate(
+        **{alias: KeyTransform(key, "document_elements") for alias, key in aliases.items()}
+    )
+    versions = {}
+    for version in queryset:
+        version.document_elements = {
+            key: getattr(version, alias)
+            for alias, key in aliases.items()
+            if getattr(version, alias) is not None
+        }
+        versions[version.pk] = version
+    return versions
+
+
+def load_agent_history(
+    conversation: Conversation, agent_type: AgentType, agent: AgentInterface
+) -> ChatHistory:
+    """
+    Loads the chat history for an agent, reusing the messages converted in earlier turns.
+
+    The conversation's ConversationContext for the agent type holds the converted messages
+    up to a cursor; only the messages after it are loaded. All but the latest of those are
+    converted and appended to the context, so a turn's cost grows with the new messages
+    rather than with the conversation. Messages covered by the conversation's summary
+    (settings.LLM_SUMMARY) are replaced by it.
+
+    :param conversation: The conversation to load.
+    :param agent_type: The type of the agent that will process the history.
+    :param agent: The agent, which converts the messages.
+    :return: The new messages, with the converted earlier messages as their prefix.
+    """
+    keys = DOCUMENT_KEYS_BY_AGENT.get(agent_type)
+    if not agent.uses_chat_history:
+        return ChatHistory(load_chat_history(conversation, keys, limit=1))
+
+    context = ConversationContext.objects.filter(
+        conversation=conversation, agent_type=agent_type.name
+    ).first()
+    if context is not None and not _is_current(context, agent):
+        context.entries = []
+        context.previous_document = None
+        context.last_message_id = None
+        context.message_count = 0
+    if context is None:
+        context = ConversationContext(
+            conversation=conversation, agent_type=agent_type.name
+        )
+
+    messages = load_chat_history(conversation, keys, after_id=context.last_message_id)
+    settled = messages[:-1]
+    if settled:
+        entries, previous_document = agent.build_history_entries(
+            settled, agent_type, context.previous_document
+        )
+        context.entries = context.entries + entries
+        context.previous_document = previous_document
+        context.last_message_id = settled[-1].pk
+        context.message_count += len(settled)
+        context.model = agent.llm.model
+        context.history_mode = get_history_mode()
+        _save_context(context)
+
+    history = ChatHistory(messages[-1:])
+    history.prefix = context.entries
+    history.previous_document = context.previous_document
+    # Context entries and the summary both count active messages from the start.
+    summary = get_current_summary(conversation.pk)
+    if summary is not None and summary.message_count <= len(context.entries):
+        history.prefix = context.entries[summary.message_count :]
+        history.summary = summary.summary
+    logger.debug(
+        "Conversation %s: %d converted messages reused, %d converted now",
+        conversation.pk,
+        len(context.entries) - len(settled),
+        len(settled),
+    )
+    return history
+
+
+def _is_current(context: ConversationContext, agent: AgentInterface) -> bool:
+    """
+    Checks that a stored context still matches the agent's settings and the conversation.
+    Counting the active messages up to the cursor catches soft-deletes the revert view's
+    invalidation missed.
+    """
+    if context.model != agent.llm.model or context.history_mode != get_history_mode():
+        return False
+    if context.last_message_id is None:
+        return context.message_count == 0
+    active = ChatMessage.objects.filter(
+        conversation_id=context.conversation_id,
+        is_deleted=False,
+        pk__lte=context.last_message_id,
+    ).count()
+    return active == context.message_count
+
+
+def _save_context(context: ConversationContext) -> None:
+    """
+    Saves a context. Losing a race with a concurrent turn only costs that turn's reuse, so
+    a conflicting insert is ignored.
+    """
+    try:
+        with transaction.atomic():
+            context.save()
+    except IntegrityError:
+        logger.info(
+            "Context of conversation %s for %s was saved concurrently",
+            context.conversation_id,
+            context.agent_type,
+        )
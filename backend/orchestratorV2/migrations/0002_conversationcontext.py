@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-16 22:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestratorV2', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationContext',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agent_type', models.CharField(max_length=255)),
+                ('model', models.CharField(max_length=255)),
+                ('history_mode', models.CharField(max_length=32)),
+                ('entries', models.JSONField(default=list)),
+                ('previous_document', models.JSONField(blank=True, null=True)),
+                ('last_message_id', models.BigIntegerField(blank=True, null=True)),
+                ('message_count', models.IntegerField(default=0)),
+                ('updated_time', models.DateTimeField(auto_now=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contexts', to='orchestratorV2.conversation')),
+            ],
+            options={
+                'verbose_name': 'Conversation context',
+                'verbose_name_plural': 'Conversation contexts',
+                'constraints': [models.UniqueConstraint(fields=('conversation', 'agent_type'), name='unique_conversation_context')],
+            },
+        ),
+    ]
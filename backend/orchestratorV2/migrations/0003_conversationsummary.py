@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-16 22:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestratorV2', '0002_conversationcontext'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.IntegerField()),
+                ('summary', models.TextField()),
+                ('model', models.CharField(max_length=255)),
+                ('last_message_id', models.BigIntegerField()),
+                ('message_count', models.IntegerField()),
+                ('creation_time', models.DateTimeField(auto_now_add=True)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summaries', to='orchestratorV2.conversation')),
+            ],
+            options={
+                'verbose_name': 'Conversation summary',
+                'verbose_name_plural': 'Conversation summaries',
+                'ordering': ['conversation', '-version'],
+                'constraints': [models.UniqueConstraint(fields=('conversation', 'version'), name='unique_conversation_summary_version')],
+            },
+        ),
+    ]
@@ -136,3 +136,72 @@ class ChatMessage(models.Model):
         verbose_name = "Chat Message"
         verbose_name_plural = "Chat Messages"
         ordering = ["creation_time"]
+
+
+class ConversationContext(models.Model):
+    """
+    The chat messages of a conversation already converted for one agent type's prompt, so
+    each turn only converts the messages added since. Entries cover the messages up to
+    last_message_id; the latest message is always converted afresh.
+
+    Invalidated when messages are soft-deleted (document revert), and rebuilt when the
+    agent's model or the history mode changes.
+    """
+
+    conversation = models.ForeignKey(
+        Conversation, on_delete=models.CASCADE, related_name="contexts"
+    )
+    agent_type = models.CharField(max_length=255)
+    model = models.CharField(max_length=255)
+    history_mode = models.CharField(max_length=32)
+    entries = models.JSONField(default=list)
+    previous_document = models.JSONField(null=True, blank=True)
+    last_message_id = models.BigIntegerField(null=True, blank=True)
+    message_count = models.IntegerField(default=0)
+    updated_time = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Context of conversation #{self.conversation_id} for {self.agent_type}"
+
+    class Meta:
+        verbose_name = "Conversation context"
+        verbose_name_plural = "Conversation contexts"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["conversation", "agent_type"],
+                name="unique_conversation_context",
+            )
+        ]
+
+
+class ConversationSummary(models.Model):
+    """
+    A summary of the older messages of a conversation, sent to agents in place of those
+    messages. Each re-summarization adds a new version; a version stays valid only while
+    the messages it covers (up to last_message_id) are all still active.
+    """
+
+    conversation = models.ForeignKey(
+        Conversation, on_delete=models.CASCADE, related_name="summaries"
+    )
+    version = models.IntegerField()
+    summary = models.TextField()
+    model = models.CharField(max_length=255)
+    last_message_id = models.BigIntegerField()
+    message_count = models.IntegerField()
+    creation_time = models.DateTimeField(auto_now_add=True)
+    is_deleted = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"Summary of conversation #{self.conversation_id} (Version {self.version})"
+
+    class Meta:
+        verbose_name = "Conversation summary"
+        verbose_name_plural = "Conversation summaries"
+        ordering = ["conversation", "-version"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["conversation", "version"],
+                name="unique_conversation_summary_version",
+            )
+        ]
@@ -0,0 +1,161 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional, Set
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from agents.agent_factory import AgentFactory
+from agents.agents.conversation_summary_agent import summary_config
+from agents.types import AgentType
+
+from .models import ChatMessage, ConversationSummary
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# Conversations with a summary job queued or running; one at a time per conversation.
+_pending: Set[int] = set()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=summary_config()["MAX_WORKERS"],
+                thread_name_prefix="conversation-summary",
+            )
+        return _executor
+
+
+def get_current_summary(conversation_id: int) -> Optional[ConversationSummary]:
+    """
+    Returns the latest summary of a conversation that still covers only active messages,
+    or None if summaries are off or there is none.
+    """
+    if not summary_config()["ENABLED"]:
+        return None
+    summary = (
+        ConversationSummary.objects.filter(
+            conversation_id=conversation_id, is_deleted=False
+        )
+        .order_by("-version")
+        .first()
+    )
+    if summary is None or not _is_valid(summary):
+        return None
+    return summary
+
+
+def _is_valid(summary: ConversationSummary) -> bool:
+    active = ChatMessage.objects.filter(
+        conversation_id=summary.conversation_id,
+        is_deleted=False,
+        pk__lte=summary.last_message_id,
+    ).count()
+    return active == summary.message_count
+
+
+def schedule_summary(conversation_id: int) -> None:
+    """
+    Queues a background check of whether the conversation needs a new summary, once the
+    current transaction commits. It never delays the caller.
+    """
+    if not summary_config()["ENABLED"]:
+        return
+
+    def submit():
+        with _executor_lock:
+            if conversation_id in _pending:
+                return
+            _pending.add(conversation_id)
+        _get_executor().submit(_run_summary, conversation_id)
+
+    transaction.on_commit(submit)
+
+
+def _run_summary(conversation_id: int) -> None:
+    try:
+        update_summary(conversation_id)
+    except Exception:
+        logger.exception("Summarizing conversation %s failed", conversation_id)
+    finally:
+        with _executor_lock:
+            _pending.discard(conversation_id)
+        connection.close()
+
+
+def update_summary(conversation_id: int) -> Optional[ConversationSummary]:
+    """
+    Summarizes the older messages of a conversation if enough of them aren't covered by
+    the current summary, keeping the most recent KEEP_RECENT messages out of it.
+
+    :return: The new summary version, or None if none was needed.
+    """
+    config = summary_config()
+    current = get_current_summary(conversation_id)
+    queryset = ChatMessage.objects.filter(
+        conversation_id=conversation_id, is_deleted=False
+    )
+    if current is not None:
+        queryset = queryset.filter(pk__gt=current.last_message_id)
+    messages = list(
+        queryset.only("id", "message", "is_user_message").order_by("creation_time")
+    )
+    if len(messages) <= config["THRESHOLD_MESSAGES"]:
+        return None
+
+    covered = messages[: len(messages) - config["KEEP_RECENT"]]
+    agent = AgentFactory.create_agent(AgentType.CONVERSATION_SUMMARY)
+    response = agent.process(
+        _summary_messages(covered), current.summary if current is not None else None
+    )
+
+    version = (
+        ConversationSummary.objects.filter(conversation_id=conversation_id).aggregate(
+            Max("version")
+        )["version__max"]
+        or 0
+    ) + 1
+    summary = ConversationSummary.objects.create(
+        conversation_id=conversation_id,
+        version=version,
+        summary=response["response_message"],
+        model=agent.llm.model,
+        last_message_id=covered[-1].pk,
+        message_count=(current.message_count if current is not None else 0)
+        + len(covered),
+    )
+    logger.info(
+        "Summarized %d messages of conversation %s (version %d)",
+        summary.message_count,
+        conversation_id,
+        version,
+    )
+    return summary
+
+
+def _summary_messages(messages: List[ChatMessage]):
+    # Agent messages are their communication; the document is left out.
+    return [
+        {"from": "user" if m.is_user_message else "agent", "message": m.message or ""}
+        for m in messages
+    ]
+
+
+def invalidate_summaries(conversation_ids: Iterable[int], first_deleted_id: int) -> None:
+    """
+    Retires the summary versions that cover a deleted message, so the previous version
+    applies again and the next turn's summary job recomputes the rest.
+
+    :param conversation_ids: The conversations whose messages were deleted.
+    :param first_deleted_id: The oldest deleted message.
+    """
+    ConversationSummary.objects.filter(
+        conversation_id__in=conversation_ids,
+        last_message_id__gte=first_deleted_id,
+        is_deleted=False,
+    ).update(is_deleted=True)
@@ -5,6 +5,8 @@ from .views import (
     DocumentRetrieveView,
     DocumentRevertView,
     ChatMessageListCreateView,
+    AsyncChatMessageCreateView,
+    ChatMessageStreamView,
 )
 
 urlpatterns = [
@@ -31,4 +33,16 @@ urlpatterns = [
         name="chat-messages-list-create",
     ),
     #   => POST /chat/messages/ => user sends msg => AI => new doc version
+    path(
+        "chat/messages/async/",
+        AsyncChatMessageCreateView.as_view(),
+        name="chat-messages-async-create",
+    ),
+    #   => POST /chat/messages/async/ => same as above, served on the ASGI event loop
+    path(
+        "chat/messages/stream/",
+        ChatMessageStreamView.as_view(),
+        name="chat-messages-stream",
+    ),
+    #   => POST /chat/messages/stream/ => same as above, streamed as Server-Sent Events
 ]
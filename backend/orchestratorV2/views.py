@@ -1,25 +1,41 @@
 import json
 import logging
+import queue
+import threading
 
 from agents.agent_factory import AgentFactory
+from agents.scheduler import Priority, generation_priority
+from agents.streaming import TokenStream
 from agents.types import AgentType, LLMResponse
 
-from django.db import transaction
-from django.db.models import Max
+from asgiref.sync import sync_to_async
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 
-from rest_framework import status, generics
+from rest_framework import exceptions, status, generics
 from rest_framework.authentication import SessionAuthentication, TokenAuthentication
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from .history import load_agent_history
+from .summaries import invalidate_summaries, schedule_summary
 from .models import (
     Document,
     VersionedDocument,
     ChatMessage,
     Conversation,
+    ConversationContext,
     DocumentElement,
     DocumentSchema,
 )
@@ -240,12 +256,20 @@ class DocumentRevertView(APIView):
         messages_qs = ChatMessage.objects.filter(
             current_document=current_vdoc, is_deleted=False
         )
+        # Read the affected conversations first; the update empties messages_qs.
+        conversation_ids = list(
+            messages_qs.values_list("conversation_id", flat=True).distinct()
+        )
+        first_deleted_id = messages_qs.aggregate(Min("pk"))["pk__min"]
         messages_qs.update(is_deleted=True)
 
+        # The stored LLM contexts and summaries of those conversations may include the
+        # deleted messages.
+        ConversationContext.objects.filter(conversation_id__in=conversation_ids).delete()
+        if first_deleted_id is not None:
+            invalidate_summaries(conversation_ids, first_deleted_id)
+
         # 3) Potentially delete any conversations with no remaining active messages
-        conversation_ids = messages_qs.values_list(
-            "conversation_id", flat=True
-        ).distinct()
         for convo_id in conversation_ids:
             if convo_id:
                 convo = Conversation.objects.filter(pk=convo_id).first()
@@ -286,81 +310,11 @@ class DocumentRevertView(APIView):
 ##############################################################################
 
 
-class ChatMessageListCreateView(generics.ListCreateAPIView):
+class ChatMessageCreateMixin:
     """
-    A single endpoint for listing AND creating chat messages.
-
-    GET /chat/messages/?conversation_id=<int>
-      => Paginates all ChatMessages for that conversation, returning them as JSON.
-
-    POST /chat/messages/
-      => Create a user ChatMessage, call LLM, create an agent response message,
-         update the Document with a new VersionedDocument. Returns both messages.
+    Shared steps of creating a chat turn, used by both the sync and the async chat views.
     """
 
-    permission_classes = [IsAuthenticated]
-    serializer_class = ChatMessageSerializer  # used for listing
-    pagination_class = PageNumberPagination
-    authentication_classes = [SessionAuthentication, TokenAuthentication]
-
-    def get_queryset(self):
-        """
-        Restrict the queryset to a single conversation if conversation_id is provided.
-        Also exclude any 'is_deleted' messages if you use soft delete.
-        """
-        conversation_id = self.request.query_params.get("conversation_id")
-        document_id = self.request.query_params.get("document_id")
-        qs = ChatMessage.objects.all()
-
-        # Example: exclude soft-deleted messages if your model has is_deleted
-        qs = qs.filter(is_deleted=False)
-
-        if conversation_id:
-            qs = qs.filter(
-                document_id=document_id,
-                conversation_id=conversation_id,
-            )
-        else:
-            # Possibly return an empty queryset, or all messages, or raise an error
-            qs = qs.none()
-        return qs.order_by("creation_time")
-
-    def list(self, request, *args, **kwargs):
-        """
-        Overriding list() is optional if you just want the default DRF pagination response.
-        By default, ListCreateAPIView calls get_queryset() + self.get_serializer().
-        """
-        return super().list(request, *args, **kwargs)
-
-    def create(self, request, *args, **kwargs):
-        """
-        Override create() to implement:
-          1) Validate user data (using ChatMessageCreateSerializer)
-          2) Create a user ChatMessage
-          3) Call the LLM => update doc => create agent message
-          4) Return both messages in the response
-        """
-        serializer = ChatMessageCreateSerializer(data=request.data)
-        if not serializer.is_valid():
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-        validated = serializer.validated_data
-
-        # 1) Create the user chat message
-        user_msg = self._create_user_chat_message(request, validated)
-
-        # 2) Process with LLM => new version => agent msg
-        agent_msg = self._process_llm_response(user_msg, request)
-
-        # 3) Return both messages in the response
-        # We can use ChatMessageSerializer or just build the response dict
-        user_msg_data = ChatMessageSerializer(user_msg).data
-        agent_msg_data = ChatMessageSerializer(agent_msg).data
-        return Response(
-            {"user_message": user_msg_data, "agent_message": agent_msg_data},
-            status=status.HTTP_201_CREATED,
-        )
-
     def _create_user_chat_message(self, request, data):
         """
         Creates the user's ChatMessage and (if needed) the Conversation.
@@ -394,29 +348,29 @@ class ChatMessageListCreateView(generics.ListCreateAPIView):
         )
         return user_msg
 
-    @transaction.atomic
-    def _process_llm_response(self, user_msg, request):
+    def _load_llm_inputs(self, user_msg):
         """
-        - Gather chat history
-        - Identify doc element => call LLM
-        - Create new doc version => create agent ChatMessage
+        Returns the active chat history of the user's conversation, the DocumentElement the
+        message is addressed to and the agent for it. The history only carries the document
+        elements the agent reads, and reuses the messages converted in earlier turns.
         """
-        # 1) Chat history
-        conversation = user_msg.conversation
-        chat_history = ChatMessage.objects.filter(
-            conversation=conversation, is_deleted=False
-        ).order_by("creation_time")
-
-        # 2) LLM call
         document_element = get_object_or_404(DocumentElement, pk=user_msg.to_id)
-        llm_response = AgentFactory.create_agent(
-            AgentType[document_element.type]
-        ).process(chat_history)
-        logger.debug("LLM response: %s", llm_response)
+        agent_type = AgentType[document_element.type]
+        agent = AgentFactory.create_agent(agent_type)
+        chat_history = load_agent_history(user_msg.conversation, agent_type, agent)
+        return chat_history, document_element, agent
 
-        # 3) Create new doc version & agent message
+    @transaction.atomic
+    def _save_llm_response(self, llm_response, user_msg, document_element, request):
+        """
+        Commits the new VersionedDocument and agent ChatMessage for an LLM response.
+        """
         return self._handle_llm_response(
-            llm_response, user_msg.document, document_element, request, conversation
+            llm_response,
+            user_msg.document,
+            document_element,
+            request,
+            user_msg.conversation,
         )
 
     def _handle_llm_response(
@@ -484,4 +438,262 @@ class ChatMessageListCreateView(generics.ListCreateAPIView):
         logger.info(
             f"Created agent message #{agent_msg.id}, doc {document.id}, new version {new_version_number}"
         )
+        schedule_summary(conversation.pk)
         return agent_msg
+
+
+class ChatMessageListCreateView(ChatMessageCreateMixin, generics.ListCreateAPIView):
+    """
+    A single endpoint for listing AND creating chat messages.
+
+    GET /chat/messages/?conversation_id=<int>
+      => Paginates all ChatMessages for that conversation, returning them as JSON.
+
+    POST /chat/messages/
+      => Create a user ChatMessage, call LLM, create an agent response message,
+         update the Document with a new VersionedDocument. Returns both messages.
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = ChatMessageSerializer  # used for listing
+    pagination_class = PageNumberPagination
+    authentication_classes = [SessionAuthentication, TokenAuthentication]
+
+    def get_queryset(self):
+        """
+        Restrict the queryset to a single conversation if conversation_id is provided.
+        Also exclude any 'is_deleted' messages if you use soft delete.
+        """
+        conversation_id = self.request.query_params.get("conversation_id")
+        document_id = self.request.query_params.get("document_id")
+        qs = ChatMessage.objects.all()
+
+        # Example: exclude soft-deleted messages if your model has is_deleted
+        qs = qs.filter(is_deleted=False)
+
+        if conversation_id:
+            qs = qs.filter(
+                document_id=document_id,
+                conversation_id=conversation_id,
+            )
+        else:
+            # Possibly return an empty queryset, or all messages, or raise an error
+            qs = qs.none()
+        return qs.order_by("creation_time")
+
+    def list(self, request, *args, **kwargs):
+        """
+        Overriding list() is optional if you just want the default DRF pagination response.
+        By default, ListCreateAPIView calls get_queryset() + self.get_serializer().
+        """
+        return super().list(request, *args, **kwargs)
+
+    def create(self, request, *args, **kwargs):
+        """
+        Override create() to implement:
+          1) Validate user data (using ChatMessageCreateSerializer)
+          2) Create a user ChatMessage
+          3) Call the LLM => update doc => create agent message
+          4) Return both messages in the response
+        """
+        serializer = ChatMessageCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        validated = serializer.validated_data
+
+        # 1) Create the user chat message
+        user_msg = self._create_user_chat_message(request, validated)
+
+        # 2) Process with LLM => new version => agent msg
+        agent_msg = self._process_llm_response(user_msg, request)
+
+        # 3) Return both messages in the response
+        # We can use ChatMessageSerializer or just build the response dict
+        user_msg_data = ChatMessageSerializer(user_msg).data
+        agent_msg_data = ChatMessageSerializer(agent_msg).data
+        return Response(
+            {"user_message": user_msg_data, "agent_message": agent_msg_data},
+            status=status.HTTP_201_CREATED,
+        )
+
+    @transaction.atomic
+    def _process_llm_response(self, user_msg, request):
+        """
+        - Gather chat history
+        - Identify doc element => call LLM
+        - Create new doc version => create agent ChatMessage
+        """
+        # 1) Chat history
+        conversation = user_msg.conversation
+        chat_history, document_element, agent = self._load_llm_inputs(user_msg)
+
+        # 2) LLM call; a user is waiting on it
+        with generation_priority(Priority.INTERACTIVE):
+            llm_response = agent.process(chat_history)
+        logger.debug("LLM response: %s", llm_response)
+
+        # 3) Create new doc version & agent message
+        return self._handle_llm_response(
+            llm_response, user_msg.document, document_element, request, conversation
+        )
+
+
+##############################################################################
+#                           5) AsyncChatMessageView                          #
+##############################################################################
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncChatMessageCreateView(ChatMessageCreateMixin, View):
+    """
+    POST /chat/messages/async/
+      => Same contract as POST /chat/messages/, but the LLM call is awaited on the event
+         loop when served through backend/asgi.py, so an in-flight completion does not
+         hold a worker thread. Database work runs through sync_to_async.
+    """
+
+    authentication_classes = [SessionAuthentication, TokenAuthentication]
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            drf_request = await sync_to_async(self._authenticate)(request)
+        except exceptions.APIException as exc:
+            return JsonResponse({"detail": str(exc.detail)}, status=exc.status_code)
+        if drf_request is None:
+            return JsonResponse(
+                {"detail": "Authentication credentials were not provided."},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+
+        serializer = ChatMessageCreateSerializer(data=drf_request.data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        validated = serializer.validated_data
+
+        # 1) Create the user chat message
+        user_msg = await sync_to_async(self._create_user_chat_message)(
+            drf_request, validated
+        )
+
+        # 2) Process with LLM => new version => agent msg
+        chat_history, document_element, agent = await sync_to_async(
+            self._load_llm_inputs
+        )(user_msg)
+        with generation_priority(Priority.INTERACTIVE):
+            llm_response = await agent.aprocess(chat_history)
+        logger.debug("LLM response: %s", llm_response)
+
+        agent_msg = await sync_to_async(self._save_llm_response)(
+            llm_response, user_msg, document_element, drf_request
+        )
+
+        # 3) Return both messages in the response
+        return JsonResponse(
+            {
+                "user_message": ChatMessageSerializer(user_msg).data,
+                "agent_message": ChatMessageSerializer(agent_msg).data,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+    def _authenticate(self, request):
+        """
+        Authenticates the request the same way the DRF views do and parses its body.
+
+        :return: The DRF Request, or None if no credentials were supplied.
+        """
+        drf_request = Request(
+            request,
+            parsers=[JSONParser()],
+            authenticators=[auth() for auth in self.authentication_classes],
+        )
+        if not drf_request.user or not drf_request.user.is_authenticated:
+            return None
+        # Parse the body while we are still in a sync context.
+        drf_request.data
+        return drf_request
+
+
+##############################################################################
+#                          6) ChatMessageStreamView                          #
+##############################################################################
+
+
+class ChatMessageStreamView(ChatMessageCreateMixin, APIView):
+    """
+    POST /chat/messages/stream/
+      => Same request body as POST /chat/messages/, answered as Server-Sent Events:
+           event: token  data: {"text": <str>}     (agent communication, as it is generated)
+           event: reset  data: {}                  (discard the text received so far; the
+                                                    response was replaced and its text follows)
+           event: done   data: {"user_message": {...}, "agent_message": {...}}
+           event: error  data: {"error": <str>}
+         "done" is only sent once the new VersionedDocument has been committed.
+    """
+
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [SessionAuthentication, TokenAuthentication]
+
+    def post(self, request, *args, **kwargs):
+        serializer = ChatMessageCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user_msg = self._create_user_chat_message(request, serializer.validated_data)
+
+        events = queue.Queue()
+        worker = threading.Thread(
+            target=self._run_agent,
+            args=(user_msg, request, events),
+            daemon=True,
+        )
+        worker.start()
+
+        response = StreamingHttpResponse(
+            self._stream_events(events), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def _run_agent(self, user_msg, request, events):
+        """
+        Runs the agent on a worker thread, pushing (event, data) tuples onto the queue.
+        """
+        try:
+            chat_history, document_element, agent = self._load_llm_inputs(user_msg)
+            stream = TokenStream(
+                on_token=lambda text: events.put(("token", {"text": text})),
+                on_reset=lambda: events.put(("reset", {})),
+            )
+            with generation_priority(Priority.INTERACTIVE):
+                llm_response = agent.process_streaming(chat_history, on_token=stream)
+            logger.debug("LLM response: %s", llm_response)
+
+            agent_msg = self._save_llm_response(
+                llm_response, user_msg, document_element, request
+            )
+            events.put(
+                (
+                    "done",
+                    {
+                        "user_message": ChatMessageSerializer(user_msg).data,
+                        "agent_message": ChatMessageSerializer(agent_msg).data,
+                    },
+                )
+            )
+        except Exception as e:
+            logger.error("Error streaming chat response: %s", e)
+            events.put(("error", {"error": "Failed to generate a response"}))
+        finally:
+            connection.close()
+
+    def _stream_events(self, events):
+        while True:
+            event, data = events.get()
+            payload = json.dumps(data, cls=DjangoJSONEncoder)
+            yield f"event: {event}\ndata: {payload}\n\n"
+            if event not in ("token", "reset"):
+                return
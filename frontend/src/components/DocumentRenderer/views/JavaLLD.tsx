@@ -3,15 +3,61 @@ import { JsonView, allExpanded, darkStyles } from "react-json-view-lite";
 import plantumlEncoder from 'plantuml-encoder';
 import { Maximize2, Minimize2, Download, ZoomIn, ZoomOut, RotateCcw } from 'lucide-react';
 import type { ViewProps } from './types';
+import { API_BASE_URL } from '@/apis/config';
+import { getAuthHeaders } from '@/utils/auth';
 
-export const JavaLLD: React.FC<ViewProps> = ({ data }) => {
+export const JavaLLD: React.FC<ViewProps> = ({ data, html }) => {
   const [isFullscreen, setIsFullscreen] = useState(false);
   const [zoom, setZoom] = useState(100);
   const containerRef = useRef<HTMLDivElement>(null);
   const imageRef = useRef<HTMLImageElement>(null);
   
-  // If data is a string, assume it's PlantUML content
-  const umlContent = typeof data === 'string' ? data : null;
+  // The diagram is kept next to the structured LLD; older documents stored the PlantUML
+  // content as the element itself.
+  const umlContent = html || (typeof data === 'string' ? data : null);
+  const [diagramUrl, setDiagramUrl] = useState<string | null>(null);
+  const [diagramError, setDiagramError] = useState<string | null>(null);
+
+  // The backend renders the diagram and caches it by content. The endpoint needs the auth
+  // token, which an <img> can't send, so the SVG is fetched and shown from a blob URL.
+  useEffect(() => {
+    if (!umlContent) {
+      return;
+    }
+    let objectUrl: string | null = null;
+    let cancelled = false;
+    const { Authorization } = getAuthHeaders() as Record<string, string>;
+    setDiagramError(null);
+    fetch(`${API_BASE_URL}/diagrams/svg/${plantumlEncoder.encode(umlContent)}/`, {
+      headers: { Authorization },
+      mode: 'cors',
+    })
+      .then(async (response) => {
+        if (!response.ok) {
+          throw new Error((await response.text()) || response.statusText);
+        }
+        return response.blob();
+      })
+      .then((blob) => {
+        if (!cancelled) {
+          objectUrl = URL.createObjectURL(blob);
+          setDiagramUrl(objectUrl);
+        }
+      })
+      .catch((error: Error) => {
+        if (!cancelled) {
+          setDiagramUrl(null);
+          setDiagramError(error.message);
+        }
+      });
+
+    return () => {
+      cancelled = true;
+      if (objectUrl) {
+        URL.revokeObjectURL(objectUrl);
+      }
+    };
+  }, [umlContent]);
 
   useEffect(() => {
     const calculateInitialZoom = () => {
@@ -43,7 +89,7 @@ export const JavaLLD: React.FC<ViewProps> = ({ data }) => {
         image.onload = null;
       }
     };
-  }, [isFullscreen]);
+  }, [isFullscreen, diagramUrl]);
 
   if (!umlContent) {
     return (
@@ -54,13 +100,12 @@ export const JavaLLD: React.FC<ViewProps> = ({ data }) => {
     );
   }
 
-  // Encode the PlantUML content
-  const encodedUml = plantumlEncoder.encode(umlContent);
-  const plantUmlUrl = `https://www.plantuml.com/plantuml/svg/${encodedUml}`;
-
   const handleDownload = () => {
+    if (!diagramUrl) {
+      return;
+    }
     const link = document.createElement('a');
-    link.href = plantUmlUrl;
+    link.href = diagramUrl;
     link.download = 'uml-diagram.svg';
     document.body.appendChild(link);
     link.click();
@@ -178,18 +223,23 @@ export const JavaLLD: React.FC<ViewProps> = ({ data }) => {
               lineHeight: 0 // Add this to prevent extra space from line height
             }}
           >
-            <img 
-              ref={imageRef}
-              src={plantUmlUrl} 
-              alt="UML Diagram"
-              className="max-w-none" // Prevent image from being constrained
-              style={{
-                display: 'block', // Remove default image spacing
-                height: 'auto' // Ensure proper aspect ratio
-              }}
-              loading="lazy"
-              onLoad={handleZoomReset}
-            />
+            {diagramUrl ? (
+              <img 
+                ref={imageRef}
+                src={diagramUrl} 
+                alt="UML Diagram"
+                className="max-w-none" // Prevent image from being constrained
+                style={{
+                  display: 'block', // Remove default image spacing
+                  height: 'auto' // Ensure proper aspect ratio
+                }}
+                onLoad={handleZoomReset}
+              />
+            ) : (
+              <p className="text-sm text-gray-500" style={{ lineHeight: 'normal' }}>
+                {diagramError ? `Could not render the diagram: ${diagramError}` : 'Rendering diagram...'}
+              </p>
+            )}
           </div>
         </div>
       </div>